@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class App01Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app01'
+
+    def ready(self):
+        # 注册信号处理（列表 COUNT 缓存失效等）
+        from app01 import signals  # noqa: F401
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from app01.utils.approval_import import (
+    claim_import_job, run_import_job, DEFAULT_CHUNK_SIZE, DEFAULT_JOB_LEASE_SECONDS,
+)
+import time
+
+
+class Command(BaseCommand):
+    help = '领取网页上传的设备审批导入任务（ApprovalImportJob）并执行，进度写回任务表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='没有任务时的轮询间隔（秒），默认 2'
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=DEFAULT_JOB_LEASE_SECONDS,
+            help=f'任务的租期（秒），每批处理完续期，超时未续期会被重新领取，默认 {DEFAULT_JOB_LEASE_SECONDS}'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'每批校验/写入的行数，默认 {DEFAULT_CHUNK_SIZE}'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='处理完当前等待的任务后退出，而不是持续运行'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("设备审批导入worker启动")
+        finished_count = 0
+        failed_count = 0
+        try:
+            while True:
+                job = claim_import_job(options['lease'])
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                report = run_import_job(job, options['lease'], options['chunk_size'])
+                if report is None:
+                    failed_count += 1
+                    self.stdout.write(self.style.WARNING(f"❌ 导入任务 {job.id} 未完成，详见日志"))
+                else:
+                    finished_count += 1
+                    self.stdout.write(f"导入任务 {job.id}：{report.message}")
+        except KeyboardInterrupt:
+            self.stdout.write("收到中断信号，停止领取新任务")
+
+        self.stdout.write(self.style.SUCCESS(f"\n设备审批导入结束！\n完成: {finished_count} 个\n未完成: {failed_count} 个"))
@@ -0,0 +1,120 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from app01 import models
+from app01.utils.callback_ingest import callback_updatable
+from app01.utils.duid_resolver import duid_queryset
+from app01.utils.kea_dispatch import claimable_outbox, due_retries, manual_retries
+from app01.utils.search_index import search_ids
+import json
+import re
+
+# 用于回放查询的示例值，执行计划只与查询结构有关，不依赖具体取值
+SAMPLE_MAC = '00:11:22:33:44:55'
+SAMPLE_IPV6 = '240c:c901:a:a:1010:11:2233:4455'
+
+# 需要审计的热点查询：(来源, 查询)，查询由视图/工具函数实际使用的查询构造函数生成，参数为当前时间
+HOT_QUERIES = [
+    ('duid_resolver.duid_queryset: 按MAC批量查设备/已审批记录DUID',
+     lambda now: duid_queryset([SAMPLE_MAC, '00:11:22:33:44:56'])),
+    ('PrettyNum.objects.by_mac: 按MAC查IPv6记录（kea_callback 兜底、设备下线、审批）',
+     lambda now: models.PrettyNum.objects.by_mac(SAMPLE_MAC)[:1]),
+    ('callback_ingest.callback_updatable: kea_callback 按record_id条件写回',
+     lambda now: callback_updatable(1, True)),
+    ('kea_dispatch.due_retries: 到期的重试记录',
+     lambda now: due_retries(now)[:100]),
+    ('kea_dispatch.manual_retries: retry_ipv6_send 的失败/重试中记录',
+     lambda now: manual_retries(now)),
+    ('pretty.pretty_list: 按地址等值查询',
+     lambda now: models.PrettyNum.objects.by_address(SAMPLE_IPV6)),
+    ('PrettyNum: 按地址原文等值查询（包括无法解析的地址）',
+     lambda now: models.PrettyNum.objects.filter(ipv6_address=SAMPLE_IPV6)[:1]),
+    ('device.device_list: MAC/DUID子串搜索',
+     lambda now: models.Device.objects.filter(id__in=search_ids('device', '00:11:22'))),
+    ('device_approval.device_approval_list: 超过8个字符的MAC/DUID子串搜索',
+     lambda now: models.DeviceApproval.objects.filter(id__in=search_ids('approval', SAMPLE_MAC))),
+    ('pretty.pretty_list: IPv6地址/接口ID子串搜索',
+     lambda now: models.PrettyNum.objects.filter(id__in=search_ids('pretty', '2233:4455', fields=('ipv6', 'iid')))),
+    ('pretty.pretty_list: 按部门/楼栋筛选',
+     lambda now: models.PrettyNum.objects.in_slot(department=1, building=1)),
+    ('kea_dispatch.claimable_outbox: 领取待发送队列记录',
+     lambda now: claimable_outbox(now)[:100]),
+]
+
+
+def _mysql_full_scans(plan_text):
+    """ MySQL: JSON 执行计划中 access_type 为 ALL 的表 """
+    found = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get('access_type') == 'ALL':
+                found.append(node.get('table_name', '?'))
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(plan_text))
+    return found
+
+
+def _sqlite_full_scans(plan_text):
+    """ SQLite: 不带索引的 SCAN 步骤 """
+    return re.findall(r'SCAN (?:TABLE )?(\w+)\b(?! USING)', plan_text)
+
+
+def _postgresql_full_scans(plan_text):
+    """ PostgreSQL: Seq Scan 节点 """
+    return re.findall(r'Seq Scan on (\w+)', plan_text)
+
+
+class Command(BaseCommand):
+    help = '用 EXPLAIN 回放热点ORM查询，检查是否存在全表扫描'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-scan',
+            action='store_true',
+            help='发现全表扫描时以非零状态退出，便于在CI中拦截索引回退'
+        )
+        parser.add_argument(
+            '--show-plan',
+            action='store_true',
+            help='输出每条查询的完整执行计划'
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor == 'mysql':
+            explain_options, detect = {'format': 'json'}, _mysql_full_scans
+        elif vendor == 'sqlite':
+            explain_options, detect = {}, _sqlite_full_scans
+        elif vendor == 'postgresql':
+            explain_options, detect = {}, _postgresql_full_scans
+        else:
+            raise CommandError(f"暂不支持的数据库类型: {vendor}")
+
+        self.stdout.write(f"数据库类型: {vendor}，共 {len(HOT_QUERIES)} 条热点查询")
+
+        now = timezone.now()
+        flagged = []
+        for source, build_queryset in HOT_QUERIES:
+            plan = build_queryset(now).explain(**explain_options)
+            scans = detect(plan)
+            if scans:
+                flagged.append(source)
+                self.stdout.write(self.style.WARNING(f"❌ {source}: 全表扫描 {', '.join(sorted(set(scans)))}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✅ {source}"))
+            if options['show_plan']:
+                self.stdout.write(plan)
+
+        if flagged:
+            message = f"{len(flagged)} 条查询存在全表扫描（数据量很小时优化器也可能选择全表扫描，请在真实数据量下复核）"
+            if options['fail_on_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("所有热点查询均命中索引"))
@@ -0,0 +1,98 @@
+from contextlib import redirect_stdout
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from app01 import models
+from app01.utils import address_allocator, kea_client
+from app01.utils.bench import isolated_database
+from app01.utils.bulk_approval import approve_approvals
+from app01.utils.kea_stub import KeaStubServer
+import io
+import time
+
+# 验收目标：批量同意 10000 条审批（含发送到KEA）的总耗时
+TARGET_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = '测试批量同意设备审批的耗时：批量写入 + 发送队列经本地KEA桩服务发送（独立测试数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=10000,
+            help='审批记录数，默认 10000'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每个事务处理的审批数，默认 1000'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='发送worker的并发数，默认 8'
+        )
+        parser.add_argument(
+            '--delay',
+            type=float,
+            default=0.005,
+            help='桩服务每个请求的模拟处理耗时（秒），默认 0.005'
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        with isolated_database():
+            ids = self._create_approvals(count)
+            # 分配表按槽位从测试数据库加载
+            address_allocator._allocator = None
+
+            server = KeaStubServer(delay=options['delay'])
+            server.start()
+            old_client = kea_client._client
+            kea_client._client = kea_client.KeaClient(base_url=server.base_url, pool_size=options['concurrency'])
+            try:
+                with redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    result = approve_approvals(ids, chunk_size=options['chunk_size'])
+                    approved = time.perf_counter()
+                    call_command('kea_outbox_worker', once=True, concurrency=options['concurrency'], batch_send=True)
+                    sent = time.perf_counter()
+            finally:
+                kea_client._client = old_client
+                server.shutdown()
+                server.server_close()
+                address_allocator._allocator = None
+
+            self.stdout.write(
+                f"同意 {result.done} 条（跳过 {len(result.skipped)} 条）: 写入耗时 {approved - start:.2f}s，"
+                f"发送耗时 {sent - approved:.2f}s，KEA请求 {server.request_count} 次，"
+                f"设备 {models.Device.objects.count()} 条"
+            )
+            total = sent - start
+            if total < TARGET_SECONDS:
+                self.stdout.write(self.style.SUCCESS(f"总耗时 {total:.2f}s，低于 {TARGET_SECONDS}s"))
+            else:
+                self.stdout.write(self.style.WARNING(f"总耗时 {total:.2f}s，超过 {TARGET_SECONDS}s"))
+
+    def _create_approvals(self, count):
+        """ 生成待审批记录，部门/楼栋/业务类型轮流取值，返回审批ID """
+        # 地址中部门编号只有4位，测试库中部门ID为 1-15
+        models.Department.objects.bulk_create([models.Department(title=f"部门{i}") for i in range(1, 16)])
+        department_ids = list(models.Department.objects.filter(id__lt=16).values_list('id', flat=True))
+        objs = [
+            models.DeviceApproval(
+                user=f"user{i}",
+                department_id=department_ids[i % len(department_ids)],
+                building=i % 10 + 1,
+                business_type=i % 3 + 1,
+                duid=f"00:03:00:01:{i >> 24 & 0xFF:02X}:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}",
+                mac_address=f"02:00:{i >> 24 & 0xFF:02X}:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}",
+                status=2,
+            )
+            for i in range(count)
+        ]
+        models.DeviceApproval.objects.bulk_create(objs, batch_size=1000)
+        return list(models.DeviceApproval.objects.filter(status=2).values_list('id', flat=True))
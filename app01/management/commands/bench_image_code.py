@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from app01.utils import captcha_pool
+from app01.utils.bench import isolated_database
+import time
+
+
+class Command(BaseCommand):
+    help = '对比 /image/code/ 的每秒请求数：现场生成、验证码池突发（池已填满）、验证码池持续（后台线程同时生成）（独立测试数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=500,
+            help='每种方式的请求数，默认 500'
+        )
+        parser.add_argument(
+            '--pool-size',
+            type=int,
+            default=captcha_pool.DEFAULT_POOL_SIZE,
+            help=f'验证码池大小，默认 {captcha_pool.DEFAULT_POOL_SIZE}'
+        )
+
+    def handle(self, *args, **options):
+        count, pool_size = options['count'], options['pool_size']
+        with isolated_database():
+            client = Client()
+            client.get('/image/code/')  # 预热：导入模块、建立会话
+
+            with override_settings(CAPTCHA_POOL_SIZE=0):
+                self._report("现场生成（无池）", count, self._run(client, count))
+
+            old_pool = captcha_pool._pool
+            try:
+                # 突发：请求到来前池已被填满，请求只取出现成的PNG
+                captcha_pool._pool = pool = captcha_pool.CaptchaPool(pool_size, autostart=False)
+                pool.fill()
+                with override_settings(CAPTCHA_POOL_SIZE=pool_size):
+                    self._report(f"验证码池突发({pool_size})", pool_size, self._run(client, pool_size), pool)
+
+                # 持续：后台线程边生成边被取走，与请求共用CPU
+                captcha_pool._pool = pool = captcha_pool.CaptchaPool(pool_size)
+                pool.fill()
+                with override_settings(CAPTCHA_POOL_SIZE=pool_size):
+                    self._report(f"验证码池持续({pool_size})", count, self._run(client, count), pool)
+            finally:
+                captcha_pool._pool = old_pool
+
+    def _run(self, client, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            response = client.get('/image/code/')
+            assert response.status_code == 200
+        return time.perf_counter() - start
+
+    def _report(self, label, count, seconds, pool=None):
+        extra = ""
+        if pool:
+            stats = pool.snapshot()
+            extra = f"，命中 {stats['hits']}，未命中 {stats['misses']}"
+        self.stdout.write(self.style.SUCCESS(f"{label:<20} {count} 次: 耗时 {seconds:.2f}s，{count / seconds:,.0f} 次/秒{extra}"))
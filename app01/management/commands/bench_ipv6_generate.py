@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from app01.utils import ipv6_generator
+from app01.utils.ipv6_generator import generate_ipv6, generate_ipv6_batch
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = '对比逐个生成(generate_ipv6)与批量生成(generate_ipv6_batch)IPv6地址的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10000, 100000, 1000000],
+            help='测试的数据行数，默认 10000 100000 1000000'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=20250829,
+            help='随机数种子，保证每次生成相同的测试数据'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        backend = 'numpy' if ipv6_generator.np is not None else '纯Python'
+        self.stdout.write(f"批量生成后端: {backend}")
+
+        for size in options['sizes']:
+            departments = [rng.randint(0, 15) for _ in range(size)]
+            buildings = [rng.randint(1, 30) for _ in range(size)]
+            services = [rng.randint(1, 5) for _ in range(size)]
+            macs = [':'.join(f"{rng.randint(0, 255):02X}" for _ in range(6)) for _ in range(size)]
+
+            start = time.perf_counter()
+            scalar_result = [generate_ipv6(d, b, s, m) for d, b, s, m in zip(departments, buildings, services, macs)]
+            scalar_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batch_result = generate_ipv6_batch(departments, buildings, services, macs)
+            batch_seconds = time.perf_counter() - start
+
+            if batch_result != scalar_result:
+                self.stdout.write(self.style.ERROR(f"❌ {size} 行: 批量结果与逐个生成的结果不一致"))
+                continue
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{size:>9} 行: 逐个 {scalar_seconds:.3f}s ({size / scalar_seconds:,.0f} 行/秒), "
+                    f"批量 {batch_seconds:.3f}s ({size / batch_seconds:,.0f} 行/秒), "
+                    f"加速 {scalar_seconds / batch_seconds:.1f}x，输出一致"
+                )
+            )
@@ -0,0 +1,111 @@
+from contextlib import redirect_stdout
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from app01 import models
+from app01.utils import kea_client
+from app01.utils.bench import isolated_database
+from app01.utils.ipv6_generator import generate_ipv6_batch
+from app01.utils.kea_stub import KeaStubServer
+from app01.views import pretty
+import io
+import json
+import time
+
+CALLBACK_URL = 'http://127.0.0.1:8000/api/kea/callback/'
+
+
+class Command(BaseCommand):
+    help = '对比逐条发送与批量发送KEA请求的端到端吞吐量（本地桩服务 + 独立测试数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=1000,
+            help='测试的记录数，默认 1000'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='批量模式每个请求携带的记录数，默认 100'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='发送worker的并发数，默认 8'
+        )
+        parser.add_argument(
+            '--delay',
+            type=float,
+            default=0.005,
+            help='桩服务每个请求的模拟处理耗时（秒），默认 0.005'
+        )
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            for batch_send in (False, True):
+                with override_settings(KEA_API_BATCH_SIZE=options['batch_size']):
+                    stats = self._run(options['count'], batch_send, options['concurrency'], options['delay'])
+                mode = f"批量({options['batch_size']}条/请求)" if batch_send else "逐条"
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{mode:<16} {stats['count']} 条: 耗时 {stats['seconds']:.2f}s，"
+                        f"吞吐量 {stats['count'] / stats['seconds']:,.0f} 条/秒，"
+                        f"KEA请求 {stats['kea_requests']} 次，回调 {stats['callbacks']} 次，"
+                        f"绑定成功 {stats['bound']} 条"
+                    )
+                )
+
+    def _create_records(self, count):
+        """ 生成测试用的IPv6记录 """
+        models.KeaOutbox.objects.all().delete()
+        models.PrettyNum.objects.all().delete()
+        macs = [f"02:00:{i >> 24 & 0xFF:02X}:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}"
+                for i in range(count)]
+        addresses = generate_ipv6_batch(1, 1, 1, macs)
+        objs = []
+        for mac, address in zip(macs, addresses):
+            obj = models.PrettyNum(ipv6_address=address, mac_address=mac, send_status='pending')
+            obj.sync_ipv6_int()
+            objs.append(obj)
+        return models.PrettyNum.objects.bulk_create(objs, batch_size=500)
+
+    def _run(self, count, batch_send, concurrency, delay):
+        """ 入队 -> worker发送 -> 桩服务回调 -> kea_callback 写回，返回统计 """
+        records = self._create_records(count)
+        server = KeaStubServer(delay=delay)
+        server.start()
+        old_client = kea_client._client
+        kea_client._client = kea_client.KeaClient(base_url=server.base_url, pool_size=concurrency)
+        factory = RequestFactory()
+        callbacks = 0
+        try:
+            # 视图与工具函数中的调试 print 不计入输出
+            with redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                models.KeaOutbox.objects.bulk_create(
+                    [models.KeaOutbox(pretty=obj, callback_url=CALLBACK_URL) for obj in records], batch_size=500
+                )
+                call_command('kea_outbox_worker', once=True, concurrency=concurrency, batch_send=batch_send)
+                while not server.callbacks.empty():
+                    _, body = server.callbacks.get_nowait()
+                    request = factory.post('/api/kea/callback/', data=json.dumps(body),
+                                           content_type='application/json')
+                    pretty.kea_callback(request)
+                    callbacks += 1
+                seconds = time.perf_counter() - start
+        finally:
+            kea_client._client = old_client
+            server.shutdown()
+            server.server_close()
+
+        return {
+            'count': count,
+            'seconds': seconds,
+            'kea_requests': server.request_count,
+            'callbacks': callbacks,
+            'bound': models.PrettyNum.objects.filter(send_status='bound').count(),
+        }
@@ -0,0 +1,126 @@
+from contextlib import redirect_stdout
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from app01 import models
+from app01.utils import callback_ingest
+from app01.utils.bench import isolated_database
+from app01.utils.ipv6_generator import generate_ipv6_batch
+import io
+import json
+import time
+
+CALLBACK_PATH = '/api/kea/callback/'
+
+
+class Command(BaseCommand):
+    help = '回调压测：逐条回调、KEA重试投递的重复回调的每秒处理数、每秒提交数和每条回调的SQL条数（独立测试数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=5000,
+            help='回调条数，默认 5000'
+        )
+        parser.add_argument(
+            '--ingest-mode',
+            choices=[callback_ingest.INGEST_SYNC, callback_ingest.INGEST_BUFFERED],
+            default=callback_ingest.INGEST_SYNC,
+            help='回调写入方式（KEA_CALLBACK_INGEST_MODE），默认 sync'
+        )
+        parser.add_argument(
+            '--spool-dir',
+            default='',
+            help='buffered 模式的落盘目录，默认不落盘'
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        mode = options['ingest_mode']
+        buffer = None
+        if mode == callback_ingest.INGEST_BUFFERED:
+            buffer = callback_ingest.CallbackBuffer(
+                flush_interval_ms=getattr(settings, 'KEA_CALLBACK_FLUSH_INTERVAL_MS',
+                                          callback_ingest.DEFAULT_FLUSH_INTERVAL_MS),
+                flush_size=getattr(settings, 'KEA_CALLBACK_FLUSH_SIZE', callback_ingest.DEFAULT_FLUSH_SIZE),
+                spool_dir=options['spool_dir'],
+            )
+        old_buffer, callback_ingest._buffer = callback_ingest._buffer, buffer
+
+        try:
+            with isolated_database(), override_settings(KEA_CALLBACK_INGEST_MODE=mode):
+                self._run(count, buffer)
+        finally:
+            callback_ingest._buffer = old_buffer
+
+    def _run(self, count, buffer):
+        ids = self._create_records(count)
+        # KEA 重试投递同一回调时带相同的 Idempotency-Key（没有该请求头的回调不去重）
+        bodies = [(json.dumps({'success': 1, 'message': '绑定成功', 'record_id': str(record_id)}), f"bench-{record_id}")
+                  for record_id in ids]
+        client = Client()
+
+        # 自动提交下每条写语句就是一次提交；buffered 模式的提交在写回线程中，按写回次数统计
+        writes = []
+
+        def count_writes(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE')):
+                writes.append(1)
+            return execute(sql, params, many, context)
+
+        with redirect_stdout(io.StringIO()):
+            with CaptureQueriesContext(connection) as queries:
+                self._post(client, bodies[0])
+            first_queries = len(queries)
+            with CaptureQueriesContext(connection) as queries:
+                self._post(client, bodies[0])
+            duplicate_queries = len(queries)
+            if buffer:
+                buffer.flush()
+                base_commits = buffer.stats.commits
+
+            rates = []
+            for label, sample in (('首次回调', bodies[1:]), ('重复回调', bodies)):
+                writes.clear()
+                start = time.perf_counter()
+                with connection.execute_wrapper(count_writes):
+                    for body in sample:
+                        self._post(client, body)
+                accepted = time.perf_counter() - start
+                if buffer:
+                    # 等待写回线程把缓冲区写完，计入总耗时
+                    while buffer.snapshot()['pending'] or buffer.stats.flushed < buffer.stats.enqueued:
+                        time.sleep(0.01)
+                    commits, base_commits = buffer.stats.commits - base_commits, buffer.stats.commits
+                else:
+                    commits = len(writes)
+                rates.append((label, len(sample), accepted, time.perf_counter() - start, commits))
+
+        for label, total, accepted, seconds, commits in rates:
+            self.stdout.write(self.style.SUCCESS(
+                f"{label}: {total} 条，接收 {total / accepted:,.0f} 条/秒，写完耗时 {seconds:.2f}s"
+                f"（{total / seconds:,.0f} 条/秒），提交 {commits} 次（{commits / seconds:,.1f} 次/秒）"
+            ))
+        self.stdout.write(
+            f"每条回调SQL: 首次 {first_queries} 条，重复 {duplicate_queries} 条；"
+            f"绑定成功 {models.PrettyNum.objects.filter(send_status='bound').count()} 条"
+        )
+
+    def _post(self, client, body):
+        data, idempotency_key = body
+        client.post(CALLBACK_PATH, data=data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=idempotency_key)
+
+    def _create_records(self, count):
+        """ 生成待绑定的IPv6记录，返回记录ID """
+        macs = [f"02:00:{i >> 24 & 0xFF:02X}:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}"
+                for i in range(count)]
+        objs = []
+        for mac, address in zip(macs, generate_ipv6_batch(1, 1, 1, macs)):
+            obj = models.PrettyNum(ipv6_address=address, mac_address=mac, send_status='pending')
+            obj.sync_ipv6_int()
+            objs.append(obj)
+        models.PrettyNum.objects.bulk_create(objs, batch_size=500)
+        return list(models.PrettyNum.objects.order_by('id').values_list('id', flat=True))
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from app01 import models
+from app01.utils.bench import isolated_database
+from app01.utils.ipv6_generator import generate_ipv6_batch
+from app01.utils.pagination import Pagination
+import time
+
+
+class Command(BaseCommand):
+    help = '对比 OFFSET 分页与游标分页翻到深页时的耗时（独立测试数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page',
+            type=int,
+            default=5000,
+            help='测试的页码，默认 5000'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=10,
+            help='每页条数，默认 10'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='每种方式重复次数，取中位数，默认 20'
+        )
+
+    def handle(self, *args, **options):
+        page, page_size = options['page'], options['page_size']
+        row_count = page * page_size + page_size
+        with isolated_database():
+            self.stdout.write(f"生成 {row_count} 条测试记录...")
+            self._create_records(row_count)
+            queryset = models.PrettyNum.objects.all()
+            factory = RequestFactory()
+
+            offset_request = factory.get('/pretty/list/', {'page': page})
+            offset_seconds, offset_queries, offset_rows = self._measure(
+                lambda: Pagination(offset_request, queryset, page_size=page_size), options['repeat'])
+
+            # 游标模式下第 page 页的链接来自第 page-1 页的“下一页”，这里直接用第 page-1 页最后一条记录生成令牌
+            last_of_previous = queryset.order_by('id')[(page - 1) * page_size - 1]
+            first_page = Pagination(factory.get('/pretty/list/'), queryset, page_size=page_size,
+                                    mode="cursor", ordering=("id",))
+            token = first_page._cursor_url("next", last_of_previous, page).split('cursor=')[1]
+            cursor_request = factory.get('/pretty/list/?cursor=' + token)
+            cursor_seconds, cursor_queries, cursor_rows = self._measure(
+                lambda: Pagination(cursor_request, queryset, page_size=page_size, mode="cursor", ordering=("id",)),
+                options['repeat'])
+
+        if [obj.id for obj in offset_rows] != [obj.id for obj in cursor_rows]:
+            self.stdout.write(self.style.ERROR("❌ 两种分页方式返回的记录不一致"))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"第 {page} 页（每页 {page_size} 条，共 {row_count} 条）："
+                f"\nOFFSET 分页: {offset_seconds * 1000:.2f} ms，{offset_queries} 条SQL"
+                f"\n游标分页:    {cursor_seconds * 1000:.2f} ms，{cursor_queries} 条SQL（COUNT 已缓存）"
+                f"\n加速 {offset_seconds / cursor_seconds:.1f}x，返回记录一致"
+            )
+        )
+
+    def _create_records(self, count):
+        macs = [f"02:00:{i >> 24 & 0xFF:02X}:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}"
+                for i in range(count)]
+        objs = []
+        for mac, address in zip(macs, generate_ipv6_batch(1, 1, 1, macs)):
+            obj = models.PrettyNum(ipv6_address=address, mac_address=mac)
+            obj.sync_ipv6_int()
+            objs.append(obj)
+        models.PrettyNum.objects.bulk_create(objs, batch_size=1000)
+
+    def _measure(self, build, repeat):
+        """ 构造分页对象并取出当前页数据，返回 (耗时中位数, 最后一次的SQL条数, 当前页记录) """
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                page_object = build()
+                rows = list(page_object.page_queryset)
+                timings.append(time.perf_counter() - start)
+        timings.sort()
+        return timings[len(timings) // 2], len(queries), rows
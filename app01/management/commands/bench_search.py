@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from app01 import models
+from app01.utils.bench import isolated_database
+from app01.utils.search_index import rebuild_index, search_ids
+import time
+
+# 典型的部分输入：MAC片段（带/不带冒号）、DUID片段
+SAMPLE_QUERIES = ['00:1A:2B', '3c4d5e', '00:01:00:01:5F', 'AB:CD']
+
+
+def synthetic_mac(i):
+    """ 第 i 台设备的MAC，乘以大奇数打散，避免相邻记录前缀相同 """
+    value = (i * 2654435761) & 0xFFFFFFFFFF
+    return "02:" + ":".join(f"{value >> shift & 0xFF:02X}" for shift in (32, 24, 16, 8, 0))
+
+
+class Command(BaseCommand):
+    help = '对比 LIKE 子串搜索与搜索索引在大量设备记录上的耗时（独立测试数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=1000000,
+            help='生成的设备数量，默认 1000000'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='每条搜索重复次数，取中位数，默认 5'
+        )
+        parser.add_argument(
+            '--query',
+            action='append',
+            help='搜索内容，可重复指定，默认使用内置的MAC/DUID片段'
+        )
+
+    def handle(self, *args, **options):
+        queries = options['query'] or SAMPLE_QUERIES
+        with isolated_database():
+            self.stdout.write(f"生成 {options['count']} 条设备记录...")
+            self._create_devices(options['count'])
+
+            start = time.perf_counter()
+            rebuild_index('device', models.Device.objects.all())
+            self.stdout.write(f"建立搜索索引耗时 {time.perf_counter() - start:.1f}s，"
+                              f"n-gram {models.SearchGram.objects.count()} 行")
+
+            for query in queries:
+                like_queryset = models.Device.objects.filter(Q(duid__contains=query) | Q(mac_address__contains=query))
+                index_queryset = models.Device.objects.filter(id__in=search_ids('device', query))
+                like_seconds, like_ids = self._measure(like_queryset, options['repeat'])
+                index_seconds, index_ids = self._measure(index_queryset, options['repeat'])
+
+                # 索引按规范化后的值匹配（忽略大小写和分隔符），结果应包含 LIKE 的全部结果
+                style = self.style.SUCCESS if like_ids <= index_ids else self.style.ERROR
+                self.stdout.write(style(
+                    f"{query!r}: LIKE {like_seconds * 1000:.1f} ms（{len(like_ids)} 条）"
+                    f" / 索引 {index_seconds * 1000:.1f} ms（{len(index_ids)} 条）"
+                    f"，加速 {like_seconds / index_seconds:.1f}x"
+                ))
+
+    def _create_devices(self, count, batch_size=10000):
+        department = models.Department.objects.create(title="基准测试")
+        now = timezone.now()
+        for begin in range(0, count, batch_size):
+            objs = []
+            for i in range(begin, min(begin + batch_size, count)):
+                mac = synthetic_mac(i)
+                # DUID-LLT：类型(1) + 硬件类型(1) + 时间 + MAC
+                duid = f"00:01:00:01:{i >> 24 & 0xFF:02X}:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}:{mac}"
+                objs.append(models.Device(user=f"u{i}", create_time=now, department=department,
+                                          duid=duid, mac_address=mac))
+            models.Device.objects.bulk_create(objs)
+
+    def _measure(self, queryset, repeat):
+        """ 执行列表页的 COUNT + 首页查询，返回 (耗时中位数, 全部匹配的ID集合) """
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            queryset.count()
+            list(queryset.order_by('-create_time')[:10])
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return timings[len(timings) // 2], set(queryset.values_list('id', flat=True))
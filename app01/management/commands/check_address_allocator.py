@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from app01 import models
+from app01.utils.address_allocator import AddressAllocator
+from app01.utils.ipv6_generator import u64_from_db
+import time
+
+
+class Command(BaseCommand):
+    help = '加载全部槽位的IPv6地址分配表并与数据表核对，输出槽位/地址数量和加载耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-error',
+            action='store_true',
+            help='发现分配表无法覆盖的记录时以非零状态退出'
+        )
+
+    def handle(self, *args, **options):
+        # 数据表中出现过的槽位（前缀 + 接口ID高16位）
+        slots = set()
+        for prefix, interface_id in models.PrettyNum.objects.filter(
+            ipv6_prefix__isnull=False
+        ).values_list('ipv6_prefix', 'ipv6_iid').iterator():
+            slots.add((u64_from_db(prefix), u64_from_db(interface_id) >> 48))
+
+        allocator = AddressAllocator()
+        start = time.perf_counter()
+        for slot in sorted(slots):
+            allocator.verify(slot)
+        seconds = time.perf_counter() - start
+        stats = allocator.stats()
+        self.stdout.write(
+            f"已加载 {stats['slots']} 个槽位、{stats['addresses']} 个地址，耗时 {seconds * 1000:.1f} ms"
+        )
+
+        # 地址格式错误的记录没有整数列，分配表看不到，只能靠数据库唯一约束之外的人工处理
+        invalid = models.PrettyNum.objects.filter(ipv6_prefix__isnull=True)
+        invalid_count = invalid.count()
+        if not invalid_count:
+            self.stdout.write(self.style.SUCCESS("✅ 所有记录均已纳入地址分配表"))
+            return
+
+        for obj in invalid.order_by('id')[:20]:
+            self.stdout.write(self.style.WARNING(f"❌ 记录 #{obj.id} 的地址无法解析: {obj.ipv6_address!r}"))
+        message = f"{invalid_count} 条记录的地址无法解析，未纳入地址分配表"
+        if options['fail_on_error']:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message))
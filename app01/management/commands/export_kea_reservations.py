@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from app01.utils.binding_export import export_bindings, FORMATS, DEFAULT_CHUNK_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = '流式导出全部IPv6绑定为 KEA reservations（JSON）或 CSV，用于与DHCP服务器核对'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='json',
+            help='导出格式，默认 json'
+        )
+        parser.add_argument(
+            '--output',
+            help='输出文件路径，默认输出到标准输出'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'每次查询读取的记录数，默认 {DEFAULT_CHUNK_SIZE}'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        chunks = export_bindings(options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for piece in chunks:
+                self.stdout.write(piece, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for piece in chunks:
+                    f.write(piece)
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"✅ 导出完成: {options['output']}，耗时 {time.perf_counter() - start:.1f}s"))
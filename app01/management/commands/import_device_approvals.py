@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from app01.utils.approval_import import import_approvals, iter_rows, detect_format, DEFAULT_CHUNK_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = '从 CSV/JSONL 文件批量导入设备审批（列：user, department, building, business_type, duid, mac）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV 或 JSONL 文件路径')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='文件格式，默认按扩展名判断'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'每批校验/写入的行数，默认 {DEFAULT_CHUNK_SIZE}'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or detect_format(options['path'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        start = time.perf_counter()
+
+        def progress(report):
+            if not report.finished:
+                self.stdout.write(
+                    f"已处理 {report.total} 行：新增 {report.created}，格式错误 {report.invalid}，重复 {report.duplicate}"
+                    f"（{report.total / (time.perf_counter() - start):.0f} 行/秒）"
+                )
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                report = import_approvals(iter_rows(f, fmt), chunk_size=options['chunk_size'], progress=progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in sorted(report.errors):
+            self.stdout.write(self.style.WARNING(f"第{error[0]}行: {error[1]}"))
+        self.stdout.write(self.style.SUCCESS(f"✅ {report.message}，耗时 {time.perf_counter() - start:.1f}s"))
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from app01.utils.ipv6_api import get_batch_size
+from app01.utils.duid_resolver import duid_scope, in_current_scope
+from app01.utils.kea_dispatch import (
+    claim_outbox_batch, send_outbox_entry, finish_outbox_entry, DEFAULT_LEASE_SECONDS,
+    group_outbox_entries, send_outbox_group, finish_outbox_group, lease_batch_limit,
+)
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _send_in_thread(entry):
+    """ 线程池中执行的发送任务，结束时关闭本线程可能打开的数据库连接 """
+    try:
+        return send_outbox_entry(entry)
+    finally:
+        connections.close_all()
+
+
+def _send_group_in_thread(entries):
+    """ 线程池中执行的批量发送任务 """
+    try:
+        return send_outbox_group(entries)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = '从KEA发送队列（KeaOutbox）领取记录并并发发送到KEA API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='并发发送的线程数，默认 8'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='每次从队列领取的记录数，默认 100'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='队列为空时的轮询间隔（秒），默认 1'
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=DEFAULT_LEASE_SECONDS,
+            help=f'领取记录的租期（秒），超时未完成会被重新领取，默认 {DEFAULT_LEASE_SECONDS}'
+        )
+        parser.add_argument(
+            '--batch-send',
+            action='store_true',
+            help='使用KEA批量接口，每个请求携带多条记录（条数见 settings.KEA_API_BATCH_SIZE）'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='清空当前队列后退出，而不是持续运行'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        send_batch_size = get_batch_size() if options['batch_send'] else 0
+        # 每批记录数不超过租期内能发送完的数量，避免租期过后被其他 worker 重新领取、重复发送
+        batch_size = min(options['batch_size'], lease_batch_limit(options['lease'], concurrency, send_batch_size or 1))
+        self.stdout.write(
+            f"KEA发送队列worker启动，并发数 {concurrency}，每批 {batch_size} 条"
+            + (f"，批量接口每个请求 {send_batch_size} 条" if send_batch_size else "")
+        )
+
+        delivered_count = 0
+        failed_count = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    entries = claim_outbox_batch(batch_size, options['lease'])
+                    if not entries:
+                        if options['once']:
+                            break
+                        time.sleep(options['interval'])
+                        continue
+
+                    if send_batch_size:
+                        delivered, failed = self._send_groups(executor, entries, send_batch_size)
+                        delivered_count += delivered
+                        failed_count += failed
+                        continue
+
+                    # 并发发送，发送结果在主线程中写回数据库；入队时没有DUID的记录先一次查询补齐
+                    with duid_scope() as resolver:
+                        resolver.resolve_many(entry.pretty.mac_address for entry in entries if not entry.duid)
+                        results = list(executor.map(in_current_scope(_send_in_thread), entries))
+
+                    for entry, result in zip(entries, results):
+                        try:
+                            delivered = finish_outbox_entry(entry, result)
+                        except Exception as e:
+                            logger.error(f"写回KEA发送结果失败，队列ID {entry.id}: {e}", exc_info=True)
+                            failed_count += 1
+                            continue
+                        if delivered:
+                            delivered_count += 1
+                        else:
+                            failed_count += 1
+                            self.stdout.write(
+                                self.style.WARNING(f"❌ 记录ID {entry.pretty_id} 发送失败: {entry.last_error}")
+                            )
+            except KeyboardInterrupt:
+                self.stdout.write("收到中断信号，停止领取新记录")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nKEA发送队列处理结束！"
+                f"\n已送达: {delivered_count} 个"
+                f"\n失败: {failed_count} 个（已置为发送失败，由 kea_retry_scheduler 按退避策略自动重试）"
+            )
+        )
+
+    def _send_groups(self, executor, entries, send_batch_size):
+        """ 批量模式：按 callback_url 分组打包发送，返回 (送达条数, 失败条数) """
+        delivered_count = 0
+        failed_count = 0
+        groups = group_outbox_entries(entries, send_batch_size)
+        for group, result in zip(groups, executor.map(_send_group_in_thread, groups)):
+            try:
+                delivered = finish_outbox_group(group, result)
+            except Exception as e:
+                logger.error(f"写回KEA批量发送结果失败，队列ID {[entry.id for entry in group]}: {e}", exc_info=True)
+                failed_count += len(group)
+                continue
+            if delivered:
+                delivered_count += len(group)
+            else:
+                failed_count += len(group)
+                self.stdout.write(
+                    self.style.WARNING(f"❌ {len(group)} 条记录批量发送失败: {group[0].last_error}")
+                )
+        return delivered_count, failed_count
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from app01.utils.ipv6_api import send_to_kea_api
+from app01.utils.duid_resolver import duid_scope, in_current_scope
+from app01.utils.kea_client import get_kea_client
+from app01.utils.kea_dispatch import (
+    claim_due_retries, apply_retry_result, save_retry_results, lease_batch_limit, stored_callback_urls,
+    DEFAULT_LEASE_SECONDS,
+)
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _send_in_thread(ipv6_obj, callback_url):
+    """ 线程池中执行的重试发送，结束时关闭本线程可能打开的数据库连接 """
+    try:
+        return send_to_kea_api(ipv6_obj.id, ipv6_obj.ipv6_address, ipv6_obj.mac_address, callback_url=callback_url)
+    except Exception as e:
+        logger.error(f"自动重试IPv6发送异常: {e}", exc_info=True)
+        return {'success': False, 'status_code': None, 'response_data': None, 'error': f"重试异常: {str(e)}"}
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = '常驻运行，按 next_retry_time 自动重试发送失败的IPv6记录（指数退避，可多进程同时运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='并发发送的线程数，默认 4'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='每次领取的到期记录数，默认 100'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='没有到期记录时的轮询间隔（秒），默认 5'
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=DEFAULT_LEASE_SECONDS,
+            help=f'领取记录的租期（秒），进程退出未写回的记录在租期后被重新领取，默认 {DEFAULT_LEASE_SECONDS}'
+        )
+        parser.add_argument(
+            '--callback-url',
+            default=getattr(settings, 'KEA_CALLBACK_URL', ''),
+            help='KEA 回调本系统的地址，记录没有入队时保存的回调地址时使用，默认 settings.KEA_CALLBACK_URL'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='处理完当前到期的记录后退出，而不是持续运行'
+        )
+
+    def handle(self, *args, **options):
+        # 送达后记录停在 pending 等待 kea_callback，发往占位地址的回调无法送达，记录永远不会完成
+        callback_url = options['callback_url']
+        if not callback_url:
+            raise CommandError('未配置回调地址（settings.KEA_CALLBACK_URL 或 --callback-url），重发后的回调无法送达')
+        concurrency = max(options['concurrency'], 1)
+        # 每批记录数不超过租期内能发送完的数量，避免租期过后被其他进程重新领取
+        batch_size = min(options['batch_size'], lease_batch_limit(options['lease'], concurrency))
+        self.stdout.write(f"KEA重试调度启动，并发数 {concurrency}，每批 {batch_size} 条")
+
+        success_count = 0
+        failed_count = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    # KEA 熔断中时暂停领取，避免到期记录白白消耗重试次数
+                    retry_after = get_kea_client().breaker.retry_after()
+                    if retry_after:
+                        if options['once']:
+                            self.stdout.write(self.style.WARNING(f"KEA API 熔断中，{retry_after:.0f} 秒后恢复，本次不再重试"))
+                            break
+                        time.sleep(min(retry_after, options['interval']))
+                        continue
+
+                    records = claim_due_retries(batch_size, options['lease'])
+                    if not records:
+                        if options['once']:
+                            break
+                        time.sleep(options['interval'])
+                        continue
+
+                    # 每批一次查询取回DUID，各线程中的 send_to_kea_api 直接命中缓存
+                    with duid_scope() as resolver:
+                        resolver.resolve_many(ipv6_obj.mac_address for ipv6_obj in records)
+                        urls = stored_callback_urls([ipv6_obj.id for ipv6_obj in records])
+                        results = list(executor.map(
+                            in_current_scope(_send_in_thread), records,
+                            [urls.get(ipv6_obj.id, callback_url) for ipv6_obj in records],
+                        ))
+
+                    for ipv6_obj, result in zip(records, results):
+                        if apply_retry_result(ipv6_obj, result):
+                            success_count += 1
+                            self.stdout.write(
+                                self.style.SUCCESS(f"✅ IPv6地址 {ipv6_obj.ipv6_address} 第{ipv6_obj.retry_count}次自动重试发送成功")
+                            )
+                        else:
+                            failed_count += 1
+                            if ipv6_obj.next_retry_time is None:
+                                logger.warning(f"记录ID {ipv6_obj.id} 已重试 {ipv6_obj.retry_count} 次，停止自动重试")
+                            self.stdout.write(
+                                self.style.WARNING(f"❌ IPv6地址 {ipv6_obj.ipv6_address} 第{ipv6_obj.retry_count}次自动重试失败")
+                            )
+                    save_retry_results(records)
+            except KeyboardInterrupt:
+                self.stdout.write("收到中断信号，停止领取新记录")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nKEA重试调度结束！"
+                f"\n成功: {success_count} 个"
+                f"\n失败: {failed_count} 个"
+            )
+        )
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from app01.utils.kea_stub import KeaStubServer, SINGLE_PATH, BATCH_PATH
+import threading
+
+
+class Command(BaseCommand):
+    help = '启动本地KEA webhook桩服务（单条/批量接口），并把绑定结果回调到请求中的 callback_url'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default='127.0.0.1',
+            help='监听地址，默认 127.0.0.1'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=3003,
+            help='监听端口，默认 3003'
+        )
+        parser.add_argument(
+            '--delay',
+            type=float,
+            default=0,
+            help='每个请求的模拟处理耗时（秒），默认 0'
+        )
+        parser.add_argument(
+            '--fail-rate',
+            type=float,
+            default=0,
+            help='模拟绑定失败的比例（0~1），默认 0'
+        )
+        parser.add_argument(
+            '--no-callback',
+            action='store_true',
+            help='只返回成功，不回调'
+        )
+        parser.add_argument(
+            '--callback-secret',
+            default=getattr(settings, 'KEA_CALLBACK_SECRET', ''),
+            help='回调签名密钥，默认 settings.KEA_CALLBACK_SECRET，为空时不签名'
+        )
+
+    def handle(self, *args, **options):
+        server = KeaStubServer(
+            (options['host'], options['port']),
+            delay=options['delay'],
+            fail_rate=options['fail_rate'],
+            enable_callback=not options['no_callback'],
+            callback_secret=options['callback_secret'],
+        )
+        threading.Thread(target=server.deliver_callbacks_forever, daemon=True).start()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"KEA桩服务已启动: {server.base_url}{SINGLE_PATH}，{server.base_url}{BATCH_PATH}"
+                f"\n将 settings.KEA_API_BASE_URL 指向 {server.base_url} 即可联调，Ctrl+C 退出"
+            )
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"共收到 {server.request_count} 个请求，{server.record_count} 条记录")
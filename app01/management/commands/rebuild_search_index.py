@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from app01 import models
+from app01.utils.search_index import rebuild_index
+import time
+
+# 类型 -> 被索引的模型
+INDEXED_MODELS = {
+    'device': models.Device,
+    'approval': models.DeviceApproval,
+    'pretty': models.PrettyNum,
+}
+
+
+class Command(BaseCommand):
+    help = '重建 MAC/DUID/IPv6 搜索索引（bulk_create/update 等批量操作之后执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=sorted(INDEXED_MODELS),
+            action='append',
+            help='只重建指定类型，可重复指定，默认全部'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='每批写入的记录数，默认 2000'
+        )
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or INDEXED_MODELS:
+            start = time.perf_counter()
+            # 清空与重建在同一事务中，重建期间的搜索仍能看到旧索引
+            with transaction.atomic():
+                count = rebuild_index(kind, INDEXED_MODELS[kind].objects.all(), batch_size=options['batch_size'])
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ {kind}: 已索引 {count} 条记录，耗时 {time.perf_counter() - start:.1f}s")
+            )
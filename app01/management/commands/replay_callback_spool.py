@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from app01.utils.callback_ingest import replay_spool, DEFAULT_FLUSH_SIZE
+
+
+class Command(BaseCommand):
+    help = '重放合并写回模式遗留的回调落盘文件（进程异常退出后，在启动 Web 进程之前执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--spool-dir',
+            default=getattr(settings, 'KEA_CALLBACK_SPOOL_DIR', ''),
+            help='落盘目录，默认 settings.KEA_CALLBACK_SPOOL_DIR'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_FLUSH_SIZE,
+            help=f'每个事务写回的回调条数，默认 {DEFAULT_FLUSH_SIZE}'
+        )
+
+    def handle(self, *args, **options):
+        if not options['spool_dir']:
+            raise CommandError('未配置落盘目录（KEA_CALLBACK_SPOOL_DIR 或 --spool-dir）')
+        report = replay_spool(options['spool_dir'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"重放 {report['files']} 个落盘文件，共 {report['total']} 条回调：更新 {report['updated']} 条，"
+            f"状态无需更新 {report['skipped']} 条，未找到记录 {report['not_found']} 条"
+        ))
@@ -1,14 +1,30 @@
-from django.core.management.base import BaseCommand
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
 from django.utils import timezone
 from app01 import models
 from app01.utils.ipv6_api import send_to_kea_api
-import json
+from app01.utils.kea_client import get_kea_client, HostRateLimiter
+from app01.utils.duid_resolver import duid_scope, in_current_scope
+from app01.utils.kea_dispatch import apply_retry_result, manual_retries, save_retry_results, stored_callback_urls
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+
+def _percentile(sorted_values, percent):
+    """ 最近秩法计算百分位数，sorted_values 需已排序 """
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
 class Command(BaseCommand):
-    help = '手动重试发送失败的IPv6地址到KEA API（已移除自动定时重试功能）'
+    help = '手动重试发送失败的IPv6地址到KEA API（自动重试由 kea_retry_scheduler 负责）'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,10 +32,33 @@ class Command(BaseCommand):
             action='store_true',
             help='清理所有失败记录的重试时间字段'
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='并发发送的线程数，默认 1（逐条发送）'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='每个KEA主机每秒最多发送的请求数，默认 0 表示不限速'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='发送结果每累计多少条批量写回数据库，默认 200'
+        )
+        parser.add_argument(
+            '--callback-url',
+            default=getattr(settings, 'KEA_CALLBACK_URL', ''),
+            help='KEA 回调本系统的地址，记录没有入队时保存的回调地址时使用，默认 settings.KEA_CALLBACK_URL'
+        )
 
     def handle(self, *args, **options):
         current_time = timezone.now()
-        
+
         # 如果指定清理选项，清理所有失败记录的重试时间
         if options['clear_failed']:
             updated = models.PrettyNum.objects.filter(
@@ -32,81 +71,119 @@ class Command(BaseCommand):
                 self.style.SUCCESS(f"已清理 {updated} 个失败记录的重试信息")
             )
             return
-        
-        # 查找失败的IPv6记录（移除定时重试逻辑）
-        # 注意：pending状态是等待API回调，不要重试
-        failed_records = models.PrettyNum.objects.filter(
-            send_status__in=['failed', 'retrying']
+
+        # 送达后记录停在 pending 等待 kea_callback，发往占位地址的回调无法送达，记录永远不会完成
+        callback_url = options['callback_url']
+        if not callback_url:
+            raise CommandError('未配置回调地址（settings.KEA_CALLBACK_URL 或 --callback-url），重发后的回调无法送达')
+
+        # 查找失败的IPv6记录（pending 等待回调、kea_retry_scheduler 租期未到的记录不重试）
+        failed_records = manual_retries(current_time)
+        record_ids = list(failed_records.values_list('id', flat=True))
+
+        concurrency = max(options['concurrency'], 1)
+        batch_size = max(options['batch_size'], 1)
+        self.stdout.write(
+            f"找到 {len(record_ids)} 个失败的IPv6记录，准备手动重试（并发 {concurrency}，"
+            f"限速 {options['rate'] or '不限'} 次/秒）"
+        )
+        if not record_ids:
+            return
+
+        # 一条语句把本次要重试的记录全部置为重试中，并清空重试时间，避免 kea_retry_scheduler 同时领取；
+        # last_send_time 记为本次领取时间，写回时只更新仍由本次领取持有的记录（见 save_retry_results）
+        failed_records.filter(id__in=record_ids).update(
+            send_status='retrying',
+            retry_count=F('retry_count') + 1,
+            last_send_time=current_time,
+            next_retry_time=None,
         )
-        
-        self.stdout.write(f"找到 {failed_records.count()} 个失败的IPv6记录，准备手动重试")
-        
+
+        client = get_kea_client()
+        limiter = HostRateLimiter(options['rate'])
+
+        def send(ipv6_obj):
+            """ 线程池中执行：限速后发送一条记录，返回 (记录, 结果, 耗时秒数) """
+            try:
+                limiter.acquire(client.host)
+                start = time.perf_counter()
+                try:
+                    # 送达后由 kea_callback 回调确认绑定结果
+                    result = send_to_kea_api(
+                        ipv6_obj.id, ipv6_obj.ipv6_address, ipv6_obj.mac_address,
+                        callback_url=urls.get(ipv6_obj.id, callback_url)
+                    )
+                except Exception as e:
+                    logger.error(f"手动重试IPv6发送异常: {e}", exc_info=True)
+                    result = {'success': False, 'status_code': None, 'response_data': None,
+                              'error': f"重试异常: {str(e)}"}
+                return ipv6_obj, result, time.perf_counter() - start
+            finally:
+                # 结束后关闭本线程可能打开的数据库连接
+                connections.close_all()
+
         success_count = 0
         failed_count = 0
-        
-        for ipv6_obj in failed_records:
-            self.stdout.write(f"重试发送 IPv6: {ipv6_obj.ipv6_address}, MAC: {ipv6_obj.mac_address}")
-            
-            try:
-                # 更新状态为重试中
-                ipv6_obj.send_status = 'retrying'
-                ipv6_obj.retry_count += 1
-                ipv6_obj.last_send_time = current_time
-                ipv6_obj.save()
-                
-                # 调用KEA API（重试时不需要回调URL，因为我们直接处理结果）
-                result = send_to_kea_api(ipv6_obj.id, ipv6_obj.ipv6_address, ipv6_obj.mac_address)
-                
-                # 更新API响应
-                ipv6_obj.api_response = json.dumps(result['response_data']) if result['response_data'] else result.get('error', '')
-                
-                if result['success']:
-                    # 重试成功
-                    ipv6_obj.send_status = 'success'
-                    ipv6_obj.next_retry_time = None  # 清除重试时间
-                    ipv6_obj.save()
-                    
+        latencies = []
+        pending_updates = []
+        started = time.perf_counter()
+
+        records = list(models.PrettyNum.objects.filter(
+            id__in=record_ids, send_status='retrying', last_send_time=current_time
+        ).only(
+            'id', 'ipv6_address', 'mac_address', 'retry_count', 'last_send_time'
+        ).order_by('id'))
+        # 优先使用入队时按请求地址保存的回调地址
+        urls = stored_callback_urls(record_ids)
+        with duid_scope() as resolver, ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # 一次查询取回所有记录的DUID，各线程中的 send_to_kea_api 直接命中缓存
+            resolver.resolve_many(ipv6_obj.mac_address for ipv6_obj in records)
+            send_in_scope = in_current_scope(send)
+            futures = [executor.submit(send_in_scope, ipv6_obj) for ipv6_obj in records]
+            for future in as_completed(futures):
+                ipv6_obj, result, elapsed = future.result()
+                latencies.append(elapsed)
+
+                # 送达后等待 kea_callback 回调确认绑定结果；失败则按退避策略安排自动重试
+                if apply_retry_result(ipv6_obj, result):
                     self.stdout.write(
                         self.style.SUCCESS(
                             f"✅ IPv6地址 {ipv6_obj.ipv6_address} 手动重试发送成功（第{ipv6_obj.retry_count}次重试）"
                         )
                     )
                     success_count += 1
-                    
                 else:
-                    # 重试仍然失败，但不再设置自动重试时间
-                    ipv6_obj.send_status = 'failed'
-                    ipv6_obj.next_retry_time = None  # 移除自动重试时间设置
-                    ipv6_obj.save()
-                    
+                    next_retry = (
+                        f"下次自动重试: {timezone.localtime(ipv6_obj.next_retry_time):%m-%d %H:%M:%S}"
+                        if ipv6_obj.next_retry_time else "已达自动重试上限，需要手动重试"
+                    )
                     self.stdout.write(
                         self.style.WARNING(
-                            f"❌ IPv6地址 {ipv6_obj.ipv6_address} 第{ipv6_obj.retry_count}次重试失败，需要手动重试"
+                            f"❌ IPv6地址 {ipv6_obj.ipv6_address} 第{ipv6_obj.retry_count}次重试失败，{next_retry}"
                         )
                     )
                     failed_count += 1
-                    
-            except Exception as e:
-                # 重试过程中出现异常
-                ipv6_obj.send_status = 'failed'
-                ipv6_obj.api_response = f"重试异常: {str(e)}"
-                ipv6_obj.next_retry_time = None  # 移除自动重试时间设置
-                ipv6_obj.save()
-                failed_count += 1
-                
-                self.stdout.write(
-                    self.style.ERROR(
-                        f"❌ IPv6地址 {ipv6_obj.ipv6_address} 重试时出现异常: {str(e)}"
-                    )
-                )
-                logger.error(f"手动重试IPv6发送异常: {e}", exc_info=True)
-        
+
+                pending_updates.append(ipv6_obj)
+                if len(pending_updates) >= batch_size:
+                    save_retry_results(pending_updates)
+                    pending_updates = []
+
+        if pending_updates:
+            save_retry_results(pending_updates)
+
         # 输出汇总信息
+        elapsed_total = time.perf_counter() - started
+        latencies.sort()
+        client_stats = client.stats.snapshot()
         self.stdout.write(
             self.style.SUCCESS(
                 f"\n手动重试任务完成！"
                 f"\n成功: {success_count} 个"
                 f"\n失败: {failed_count} 个"
-                f"\n注意：已移除自动定时重试功能，如需重试失败记录请手动执行此命令"
+                f"\n耗时: {elapsed_total:.2f} 秒，吞吐量 {len(latencies) / elapsed_total if elapsed_total else 0:.1f} 条/秒"
+                f"\n发送延迟: p50 {_percentile(latencies, 50) * 1000:.1f} ms，p99 {_percentile(latencies, 99) * 1000:.1f} ms"
+                f"\nKEA连接: 请求 {client_stats['requests']} 次，新建连接 {client_stats['new_connections']} 个，"
+                f"复用 {client_stats['reused_connections']} 次"
             )
         )
@@ -1,12 +1,49 @@
+import logging
+
 from django.utils.deprecation import MiddlewareMixin
 from django.shortcuts import HttpResponse, redirect
+from django.http import JsonResponse
+
+from app01.utils.callback_auth import callback_secret, verify_request
+
+logger = logging.getLogger(__name__)
+
+# 路由表：路径 -> 处理方式，每个请求只做一次字典查找；不在表中的地址都需要登录
+ROUTE_PUBLIC = 'public'  # 不需要登录（登录页、验证码）
+# KEA 回调：配置了 KEA_CALLBACK_SECRET 时只校验HMAC签名、不读会话；未配置时保持原来的免登录
+ROUTE_SIGNED = 'signed'
+# 其他机器回调：配置了密钥时只校验签名；未配置时仍然要求登录（不因为没有配置密钥而放开）
+ROUTE_SIGNED_OR_SESSION = 'signed_or_session'
+
+ROUTES = {
+    "/login/": ROUTE_PUBLIC,
+    "/image/code/": ROUTE_PUBLIC,
+    "/api/kea/callback/": ROUTE_SIGNED,
+    "/api/kea/test/": ROUTE_SIGNED,
+    "/api/device/offline/callback/": ROUTE_SIGNED_OR_SESSION,
+    "/api/ipv6/config/callback/": ROUTE_SIGNED_OR_SESSION,
+}
+
+
+def resolve_route(path):
+    """ 返回路径的处理方式，需要登录的页面返回 None """
+    return ROUTES.get(path)
 
 
 class AuthMiddleware(MiddlewareMixin):
 
     def process_request(self, request):
-        # 0.排除那些不需要登录就能访问的页面
-        if request.path_info in ["/login/", "/image/code/", "/api/kea/callback/", "/api/kea/test/"]:
+        # 0.排除那些不需要登录就能访问的页面；机器回调只校验签名，不读session、不查数据库
+        route = resolve_route(request.path_info)
+        if route == ROUTE_PUBLIC:
+            return
+        if route in (ROUTE_SIGNED, ROUTE_SIGNED_OR_SESSION) and callback_secret():
+            error = verify_request(request)
+            if error:
+                logger.warning(f"回调签名校验失败 {request.path_info}: {error}")
+                return JsonResponse({'success': False, 'message': f'签名校验失败: {error}'}, status=401)
+            return
+        if route == ROUTE_SIGNED:
             return
 
         # 1.读取当前访问的用户的session信息，如果能读到，说明已登陆过，就可以继续向后走。
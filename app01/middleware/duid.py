@@ -0,0 +1,12 @@
+from app01.utils.duid_resolver import duid_scope
+
+
+class DuidScopeMiddleware(object):
+    """ 为每个请求建立DUID查找缓存作用域，同一请求内重复按MAC查找DUID只访问一次数据库 """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with duid_scope():
+            return self.get_response(request)
@@ -0,0 +1,67 @@
+"""
+开发/测试用的查询统计中间件
+
+统计每个请求执行的SQL条数，并按“查询形状”（参数化后的SQL，IN 列表折叠）分组；
+同一形状在一个请求中重复出现达到阈值时，判定为 N+1 查询，记录警告或直接抛出异常。
+
+相关配置（settings.py，均有默认值）：
+    QUERY_INSPECTOR_ENABLED           是否启用，默认跟随 DEBUG；未启用时中间件不会被加载
+    QUERY_INSPECTOR_REPEAT_THRESHOLD  同一形状重复多少次判定为 N+1
+    QUERY_INSPECTOR_RAISE             判定为 N+1 时抛出 NPlusOneQueryError（测试中使用），否则只记录日志
+"""
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEAT_THRESHOLD = 5
+
+# IN (%s, %s, ...) 折叠为 IN (...)，不同长度的 IN 列表视为同一形状
+_IN_LIST = re.compile(r"IN \((?:%s(?:, )?)+\)")
+
+
+class NPlusOneQueryError(Exception):
+    """ 一个请求中同一形状的查询重复次数超过阈值 """
+
+
+def query_shape(sql):
+    """ 查询形状：参数化的SQL，IN 列表折叠 """
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class QueryCountMiddleware(object):
+    """ 统计每个请求的SQL条数，发现重复的查询形状时告警 """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_INSPECTOR_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+        self.raise_error = getattr(settings, 'QUERY_INSPECTOR_RAISE', False)
+
+    def __call__(self, request):
+        shapes = Counter()
+
+        def record(execute, sql, params, many, context):
+            shapes[query_shape(sql)] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.get_response(request)
+
+        total = sum(shapes.values())
+        response['X-Query-Count'] = str(total)
+
+        repeated = [(shape, count) for shape, count in shapes.most_common() if count >= self.threshold]
+        if repeated:
+            details = "; ".join(f"{count}次: {shape}" for shape, count in repeated)
+            message = f"{request.method} {request.path} 共 {total} 条SQL，疑似N+1查询 -> {details}"
+            if self.raise_error:
+                raise NPlusOneQueryError(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,99 @@
+# Generated by Django 4.0 on 2026-10-17 14:48
+
+import ipaddress
+import itertools
+
+from django.db import migrations, models
+
+SIGN_BIT = 1 << 63
+LOW64 = (1 << 64) - 1
+
+# 重复地址报错时最多列出的地址个数
+MAX_REPORTED_DUPLICATES = 20
+
+
+def check_duplicate_addresses(apps, schema_editor):
+    """
+    在改表之前检查已有记录中是否有同一地址（写法不同也算，如压缩/完整格式、大小写）
+
+    有重复时唯一约束无法建立，MySQL 上加列的 DDL 也不会随事务回滚，所以先检查、不改表，
+    列出重复的记录，处理（每个地址只保留一条）后重新执行 migrate。
+    """
+    PrettyNum = apps.get_model('app01', 'PrettyNum')
+    first_ids = {}
+    duplicates = {}
+    for obj in PrettyNum.objects.only('id', 'ipv6_address').order_by('id').iterator(chunk_size=2000):
+        try:
+            value = int(ipaddress.IPv6Address(obj.ipv6_address))
+        except ValueError:
+            continue
+        first_id = first_ids.setdefault(value, obj.id)
+        if first_id != obj.id:
+            duplicates.setdefault(value, [first_id]).append(obj.id)
+    if duplicates:
+        lines = [
+            f"  {ipaddress.IPv6Address(value)}: 记录ID {ids}"
+            for value, ids in itertools.islice(duplicates.items(), MAX_REPORTED_DUPLICATES)
+        ]
+        if len(duplicates) > MAX_REPORTED_DUPLICATES:
+            lines.append(f"  ……共 {len(duplicates)} 个重复地址")
+        raise RuntimeError(
+            "app01_prettynum 中有重复的IPv6地址，无法建立唯一约束 uniq_prettynum_ipv6_int，"
+            "请每个地址只保留一条记录后重新执行 migrate：\n" + "\n".join(lines)
+        )
+
+
+def backfill_ipv6_int(apps, schema_editor):
+    """
+    为已有记录回填 ipv6_prefix / ipv6_iid，并把地址统一为压缩格式
+
+    无法解析的地址保持原样，两列留空（NULL）：唯一约束不约束 NULL，这些记录不参与地址查重，
+    按地址结构的查询（前缀、部门/楼栋位段）也查不到它们，需要人工修正地址后重新保存。
+    """
+    PrettyNum = apps.get_model('app01', 'PrettyNum')
+    batch = []
+    for obj in PrettyNum.objects.only('id', 'ipv6_address').iterator(chunk_size=2000):
+        try:
+            value = int(ipaddress.IPv6Address(obj.ipv6_address))
+        except ValueError:
+            continue
+        obj.ipv6_prefix = (value >> 64) - SIGN_BIT
+        obj.ipv6_iid = (value & LOW64) - SIGN_BIT
+        obj.ipv6_address = str(ipaddress.IPv6Address(value))
+        batch.append(obj)
+        if len(batch) >= 2000:
+            PrettyNum.objects.bulk_update(batch, ['ipv6_prefix', 'ipv6_iid', 'ipv6_address'])
+            batch = []
+    if batch:
+        PrettyNum.objects.bulk_update(batch, ['ipv6_prefix', 'ipv6_iid', 'ipv6_address'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0006_ipv6config'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_addresses, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='prettynum',
+            name='ipv6_prefix',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='IPv6前缀(高64位)'),
+        ),
+        migrations.AddField(
+            model_name='prettynum',
+            name='ipv6_iid',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='IPv6接口ID(低64位)'),
+        ),
+        migrations.RunPython(backfill_ipv6_int, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='prettynum',
+            name='ipv6_address',
+            field=models.CharField(db_index=True, max_length=45, verbose_name='IPv6地址'),
+        ),
+        migrations.AddConstraint(
+            model_name='prettynum',
+            constraint=models.UniqueConstraint(fields=('ipv6_prefix', 'ipv6_iid'), name='uniq_prettynum_ipv6_int'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0 on 2026-10-17 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0007_prettynum_ipv6_int'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviceapproval',
+            index=models.Index(fields=['mac_address', 'status'], name='approval_mac_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prettynum',
+            index=models.Index(fields=['mac_address'], name='prettynum_mac_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prettynum',
+            index=models.Index(fields=['send_status', 'id'], name='prettynum_status_id_idx'),
+        ),
+    ]
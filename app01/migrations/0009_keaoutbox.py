@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-17 14:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0008_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeaOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('duid', models.CharField(blank=True, max_length=64, null=True, verbose_name='DUID')),
+                ('callback_url', models.CharField(blank=True, max_length=255, null=True, verbose_name='回调URL')),
+                ('status', models.CharField(choices=[('pending', '待发送'), ('sending', '发送中'), ('done', '已发送'), ('failed', '发送失败')], default='pending', max_length=10, verbose_name='队列状态')),
+                ('attempts', models.IntegerField(default=0, verbose_name='领取次数')),
+                ('available_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='可领取时间')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('pretty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app01.prettynum', verbose_name='IPv6记录')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='keaoutbox',
+            index=models.Index(fields=['status', 'available_time'], name='outbox_status_time_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-17 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0009_keaoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prettynum',
+            index=models.Index(fields=['send_status', 'next_retry_time'], name='prettynum_retry_due_idx'),
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.0 on 2026-10-17 16:40
+
+import ipaddress
+import itertools
+import re
+
+from django.db import migrations, models
+
+# 以下为迁移时的索引规则（与 app01/utils/search_index.py 当时的实现相同），复制在这里，
+# 之后修改 search_index.py 不会改变这个迁移的行为
+_NON_HEX = re.compile(r"[^0-9a-f]")
+FIELD_TAGS = {'mac': 'm', 'duid': 'd', 'ipv6': 'a', 'iid': 'i'}
+KIND_FIELDS = {
+    'device': ('mac', 'duid'),
+    'approval': ('mac', 'duid'),
+    'pretty': ('mac', 'ipv6', 'iid'),
+}
+GRAM_SIZE = 8
+BATCH_SIZE = 2000
+
+
+def normalize_hex(value):
+    return _NON_HEX.sub("", (value or "").lower())
+
+
+def ipv6_iid(ipv6_address):
+    try:
+        return ipaddress.IPv6Address((ipv6_address or "").strip()).exploded.replace(":", "")[16:]
+    except ValueError:
+        return ""
+
+
+def entry_values(kind, obj):
+    values = {'mac': normalize_hex(obj.mac_address), 'duid': '', 'ipv6': '', 'iid': ''}
+    if kind == 'pretty':
+        values['ipv6'] = (obj.ipv6_address or "").lower()
+        values['iid'] = ipv6_iid(obj.ipv6_address)
+    else:
+        values['duid'] = normalize_hex(obj.duid)
+    return values
+
+
+def entry_grams(kind, values):
+    return {
+        f"{FIELD_TAGS[field]}:{values[field][i:i + GRAM_SIZE]}"
+        for field in KIND_FIELDS[kind]
+        for i in range(len(values[field]))
+    }
+
+
+def build_search_index(apps, schema_editor):
+    """ 为已有的设备/审批/IPv6记录建立搜索索引 """
+    SearchEntry = apps.get_model('app01', 'SearchEntry')
+    SearchGram = apps.get_model('app01', 'SearchGram')
+    for kind, model_name in (('device', 'Device'), ('approval', 'DeviceApproval'), ('pretty', 'PrettyNum')):
+        objs = apps.get_model('app01', model_name).objects.order_by('pk').iterator(chunk_size=BATCH_SIZE)
+        while True:
+            batch = list(itertools.islice(objs, BATCH_SIZE))
+            if not batch:
+                break
+            entries, gram_rows = [], []
+            for obj in batch:
+                values = entry_values(kind, obj)
+                entries.append(SearchEntry(kind=kind, object_id=obj.pk, **values))
+                gram_rows.extend(SearchGram(kind=kind, gram=gram, object_id=obj.pk)
+                                 for gram in entry_grams(kind, values))
+            SearchEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+            SearchGram.objects.bulk_create(gram_rows, batch_size=8000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0010_prettynum_retry_due_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('device', '设备'), ('approval', '设备审批'), ('pretty', 'IPv6地址')], max_length=10, verbose_name='类型')),
+                ('object_id', models.BigIntegerField(verbose_name='记录ID')),
+                ('mac', models.CharField(blank=True, default='', max_length=17, verbose_name='MAC(规范化)')),
+                ('duid', models.CharField(blank=True, default='', max_length=64, verbose_name='DUID(规范化)')),
+                ('ipv6', models.CharField(blank=True, default='', max_length=45, verbose_name='IPv6地址(小写)')),
+                ('iid', models.CharField(blank=True, default='', max_length=16, verbose_name='IPv6接口ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10, verbose_name='类型')),
+                ('gram', models.CharField(max_length=10, verbose_name='n-gram')),
+                ('object_id', models.BigIntegerField(verbose_name='记录ID')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchgram',
+            index=models.Index(fields=['kind', 'gram', 'object_id'], name='search_gram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchgram',
+            index=models.Index(fields=['kind', 'object_id'], name='search_gram_object_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='uniq_search_entry'),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
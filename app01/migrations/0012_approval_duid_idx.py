@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviceapproval',
+            index=models.Index(fields=['duid'], name='approval_duid_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0 on 2026-10-17 19:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app01', '0012_approval_duid_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=255, verbose_name='上传文件路径')),
+                ('file_format', models.CharField(max_length=8, verbose_name='文件格式')),
+                ('status', models.CharField(choices=[('pending', '等待导入'), ('running', '导入中'), ('done', '导入完成'), ('failed', '导入失败')], default='pending', max_length=10, verbose_name='任务状态')),
+                ('available_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='可领取时间')),
+                ('total', models.IntegerField(default=0, verbose_name='已读取行数')),
+                ('created', models.IntegerField(default=0, verbose_name='新增条数')),
+                ('invalid', models.IntegerField(default=0, verbose_name='格式错误条数')),
+                ('duplicate', models.IntegerField(default=0, verbose_name='重复条数')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='错误明细')),
+                ('message', models.CharField(blank=True, default='', max_length=255, verbose_name='结果说明')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='approvalimportjob',
+            index=models.Index(fields=['status', 'available_time'], name='import_job_status_time_idx'),
+        ),
+    ]
@@ -1,4 +1,10 @@
 from django.db import models
+from django.utils import timezone
+
+from app01.utils.ipv6_generator import (
+    ipv6_to_db_pair, ipv6_to_int_pair, ipv6_from_int_pair, u64_to_db, u64_from_db,
+    IPV6_PREFIX_INT, slot_iid_ranges, network_int_range,
+)
 
 
 # Shared choices (moved from Device and DeviceApproval for reusability)
@@ -49,12 +55,98 @@ class UserInfo(models.Model):
         return self.name
 
 
+class PrettyNumQuerySet(models.QuerySet):
+    """ 基于 ipv6_prefix / ipv6_iid 两列整数的地址查询，以及各处共用的查找条件 """
+
+    def by_mac(self, mac_address):
+        """ 按MAC地址查找记录（kea_callback 兜底、设备下线、审批时复用已有记录） """
+        return self.filter(mac_address=mac_address)
+
+    def by_address(self, ipv6_address):
+        """
+        按IPv6地址等值查询，压缩格式和完整格式的写法都能命中
+
+        Raises:
+            ValueError: IPv6地址格式错误
+        """
+        prefix, interface_id = ipv6_to_db_pair(ipv6_address)
+        return self.filter(ipv6_prefix=prefix, ipv6_iid=interface_id)
+
+    def address_range(self, first, last):
+        """
+        查询 [first, last] 闭区间内的地址（两端为IPv6地址字符串）
+
+        Raises:
+            ValueError: IPv6地址格式错误
+        """
+        first_prefix, first_iid = ipv6_to_int_pair(first)
+        last_prefix, last_iid = ipv6_to_int_pair(last)
+        return self.filter(self._int_range_q((first_prefix << 64) | first_iid, (last_prefix << 64) | last_iid))
+
+    def in_network(self, cidr):
+        """
+        查询网段内的地址，例如 240c:c901:a:a:1a00::/72
+
+        Raises:
+            ValueError: 网段格式错误
+        """
+        return self.filter(self._int_range_q(*network_int_range(cidr)))
+
+    def in_slot(self, department=None, building=None, service=None, prefix=IPV6_PREFIX_INT):
+        """
+        按 generate_ipv6 的地址结构查询某个部门/楼栋/业务类型下的地址
+
+        能用接口ID区间表达的条件走 (ipv6_prefix, ipv6_iid) 索引的范围扫描，
+        其余条件（例如只指定业务类型）在范围扫描的结果上用位运算过滤。
+
+        Raises:
+            ValueError: 参数范围错误
+        """
+        ranges, residual = slot_iid_ranges(department, building, service)
+        queryset = self.filter(ipv6_prefix=u64_to_db(prefix))
+        if ranges != [(0, (1 << 64) - 1)]:
+            condition = models.Q()
+            for first, last in ranges:
+                condition |= models.Q(ipv6_iid__gte=u64_to_db(first), ipv6_iid__lte=u64_to_db(last))
+            queryset = queryset.filter(condition)
+        for shift, width, value in residual:
+            # 存储值只是翻转了最高位，低63位与原始接口ID相同，可以直接移位取字段
+            alias = f"iid_bits_{shift}"
+            queryset = queryset.alias(**{
+                alias: models.F('ipv6_iid').bitrightshift(shift).bitand((1 << width) - 1)
+            }).filter(**{alias: value})
+        return queryset
+
+    @staticmethod
+    def _int_range_q(first, last):
+        """ 把128位整数闭区间转换为 (ipv6_prefix, ipv6_iid) 上的查询条件 """
+        first_prefix, first_iid = u64_to_db(first >> 64), u64_to_db(first & ((1 << 64) - 1))
+        last_prefix, last_iid = u64_to_db(last >> 64), u64_to_db(last & ((1 << 64) - 1))
+        if first_prefix == last_prefix:
+            return models.Q(ipv6_prefix=first_prefix, ipv6_iid__gte=first_iid, ipv6_iid__lte=last_iid)
+        return (
+            models.Q(ipv6_prefix=first_prefix, ipv6_iid__gte=first_iid)
+            | models.Q(ipv6_prefix__gt=first_prefix, ipv6_prefix__lt=last_prefix)
+            | models.Q(ipv6_prefix=last_prefix, ipv6_iid__lte=last_iid)
+        )
+
+
+PrettyNumManager = models.Manager.from_queryset(PrettyNumQuerySet)
+
+
 class PrettyNum(models.Model):
     """ IPv6地址绑定表 """
     user = models.CharField(verbose_name="用户", max_length=32)
-    ipv6_address = models.CharField(verbose_name="IPv6地址", max_length=45, unique=True)
+    # 唯一性由整数列保证；文本列保留普通索引，按原样的地址字符串查询（包括无法解析的地址）时仍走索引
+    ipv6_address = models.CharField(verbose_name="IPv6地址", max_length=45, db_index=True)
     mac_address = models.CharField(verbose_name="MAC地址", max_length=17, null=True, blank=True)
 
+    # IPv6地址的定长整数表示，由 ipv6_address 在保存时同步生成（见 sync_ipv6_int）
+    # 两列均为无符号64位值减去 2^63 后的结果，保证有符号 BIGINT 中的大小顺序与地址顺序一致
+    # 无法解析的地址两列为 NULL，不受唯一约束 uniq_prettynum_ipv6_int 限制，也不参与按地址结构的查询
+    ipv6_prefix = models.BigIntegerField(verbose_name="IPv6前缀(高64位)", null=True, blank=True, editable=False)
+    ipv6_iid = models.BigIntegerField(verbose_name="IPv6接口ID(低64位)", null=True, blank=True, editable=False)
+
     # 添加部门和楼栋字段，从设备审批表继承
     department = models.ForeignKey(verbose_name="部门", to="Department", on_delete=models.CASCADE, null=True, blank=True)
     building = models.SmallIntegerField(verbose_name="楼栋", choices=BUILDING_CHOICES, default=1, null=True, blank=True)
@@ -73,8 +165,45 @@ class PrettyNum(models.Model):
     next_retry_time = models.DateTimeField(verbose_name="下次重试时间", null=True, blank=True)
     api_response = models.TextField(verbose_name="API响应", null=True, blank=True)
 
+    objects = PrettyNumManager()
+
+    class Meta:
+        constraints = [
+            # 地址唯一性由定长整数列保证，同一地址的不同写法也会被判定为重复
+            models.UniqueConstraint(fields=['ipv6_prefix', 'ipv6_iid'], name='uniq_prettynum_ipv6_int'),
+        ]
+        indexes = [
+            # kea_callback / 设备下线按MAC查找记录
+            models.Index(fields=['mac_address'], name='prettynum_mac_idx'),
+            # 重试命令按状态筛选，kea_callback 按状态筛选后 order_by('-id')
+            models.Index(fields=['send_status', 'id'], name='prettynum_status_id_idx'),
+            # kea_retry_scheduler 按 send_status + next_retry_time <= now 领取到期的重试
+            models.Index(fields=['send_status', 'next_retry_time'], name='prettynum_retry_due_idx'),
+        ]
+
     def __str__(self):
         return self.ipv6_address
+
+    def sync_ipv6_int(self):
+        """
+        根据 ipv6_address 同步整数列，并把地址统一为压缩格式
+
+        地址格式错误时整数列置空。bulk_create / bulk_update 不会调用 save()，
+        批量写入前需要对每个对象手动调用本方法。
+        """
+        try:
+            self.ipv6_prefix, self.ipv6_iid = ipv6_to_db_pair(self.ipv6_address)
+        except ValueError:
+            self.ipv6_prefix = self.ipv6_iid = None
+            return
+        self.ipv6_address = ipv6_from_int_pair(u64_from_db(self.ipv6_prefix), u64_from_db(self.ipv6_iid))
+
+    def save(self, *args, **kwargs):
+        self.sync_ipv6_int()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'ipv6_address' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'ipv6_prefix', 'ipv6_iid'}
+        super().save(*args, **kwargs)
     
     def get_error_message(self):
         """获取绑定失败时的错误消息"""
@@ -137,6 +266,14 @@ class DeviceApproval(models.Model):
     )
     status = models.SmallIntegerField(verbose_name="状态", choices=status_choices, default=2)
 
+    class Meta:
+        indexes = [
+            # send_to_kea_api 按MAC查找已审批(status=1)记录的DUID
+            models.Index(fields=['mac_address', 'status'], name='approval_mac_status_idx'),
+            # 批量导入按DUID查重
+            models.Index(fields=['duid'], name='approval_duid_idx'),
+        ]
+
     def __str__(self):
         # 修改 __str__ 方法以反映 department 字段
         return f"{self.user} - {self.department.title} - {self.building}栋"
@@ -167,3 +304,110 @@ class IPv6Config(models.Model):
     def __str__(self):
         return f"VLAN{self.vlan_id} - {self.admin_name}"
 
+
+class KeaOutbox(models.Model):
+    """ KEA发送队列（outbox），与 PrettyNum 在同一事务中写入，由 kea_outbox_worker 命令异步发送 """
+    pretty = models.ForeignKey(verbose_name="IPv6记录", to="PrettyNum", on_delete=models.CASCADE)
+    duid = models.CharField(verbose_name="DUID", max_length=64, null=True, blank=True)
+    callback_url = models.CharField(verbose_name="回调URL", max_length=255, null=True, blank=True)
+
+    STATUS_CHOICES = [
+        ('pending', '待发送'),
+        ('sending', '发送中'),
+        ('done', '已发送'),
+        ('failed', '发送失败'),
+    ]
+    status = models.CharField(verbose_name="队列状态", max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(verbose_name="领取次数", default=0)
+    # 可以被领取的时间；领取后顺延一个租期，worker 异常退出时记录会在租期结束后被重新领取
+    available_time = models.DateTimeField(verbose_name="可领取时间", default=timezone.now)
+    create_time = models.DateTimeField(verbose_name="创建时间", auto_now_add=True)
+    last_error = models.TextField(verbose_name="错误信息", null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_time'], name='outbox_status_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pretty_id} - {self.status}"
+
+
+class SearchEntry(models.Model):
+    """
+    搜索索引：设备/审批/IPv6记录中可搜索字段的规范化值，由信号在保存时维护（见 app01/utils/search_index.py）
+
+    mac/duid 只保留十六进制字符（小写），iid 为IPv6地址后64位的16个十六进制字符。
+    mac/duid/ipv6 的长度与来源字段相同，来源字段中的任何值都能写入索引。
+    """
+    KIND_CHOICES = [
+        ('device', '设备'),
+        ('approval', '设备审批'),
+        ('pretty', 'IPv6地址'),
+    ]
+    kind = models.CharField(verbose_name="类型", max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField(verbose_name="记录ID")
+    mac = models.CharField(verbose_name="MAC(规范化)", max_length=17, default='', blank=True)
+    duid = models.CharField(verbose_name="DUID(规范化)", max_length=64, default='', blank=True)
+    ipv6 = models.CharField(verbose_name="IPv6地址(小写)", max_length=45, default='', blank=True)
+    iid = models.CharField(verbose_name="IPv6接口ID", max_length=16, default='', blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='uniq_search_entry'),
+        ]
+
+
+class SearchGram(models.Model):
+    """
+    搜索索引的 n-gram：字段值从每个位置开始的最多8个字符，gram 形如 "m:a1b2c3d4"（字段标记:片段）
+
+    任意不超过8个字符的子串都是某个 gram 的前缀，子串搜索变为 (kind, gram) 索引上的前缀区间查找。
+    """
+    kind = models.CharField(verbose_name="类型", max_length=10)
+    gram = models.CharField(verbose_name="n-gram", max_length=10)
+    object_id = models.BigIntegerField(verbose_name="记录ID")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'gram', 'object_id'], name='search_gram_idx'),
+            # 重建/删除某条记录的索引
+            models.Index(fields=['kind', 'object_id'], name='search_gram_object_idx'),
+        ]
+
+
+class ApprovalImportJob(models.Model):
+    """
+    设备审批批量导入任务：网页上传后写入，由 approval_import_worker 命令执行，进度保存在本表中，
+    任何 Web 进程都能查询（见 app01/utils/approval_import.py）
+    """
+    file_path = models.CharField(verbose_name="上传文件路径", max_length=255)
+    file_format = models.CharField(verbose_name="文件格式", max_length=8)
+
+    STATUS_CHOICES = [
+        ('pending', '等待导入'),
+        ('running', '导入中'),
+        ('done', '导入完成'),
+        ('failed', '导入失败'),
+    ]
+    status = models.CharField(verbose_name="任务状态", max_length=10, choices=STATUS_CHOICES, default='pending')
+    # 可以被领取的时间；领取后顺延一个租期，每批处理完续期，worker 异常退出时任务在租期结束后被重新领取
+    available_time = models.DateTimeField(verbose_name="可领取时间", default=timezone.now)
+
+    total = models.IntegerField(verbose_name="已读取行数", default=0)
+    created = models.IntegerField(verbose_name="新增条数", default=0)
+    invalid = models.IntegerField(verbose_name="格式错误条数", default=0)
+    duplicate = models.IntegerField(verbose_name="重复条数", default=0)
+    errors = models.JSONField(verbose_name="错误明细", default=list, blank=True)
+    message = models.CharField(verbose_name="结果说明", max_length=255, default='', blank=True)
+
+    create_time = models.DateTimeField(verbose_name="创建时间", auto_now_add=True)
+    update_time = models.DateTimeField(verbose_name="更新时间", auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_time'], name='import_job_status_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.status}"
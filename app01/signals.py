@@ -0,0 +1,81 @@
+"""
+app01 的信号处理，在 App01Config.ready() 中导入
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from app01 import models
+from app01.utils import search_index
+from app01.utils.address_allocator import get_allocator
+from app01.utils.count_cache import invalidate_model_counts
+
+
+# 列表页使用 COUNT 缓存的模型（含列表查询 JOIN 的表），见 app01/utils/count_cache.py
+COUNT_CACHE_MODELS = (
+    models.Admin,
+    models.Department,
+    models.UserInfo,
+    models.PrettyNum,
+    models.Device,
+    models.DeviceApproval,
+    models.IPv6Config,
+)
+
+
+def invalidate_count_cache(sender, **kwargs):
+    """ 记录新增/修改/删除后，使该模型相关的列表 COUNT 缓存失效 """
+    invalidate_model_counts(sender)
+
+
+# 按模型分别注册，其他模型（搜索索引、发送队列等）的保存/删除不触发，QuerySet.delete() 仍可快速删除
+for _model in COUNT_CACHE_MODELS:
+    post_save.connect(invalidate_count_cache, sender=_model,
+                      dispatch_uid=f"app01_count_cache_save_{_model._meta.model_name}")
+    post_delete.connect(invalidate_count_cache, sender=_model,
+                        dispatch_uid=f"app01_count_cache_delete_{_model._meta.model_name}")
+
+
+# 需要维护搜索索引的模型 -> 索引类型
+SEARCH_INDEX_KINDS = {
+    models.Device: 'device',
+    models.DeviceApproval: 'approval',
+    models.PrettyNum: 'pretty',
+}
+
+# 参与搜索索引的字段，save(update_fields=...) 没有涉及这些字段时不重建索引
+SEARCH_INDEX_FIELDS = frozenset({'mac_address', 'duid', 'ipv6_address'})
+
+
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """ 设备/审批/IPv6记录保存后更新搜索索引 """
+    if raw or (update_fields is not None and not SEARCH_INDEX_FIELDS.intersection(update_fields)):
+        return
+    search_index.index_object(SEARCH_INDEX_KINDS[sender], instance)
+
+
+def delete_search_index(sender, instance, **kwargs):
+    """ 设备/审批/IPv6记录删除后删除搜索索引 """
+    search_index.unindex_object(SEARCH_INDEX_KINDS[sender], instance.pk)
+
+
+# 按模型分别注册：不指定 sender 的 post_delete 接收者会让所有模型的 QuerySet.delete() 放弃快速删除，
+# 逐条取出记录再发信号
+for _model in SEARCH_INDEX_KINDS:
+    post_save.connect(update_search_index, sender=_model,
+                      dispatch_uid=f"app01_search_index_save_{_model._meta.model_name}")
+    post_delete.connect(delete_search_index, sender=_model,
+                        dispatch_uid=f"app01_search_index_delete_{_model._meta.model_name}")
+
+
+@receiver(post_save, sender=models.PrettyNum, dispatch_uid="app01_address_allocator_save")
+def allocate_address(sender, instance, raw=False, **kwargs):
+    """ IPv6记录保存后记入本进程的地址分配表 """
+    if not raw and instance.ipv6_prefix is not None:
+        get_allocator().add(instance.ipv6_address)
+
+
+@receiver(post_delete, sender=models.PrettyNum, dispatch_uid="app01_address_allocator_delete")
+def release_address(sender, instance, **kwargs):
+    """ IPv6记录删除后从本进程的地址分配表中移除 """
+    if instance.ipv6_prefix is not None:
+        get_allocator().discard(instance.ipv6_address)
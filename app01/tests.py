@@ -1,3 +1,1324 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import ipaddress
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from app01 import models
+from app01.management.commands.audit_query_plans import _sqlite_full_scans
+from app01.middleware.auth import resolve_route, ROUTE_PUBLIC, ROUTE_SIGNED, ROUTE_SIGNED_OR_SESSION
+from app01.middleware.query_count import QueryCountMiddleware, NPlusOneQueryError, query_shape
+from app01.utils import address_allocator, callback_ingest, captcha_pool, ipv6_generator, kea_client
+from app01.utils.address_allocator import AddressConflict
+from app01.utils.approval_import import (
+    import_approvals, iter_rows, start_import_job, claim_import_job, run_import_job, get_import_progress,
+)
+from app01.utils.binding_export import export_bindings
+from app01.utils.callback_auth import signature_headers
+from app01.utils.captcha_token import (
+    COOKIE_NAME as CAPTCHA_COOKIE, NonceCache, NonceCacheFull, make_token, check_token,
+)
+from app01.utils.encrypt import md5
+from app01.utils.bulk_approval import approve_approvals, reject_approvals
+from app01.utils.duid_resolver import DuidResolver, duid_scope, get_duid_resolver, in_current_scope
+from app01.utils.ipv6_api import send_device_offline_to_api
+from app01.utils.ipv6_generator import generate_ipv6, generate_ipv6_batch
+from app01.utils.kea_client import CircuitBreaker, CircuitOpenError, KeaClient
+from app01.utils.kea_dispatch import (
+    apply_send_result, apply_retry_result, claim_due_retries, claim_outbox_batch, enqueue_kea_send,
+    finish_outbox_entry, finish_outbox_group, lease_batch_limit, retry_delay, save_retry_results, schedule_retry,
+)
+from app01.utils.pagination import Pagination
+from app01.utils.reconcile import reconcile, iter_dump, external_sort
+from app01.utils.search_index import search_ids
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_RAISE=True, QUERY_INSPECTOR_REPEAT_THRESHOLD=3)
+class ListViewQueryCountTests(TestCase):
+    """ 固定 day16/urls.py 中各列表页的SQL条数，防止出现 N+1 查询 """
+
+    # 每张表的记录数，大于 N+1 判定阈值，逐行查询关联对象时会直接报错
+    ROWS = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        departments = [models.Department.objects.create(title=f"部门{i}") for i in range(cls.ROWS)]
+        for i, department in enumerate(departments):
+            mac = f"02:00:00:00:00:{i:02X}"
+            models.Admin.objects.create(username=f"admin{i}", password="x")
+            models.UserInfo.objects.create(name=f"用户{i}", password="x", create_time=now, depart=department)
+            models.PrettyNum.objects.create(
+                user=f"用户{i}", ipv6_address=f"240c:c901:a:a:1010:1:0:{i + 1}", mac_address=mac,
+                department=department, building=1,
+            )
+            models.Device.objects.create(
+                department=department, building=1, business_type=1, duid=f"duid{i}", mac_address=mac, create_time=now,
+            )
+            models.DeviceApproval.objects.create(
+                user=f"用户{i}", department=department, building=1, business_type=1, duid=f"duid{i}", mac_address=mac,
+            )
+            models.IPv6Config.objects.create(
+                admin_name="admin", vlan_id=100 + i, gateway="240C:C901:A:A::1/64", dhcp_relay="2001:250:6c00:3::1",
+            )
+
+    def setUp(self):
+        # 列表页的 COUNT 有缓存，每个用例从空缓存开始
+        cache.clear()
+        session = self.client.session
+        session["info"] = {"id": 1, "name": "admin"}
+        session.save()
+
+    def assertListQueries(self, url, num):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_depart_list(self):
+        self.assertListQueries("/depart/list/", 2)
+
+    def test_user_list(self):
+        self.assertListQueries("/user/list/", 3)
+
+    def test_pretty_list(self):
+        # 会话 + 当前页 + COUNT + 部门下拉框
+        self.assertListQueries("/pretty/list/", 4)
+
+    def test_pretty_list_search(self):
+        self.assertListQueries("/pretty/list/?q=240c:c901&department=1", 4)
+
+    def test_admin_list(self):
+        self.assertListQueries("/admin/list/", 3)
+
+    def test_device_list(self):
+        self.assertListQueries("/device/list/", 3)
+
+    def test_device_list_search(self):
+        response = self.assertListQueries("/device/list/?q=00:00:03", 3)
+        self.assertEqual([obj.mac_address for obj in response.context["queryset"]], ["02:00:00:00:00:03"])
+
+    def test_device_approval_list(self):
+        self.assertListQueries("/device/approval/list/", 3)
+
+    def test_device_approval_list_for_user(self):
+        session = self.client.session
+        del session["info"]
+        session["user_info"] = {"id": 1, "name": "用户0"}
+        session.save()
+        self.assertListQueries("/device/approval/list/?q=02:00", 3)
+
+    def test_ipv6_config_list(self):
+        self.assertListQueries("/ipv6/config/list/", 3)
+
+    def test_count_is_cached(self):
+        self.client.get("/device/list/")
+        # 第二次访问不再执行 COUNT
+        self.assertListQueries("/device/list/", 2)
+
+    def test_count_invalidated_by_save(self):
+        self.client.get("/device/list/")
+        models.Device.objects.first().save()
+        self.assertListQueries("/device/list/", 3)
+
+    def test_uncounted_model_delete_stays_fast(self):
+        # 不注册在该模型上的信号不会让 delete() 先逐条取出记录
+        with self.assertNumQueries(1):
+            models.SearchGram.objects.filter(kind='device').delete()
+
+
+@override_settings(QUERY_INSPECTOR_ENABLED=True, QUERY_INSPECTOR_RAISE=True, QUERY_INSPECTOR_REPEAT_THRESHOLD=3)
+class QueryCountMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            department = models.Department.objects.create(title=f"部门{i}")
+            models.DeviceApproval.objects.create(user="u", department=department, mac_address=f"02:00:00:00:01:{i:02X}")
+
+    def test_query_shape_folds_in_lists(self):
+        self.assertEqual(
+            query_shape('SELECT 1 FROM t WHERE id IN (%s, %s, %s)'),
+            query_shape('SELECT 1 FROM t WHERE id IN (%s)'),
+        )
+
+    def test_repeated_query_shape_raises(self):
+        def view(request):
+            titles = [obj.department.title for obj in models.DeviceApproval.objects.all()]
+            return HttpResponse(",".join(titles))
+
+        middleware = QueryCountMiddleware(view)
+        with self.assertRaises(NPlusOneQueryError):
+            middleware(RequestFactory().get("/"))
+
+    def test_select_related_passes(self):
+        def view(request):
+            titles = [obj.department.title for obj in models.DeviceApproval.objects.select_related("department")]
+            return HttpResponse(",".join(titles))
+
+        response = QueryCountMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(response["X-Query-Count"], "1")
+
+
+class SearchIndexTests(TestCase):
+    """ MAC/DUID/IPv6 搜索索引随记录保存/删除维护 """
+
+    @classmethod
+    def setUpTestData(cls):
+        department = models.Department.objects.create(title="部门")
+        cls.device = models.Device.objects.create(
+            department=department, create_time=timezone.now(),
+            mac_address="AA:BB:CC:DD:EE:FF", duid="00:01:00:01:11:22:33:44:AA:BB:CC:DD:EE:FF",
+        )
+        cls.other = models.Device.objects.create(
+            department=department, create_time=timezone.now(), mac_address="02:00:00:00:00:01", duid="00:03:00:01:99:88",
+        )
+        cls.pretty = models.PrettyNum.objects.create(
+            ipv6_address="240c:c901:a:a:1010:11:2233:4455", mac_address="02:00:00:00:00:02",
+        )
+
+    def search(self, kind, query, **kwargs):
+        return set(search_ids(kind, query, **kwargs))
+
+    def test_mac_or_duid(self):
+        # MAC 与 DUID 任一匹配即可，忽略大小写和分隔符
+        self.assertEqual(self.search('device', 'bb:cc'), {self.device.id})
+        self.assertEqual(self.search('device', 'bbccdd'), {self.device.id})
+        self.assertEqual(self.search('device', '9988'), {self.other.id})
+        self.assertEqual(self.search('device', '00:01'), {self.device.id, self.other.id})
+
+    def test_long_query_is_verified(self):
+        self.assertEqual(self.search('device', '00:01:00:01:11:22:33:44'), {self.device.id})
+        # 最后8个字符命中，但完整子串不存在
+        self.assertEqual(self.search('device', '99:00:01:00:01:11:22'), set())
+
+    def test_ipv6_and_interface_id(self):
+        self.assertEqual(self.search('pretty', '2233:4455', fields=('ipv6', 'iid')), {self.pretty.id})
+        self.assertEqual(self.search('pretty', '1010001122', fields=('ipv6', 'iid')), {self.pretty.id})
+
+    def test_entry_fields_fit_source_values(self):
+        # 索引值不会比来源字段更长，否则 MySQL 严格模式下保存记录时重建索引失败
+        entry = models.SearchEntry._meta
+        self.assertGreaterEqual(entry.get_field('ipv6').max_length, models.PrettyNum._meta.get_field('ipv6_address').max_length)
+        self.assertGreaterEqual(entry.get_field('mac').max_length, models.PrettyNum._meta.get_field('mac_address').max_length)
+        self.assertGreaterEqual(entry.get_field('duid').max_length, models.Device._meta.get_field('duid').max_length)
+
+    def test_index_follows_save_and_delete(self):
+        self.other.mac_address = "02:00:00:00:AB:CD"
+        self.other.save()
+        self.assertEqual(self.search('device', 'ab:cd'), {self.other.id})
+        other_id = self.other.id
+        self.other.delete()
+        self.assertEqual(self.search('device', 'ab:cd'), set())
+        self.assertFalse(models.SearchGram.objects.filter(kind='device', object_id=other_id).exists())
+
+    def test_save_without_indexed_fields_skips_reindex(self):
+        self.pretty.send_status = "sent"
+        with CaptureQueriesContext(connection) as queries:
+            self.pretty.save(update_fields=["send_status"])
+        self.assertFalse([q for q in queries.captured_queries if "search" in q["sql"]])
+
+        self.pretty.mac_address = "02:00:00:00:AB:CD"
+        self.pretty.save(update_fields=["mac_address", "send_status"])
+        self.assertEqual(self.search('pretty', 'ab:cd'), {self.pretty.id})
+
+
+class Ipv6GeneratorBatchTests(TestCase):
+    """ generate_ipv6_batch：numpy 和纯Python两条路径的输出都与逐个调用 generate_ipv6 一致 """
+
+    # 覆盖接口ID四个16位分组全部的零组组合（决定 :: 压缩的位置）
+    MACS = [
+        "00:00:00:00:00:00", "00:00:00:00:00:01", "00:00:00:01:00:00", "00:01:00:00:00:00",
+        "12:34:00:00:ab:cd", "12:34:56:78:00:00", "00:00:56:78:9a:bc", "AB:CD:EF:01:23:45",
+    ]
+
+    def cases(self):
+        rnd = random.Random(1)
+        rows = [(department, building, service, mac)
+                for department in (0, 1, 15) for building in (0, 1, 255) for service in (0, 15) for mac in self.MACS]
+        rows += [(rnd.randrange(16), rnd.randrange(256), rnd.randrange(16),
+                  ":".join(f"{rnd.randrange(256):02x}" for _ in range(6))) for _ in range(500)]
+        return [list(column) for column in zip(*rows)]
+
+    def assertParity(self):
+        departments, buildings, services, macs = self.cases()
+        expected = [generate_ipv6(*row) for row in zip(departments, buildings, services, macs)]
+        self.assertEqual(generate_ipv6_batch(departments, buildings, services, macs), expected)
+        # 标量参数广播到每一行
+        self.assertEqual(generate_ipv6_batch(0, 0, 0, self.MACS), [generate_ipv6(0, 0, 0, mac) for mac in self.MACS])
+
+    @skipUnless(ipv6_generator.np is not None, "未安装 numpy")
+    def test_numpy_path_matches_scalar(self):
+        self.assertParity()
+
+    def test_python_path_matches_scalar(self):
+        with mock.patch.object(ipv6_generator, "np", None):
+            self.assertParity()
+
+    def test_errors_name_the_row(self):
+        for np_module in {ipv6_generator.np, None}:
+            with mock.patch.object(ipv6_generator, "np", np_module):
+                with self.assertRaisesMessage(ValueError, "第1行: 楼栋编号必须在 0-255 范围内"):
+                    generate_ipv6_batch(1, [1, 256], 1, self.MACS[:2])
+                with self.assertRaisesMessage(ValueError, "第2行: MAC 地址包含非十六进制字符"):
+                    generate_ipv6_batch(1, 1, 1, self.MACS[:2] + ["zz:00:00:00:00:00"])
+                with self.assertRaisesMessage(ValueError, "与MAC地址数量(2)不一致"):
+                    generate_ipv6_batch([1], 1, 1, self.MACS[:2])
+        self.assertEqual(generate_ipv6_batch(1, 1, 1, []), [])
+
+
+class AddressQueryTests(TestCase):
+    """ 按 (ipv6_prefix, ipv6_iid) 整数列的地址查询：等值、区间、网段、部门/楼栋/业务类型 """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a = models.PrettyNum.objects.create(ipv6_address=generate_ipv6(1, 1, 1, "02:00:00:00:00:01"))
+        cls.b = models.PrettyNum.objects.create(ipv6_address=generate_ipv6(1, 2, 1, "02:00:00:00:00:02"))
+        cls.c = models.PrettyNum.objects.create(ipv6_address=generate_ipv6(2, 1, 3, "02:00:00:00:00:03"))
+        cls.other = models.PrettyNum.objects.create(ipv6_address="2001:db8::1")
+
+    def ids(self, queryset):
+        return set(queryset.values_list("id", flat=True))
+
+    def test_by_address_any_spelling(self):
+        exploded = ipaddress.IPv6Address(self.a.ipv6_address).exploded.upper()
+        self.assertEqual(self.ids(models.PrettyNum.objects.by_address(exploded)), {self.a.id})
+
+    def test_range_and_network(self):
+        self.assertEqual(self.ids(models.PrettyNum.objects.address_range(self.a.ipv6_address, self.b.ipv6_address)),
+                         {self.a.id, self.b.id})
+        # 部门编号是接口ID的最高4位
+        self.assertEqual(self.ids(models.PrettyNum.objects.in_network("240c:c901:a:a:1000::/68")), {self.a.id, self.b.id})
+        self.assertEqual(self.ids(models.PrettyNum.objects.in_network("::/0")),
+                         {self.a.id, self.b.id, self.c.id, self.other.id})
+
+    def test_in_slot(self):
+        self.assertEqual(self.ids(models.PrettyNum.objects.in_slot(department=1)), {self.a.id, self.b.id})
+        self.assertEqual(self.ids(models.PrettyNum.objects.in_slot(department=1, building=1)), {self.a.id})
+        # 只指定低位字段时在范围扫描的结果上按位过滤
+        self.assertEqual(self.ids(models.PrettyNum.objects.in_slot(service=3)), {self.c.id})
+        self.assertEqual(self.ids(models.PrettyNum.objects.in_slot(building=1)), {self.a.id, self.c.id})
+        with self.assertRaises(ValueError):
+            models.PrettyNum.objects.in_slot(department=16)
+
+
+class Ipv6IntMigrationTests(TestCase):
+    """ 0007 迁移：改表之前检查写法不同的重复地址 """
+
+    migration = importlib.import_module("app01.migrations.0007_prettynum_ipv6_int")
+
+    def test_duplicate_addresses_reported(self):
+        first = models.PrettyNum.objects.create(ipv6_address="240c:c901:a:a::1")
+        second = models.PrettyNum.objects.create(ipv6_address="240c:c901:a:a::2")
+        models.PrettyNum.objects.create(ipv6_address="not-an-address")
+        self.migration.check_duplicate_addresses(django_apps, None)
+
+        # 完整格式的同一地址（update() 不经过 save()，模拟迁移前的旧数据）
+        models.PrettyNum.objects.filter(id=second.id).update(ipv6_address="240C:C901:000A:000A:0:0:0:1")
+        with self.assertRaisesMessage(RuntimeError, f"240c:c901:a:a::1: 记录ID {[first.id, second.id]}"):
+            self.migration.check_duplicate_addresses(django_apps, None)
+
+
+class AddressAllocatorTests(TestCase):
+    """ 进程内地址分配表：冲突检查不查库，随记录保存/删除同步 """
+
+    MAC = "02:00:00:00:00:01"
+
+    def setUp(self):
+        # 每个用例使用新的分配表，避免其他用例回滚的数据残留在进程内
+        address_allocator._allocator = None
+        self.allocator = address_allocator.get_allocator()
+        self.address = generate_ipv6(1, 2, 3, self.MAC)
+
+    def test_free_address_needs_no_query(self):
+        self.allocator.check(self.address)  # 首次访问加载槽位
+        with self.assertNumQueries(0):
+            self.allocator.check(generate_ipv6(1, 2, 3, "02:00:00:00:00:02"))
+
+    def test_conflict(self):
+        obj = models.PrettyNum.objects.create(ipv6_address=self.address, mac_address=self.MAC)
+        self.allocator.check(self.address, owner_id=obj.id)
+        with self.assertRaises(AddressConflict):
+            self.allocator.check(self.address)
+
+    def test_follows_save_and_delete(self):
+        self.assertFalse(self.allocator.is_allocated(self.address))
+        obj = models.PrettyNum.objects.create(ipv6_address=self.address, mac_address=self.MAC)
+        self.assertTrue(self.allocator.is_allocated(self.address))
+        obj.delete()
+        self.assertFalse(self.allocator.is_allocated(self.address))
+
+    def test_next_free(self):
+        models.PrettyNum.objects.create(ipv6_address=generate_ipv6(1, 2, 3, "00:00:00:00:00:01"))
+        self.assertEqual(self.allocator.next_free(1, 2, 3), generate_ipv6(1, 2, 3, "00:00:00:00:00:02"))
+
+    def test_verify_reloads_stale_slot(self):
+        self.allocator.is_allocated(self.address)
+        obj = models.PrettyNum.objects.create(ipv6_address=generate_ipv6(1, 2, 3, "02:00:00:00:00:02"))
+        # update() 不发信号，分配表中仍是旧地址，核对时才同步为新地址
+        models.PrettyNum.objects.filter(id=obj.id).update(ipv6_iid=obj.ipv6_iid - 1)
+        self.assertEqual(self.allocator.verify_all(), {address_allocator.slot_key(1, 2, 3): (1, 1)})
+
+
+class ApprovalImportTests(TestCase):
+    """ 设备审批批量导入：整批校验、整批查重、bulk_create 写入 """
+
+    HEADER = "user,department,building,business_type,duid,mac\n"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = models.Department.objects.create(title="网络中心")
+        models.DeviceApproval.objects.create(user="old", department=cls.department, mac_address="02:00:00:00:00:01")
+        # 已有记录中其他写法的MAC
+        models.Device.objects.create(department=cls.department, create_time=timezone.now(), mac_address="02-00-00-00-00-0a")
+        models.DeviceApproval.objects.create(user="old", department=cls.department, mac_address="02000000000B")
+
+    def run_import(self, text, fmt="csv", chunk_size=100):
+        return import_approvals(iter_rows(io.StringIO(text), fmt), chunk_size=chunk_size)
+
+    def test_validation_and_duplicates(self):
+        report = self.run_import(self.HEADER + "\n".join([
+            f"a,{self.department.id},1,1,00:01:aa,02:00:00:00:00:02",
+            "b,网络中心,2,2,,02-00-00-00-00-03",   # 部门名称、横线分隔的MAC
+            f"c,{self.department.id},99,1,,02:00:00:00:00:04",  # 楼栋越界
+            "d,不存在,1,1,,02:00:00:00:00:05",
+            f"e,{self.department.id},1,1,,zz",
+            f"f,{self.department.id},1,1,,02:00:00:00:00:01",  # 与已有记录重复
+            f"g,{self.department.id},1,1,00:01:aa,02:00:00:00:00:06",  # 与本批前面的行DUID重复
+            f"h,{self.department.id},1,1,,02:00:00:00:00:0A",  # 与已有设备重复（横线分隔、小写）
+            f"i,{self.department.id},1,1,,02:00:00:00:00:0b",  # 与已有审批重复（不带分隔符）
+        ]))
+        self.assertEqual((report.total, report.created, report.invalid, report.duplicate), (9, 2, 3, 4))
+        self.assertEqual([line for line, _ in sorted(report.errors)], [4, 5, 6, 7, 8, 9, 10])
+        self.assertTrue(models.DeviceApproval.objects.filter(mac_address="02:00:00:00:00:03", status=2).exists())
+        # bulk_create 不发信号，导入时补建了搜索索引
+        self.assertEqual(len(search_ids('approval', '00:00:03')), 1)
+
+    def test_queries_per_chunk_are_constant(self):
+        lines = [f'{{"user": "u{i}", "department": {self.department.id}, "building": 1, "business_type": 1, '
+                 f'"mac": "02:00:00:00:01:{i:02X}"}}' for i in range(20)]
+        # 查部门1条；每批：查重1条 + 保存点2条 + bulk_create 1条 + 搜索索引2条（SQLite 回填主键，不需要再按MAC取回）
+        with self.assertNumQueries(1 + 2 * 6):
+            report = self.run_import("\n".join(lines), fmt="jsonl", chunk_size=10)
+        self.assertEqual(report.created, 20)
+
+    def upload(self, text):
+        self.addCleanup(shutil.rmtree, self.upload_dir, True)
+        with override_settings(APPROVAL_IMPORT_DIR=self.upload_dir):
+            return start_import_job(SimpleUploadedFile("approvals.csv", text.encode()), "csv")
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+
+    def test_import_job_runs_in_worker(self):
+        job_id = self.upload(self.HEADER + f"a,{self.department.id},1,1,,02:00:00:00:00:02\n")
+        progress = get_import_progress(job_id)
+        self.assertEqual((progress["status"], progress["finished"]), ("pending", False))
+
+        call_command("approval_import_worker", "--once", stdout=io.StringIO())
+        progress = get_import_progress(job_id)
+        self.assertEqual((progress["status"], progress["created"], progress["finished"]), ("done", 1, True))
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        self.assertIsNone(get_import_progress(job_id + 1))
+
+    def test_import_job_lease(self):
+        job_id = self.upload(self.HEADER + f"a,{self.department.id},1,1,,02:00:00:00:00:02\n")
+        job = claim_import_job(lease_seconds=60)
+        self.assertEqual(job.id, job_id)
+        # 租期内不会被重复领取；租期过后（worker 异常退出）被重新领取，原来的 worker 不再写回进度
+        self.assertIsNone(claim_import_job())
+        models.ApprovalImportJob.objects.filter(id=job_id).update(available_time=timezone.now())
+        again = claim_import_job()
+        self.assertIsNone(run_import_job(job))
+        self.assertEqual(models.ApprovalImportJob.objects.get(id=job_id).status, "running")
+        self.assertEqual(run_import_job(again).created, 1)
+        self.assertEqual(get_import_progress(job_id)["status"], "done")
+
+
+class BulkApprovalTests(TestCase):
+    """ 设备审批批量同意/拒绝：每批固定条数的SQL，KEA发送进入队列 """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = models.Department.objects.create(title="网络中心")
+        cls.approvals = [
+            models.DeviceApproval.objects.create(
+                user=f"u{i}", department=cls.department, building=1, business_type=1,
+                duid=f"00:03:00:01:00:{i:02X}", mac_address=f"02:00:00:00:02:{i:02X}",
+            )
+            for i in range(6)
+        ]
+        # 已登记为设备的MAC，同意时跳过
+        models.Device.objects.create(
+            department=cls.department, create_time=timezone.now(), mac_address="02:00:00:00:02:05",
+        )
+        models.DeviceApproval.objects.filter(id=cls.approvals[4].id).update(status=0)
+
+    def setUp(self):
+        address_allocator._allocator = None
+        session = self.client.session
+        session["info"] = {"id": 1, "name": "admin"}
+        session.save()
+
+    def test_approve(self):
+        ids = [obj.id for obj in self.approvals]
+        result = approve_approvals(ids, callback_url="http://callback/", chunk_size=2)
+        self.assertEqual(result.done, 4)
+        self.assertEqual(sorted(approval_id for approval_id, _ in result.skipped), ids[4:])
+        self.assertEqual(models.DeviceApproval.objects.filter(status=1).count(), 4)
+        pretty = models.PrettyNum.objects.get(mac_address="02:00:00:00:02:00")
+        self.assertEqual(pretty.ipv6_address, generate_ipv6(self.department.id, 1, 1, "02:00:00:00:02:00"))
+        self.assertEqual(pretty.send_status, "pending")
+        self.assertEqual(models.KeaOutbox.objects.filter(callback_url="http://callback/").count(), 4)
+        self.assertEqual(models.Device.objects.get(mac_address="02:00:00:00:02:01").duid, "00:03:00:01:00:01")
+        # bulk_create 不发信号，搜索索引和地址分配表已同步
+        self.assertEqual(set(search_ids('pretty', '00:02:03')), {models.PrettyNum.objects.get(
+            mac_address="02:00:00:00:02:03").id})
+        self.assertTrue(address_allocator.get_allocator().is_allocated(pretty.ipv6_address))
+
+    def test_existing_ipv6_record_is_reused(self):
+        old = models.PrettyNum.objects.create(user="old", ipv6_address="240c::1", mac_address="02:00:00:00:02:00")
+        approve_approvals([self.approvals[0].id])
+        old.refresh_from_db()
+        self.assertEqual(old.user, "u0")
+        self.assertEqual(models.PrettyNum.objects.filter(mac_address="02:00:00:00:02:00").count(), 1)
+
+    def test_queries_per_chunk_are_constant(self):
+        ids = [obj.id for obj in self.approvals[:4]]
+        with CaptureQueriesContext(connection) as one_chunk:
+            approve_approvals(ids, chunk_size=4)
+        models.DeviceApproval.objects.filter(id__in=ids).update(status=2)
+        models.PrettyNum.objects.all().delete()
+        models.Device.objects.exclude(mac_address="02:00:00:00:02:05").delete()
+        address_allocator._allocator = None
+        with CaptureQueriesContext(connection) as two_chunks:
+            approve_approvals(ids, chunk_size=2)
+        # 第二批比第一批多出的只有事务和各条批量语句，与条数无关
+        self.assertLessEqual(len(two_chunks), 2 * len(one_chunk))
+
+    def test_reject(self):
+        result = reject_approvals([self.approvals[0].id, self.approvals[4].id])
+        self.assertEqual(result.done, 1)
+        self.assertEqual([approval_id for approval_id, _ in result.skipped], [self.approvals[4].id])
+        self.assertEqual(models.DeviceApproval.objects.get(id=self.approvals[0].id).status, 0)
+
+    def test_json_api(self):
+        response = self.client.post(
+            "/device/approval/bulk/", data={"action": "approve", "ids": [self.approvals[0].id]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(response.json()["done"], 1)
+
+    def test_form_post(self):
+        response = self.client.post(
+            "/device/approval/bulk/", data={"action": "reject", "ids": [self.approvals[0].id, self.approvals[1].id]},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(models.DeviceApproval.objects.filter(status=0).count(), 3)
+
+
+class BindingExportTests(TestCase):
+    """ IPv6绑定流式导出为 KEA reservations / CSV """
+
+    @classmethod
+    def setUpTestData(cls):
+        department = models.Department.objects.create(title="部门")
+        for i in range(5):
+            models.PrettyNum.objects.create(
+                user=f"u{i}", ipv6_address=f"240c:c901:a:a:1010:1:0:{i + 1}", mac_address=f"02:00:00:00:00:{i:02X}",
+            )
+        models.Device.objects.create(
+            department=department, create_time=timezone.now(), mac_address="02:00:00:00:00:01", duid="00:03:00:01:aa",
+        )
+
+    def test_json_reservations(self):
+        data = json.loads("".join(export_bindings('json', chunk_size=2)))
+        reservations = data["reservations"]
+        self.assertEqual(len(reservations), 5)
+        self.assertEqual(reservations[0]["hw-address"], "02:00:00:00:00:00")
+        # 有DUID时用 duid 作为唯一标识
+        self.assertEqual(reservations[1]["duid"], "00:03:00:01:aa")
+        self.assertNotIn("hw-address", reservations[1])
+        self.assertEqual(reservations[1]["ip-addresses"], ["240c:c901:a:a:1010:1:0:2"])
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO("".join(export_bindings('csv')))))
+        self.assertEqual(rows[0], ["record_id", "user", "ipv6_address", "hw_address", "duid"])
+        self.assertEqual(rows[2][3:], ["02:00:00:00:00:01", "00:03:00:01:aa"])
+
+    def test_queries_per_page(self):
+        # 每页：取记录1条 + 查DUID 1条；最后一页为空
+        with self.assertNumQueries(3 * 2 + 1):
+            list(export_bindings('csv', chunk_size=2))
+
+    def test_view_streams(self):
+        session = self.client.session
+        session["info"] = {"id": 1, "name": "admin"}
+        session.save()
+        response = self.client.get("/pretty/export/?format=csv")
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 6)
+
+
+class ReconcileTests(TestCase):
+    """ 导出文件与IPv6记录的排序归并核对 """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.records = [
+            models.PrettyNum.objects.create(
+                user=f"u{i}", ipv6_address=f"240c:c901:a:a:1010:1:0:{i + 1}", mac_address=f"02:00:00:00:00:{i:02X}",
+                send_status="bound" if i < 3 else "pending",
+            )
+            for i in range(4)
+        ]
+
+    def run_reconcile(self, lines, fmt="leases", **kwargs):
+        diffs = []
+        report = reconcile(iter_dump(io.StringIO("\n".join(lines)), fmt), on_diff=diffs.append, run_size=2, **kwargs)
+        return report, {(diff["kind"], diff["record_id"] or diff["kea_address"]) for diff in diffs}
+
+    def test_leases_by_address(self):
+        report, diffs = self.run_reconcile([
+            "address,duid,valid_lifetime,expire,subnet_id,pref_lifetime,lease_type,iaid,prefix_len,hwaddr",
+            "240c:c901:a:a:1010:1:0:4,00:03,3600,0,1,3600,0,1,128,02:00:00:00:00:03",
+            "240c:c901:a:a:1010:1:0:1,00:03,3600,0,1,3600,0,1,128,02:00:00:00:00:00",
+            "240c:c901:a:a:1010:1:0:2,00:03,3600,0,1,3600,0,1,128,02:00:00:00:00:FF",  # MAC不一致
+            "240c:c901:a:a:1010:1:0:99,00:03,3600,0,1,3600,0,1,128,02:00:00:00:00:09",  # 库中没有
+            "not-an-address,,,,,,,,,",
+        ])
+        self.assertEqual((report.matched, report.missing, report.extra, report.mismatch), (2, 1, 1, 1))
+        self.assertEqual(report.bad_lines, 1)
+        self.assertEqual(diffs, {
+            ("mismatch", self.records[1].id), ("missing", self.records[2].id),
+            ("extra", "240c:c901:a:a:1010:1:0:99"),
+        })
+
+    def test_reservations_by_mac_with_fix(self):
+        lines = list(export_bindings('json'))
+        lines = "".join(lines).replace("1010:1:0:3", "1010:1:0:33").splitlines()
+        report, diffs = self.run_reconcile(lines, fmt="reservations", key="mac", fix=True)
+        self.assertEqual((report.matched, report.mismatch), (3, 1))
+        self.assertEqual(diffs, {("mismatch", self.records[2].id)})
+        self.assertEqual((report.fixed_bound, report.fixed_failed), (1, 1))
+        self.assertEqual(models.PrettyNum.objects.get(id=self.records[3].id).send_status, "bound")
+        failed = models.PrettyNum.objects.get(id=self.records[2].id)
+        self.assertEqual(failed.send_status, "failed")
+        self.assertIsNotNone(failed.next_retry_time)
+
+    def test_external_sort(self):
+        self.assertEqual(list(external_sort(iter(["c", "a", "d", "b", "e"]), run_size=2)), ["a", "b", "c", "d", "e"])
+
+
+class KeaCallbackTests(TestCase):
+    """ kea_callback：按主键的条件 UPDATE，重复投递按幂等键直接返回 """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.record = models.PrettyNum.objects.create(
+            ipv6_address="240c:c901:a:a:1010:11:2233:4455", mac_address="02:00:00:00:00:01",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def callback(self, idempotency_key=None, **data):
+        extra = {"HTTP_IDEMPOTENCY_KEY": idempotency_key} if idempotency_key else {}
+        return self.client.post(
+            "/api/kea/callback/", data=json.dumps(data), content_type="application/json", **extra
+        ).json()
+
+    def test_success(self):
+        with self.assertNumQueries(2):
+            result = self.callback(success=1, record_id=str(self.record.id))
+        self.assertEqual(result["result"], "success")
+        self.assertEqual(result["processed_ipv6_suffix"], "1010:0011:2233:4455")
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.send_status, "bound")
+
+    def test_duplicate_is_noop(self):
+        first = self.callback(idempotency_key="k1", success=1, record_id=str(self.record.id))
+        with self.assertNumQueries(0):
+            again = self.callback(idempotency_key="k1", success=1, record_id=str(self.record.id))
+        self.assertTrue(again["duplicate"])
+        self.assertEqual(again["record_id"], first["record_id"])
+
+    def test_same_body_after_resend_is_applied(self):
+        """ 没有幂等键时不按请求体去重：记录重发后相同请求体的回调照常生效 """
+        self.callback(success=1, record_id=str(self.record.id))
+        models.PrettyNum.objects.filter(id=self.record.id).update(send_status="pending")
+        result = self.callback(success=1, record_id=str(self.record.id))
+        self.assertNotIn("duplicate", result)
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.send_status, "bound")
+
+    def test_stale_failure_does_not_override_bound(self):
+        self.callback(success=1, record_id=str(self.record.id))
+        result = self.callback(success=0, message="超时", record_id=str(self.record.id))
+        self.assertTrue(result["success"])
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.send_status, "bound")
+
+    def test_batch_stale_failure_does_not_override_bound(self):
+        self.callback(success=1, record_id=str(self.record.id))
+        result = self.callback(results=[{"success": 0, "message": "超时", "record_id": str(self.record.id)}])
+        self.assertEqual((result["updated"], result["skipped"]), (0, 1))
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.send_status, "bound")
+
+    def test_mac_fallback_and_miss(self):
+        result = self.callback(success=1, record_id="999", processed_mac="02:00:00:00:00:01")
+        self.assertEqual(result["processed_mac"], "02:00:00:00:00:01")
+        self.assertFalse(self.callback(success=1, record_id="998")["success"])
+        # 处理失败的回调不记幂等键，重试时重新处理
+        self.assertFalse(self.callback(idempotency_key="k2", success=1, record_id="998")["success"])
+        self.assertNotIn("duplicate", self.callback(idempotency_key="k2", success=1, record_id="998"))
+
+
+class CaptchaPoolTests(TestCase):
+    """ 预生成的验证码池：命中时直接返回，池为空时现场生成 """
+
+    def setUp(self):
+        self.rendered = 0
+
+        def render():
+            self.rendered += 1
+            return b"png", f"CODE{self.rendered}"
+
+        self.pool = captcha_pool.CaptchaPool(size=2, render=render, autostart=False)
+        self.addCleanup(setattr, captcha_pool, "_pool", captcha_pool._pool)
+        captcha_pool._pool = self.pool
+
+    def test_hit_and_miss(self):
+        self.pool.fill()
+        self.assertEqual([self.pool.get()[1] for _ in range(3)], ["CODE1", "CODE2", "CODE3"])
+        self.assertEqual(self.pool.snapshot(), {"hits": 2, "misses": 1, "hit_ratio": 0.6667, "produced": 2, "size": 0})
+
+    def test_view_uses_pool(self):
+        self.pool.fill()
+        response = self.client.get("/image/code/")
+        self.assertEqual(response.content, b"png")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(self.client.session["image_code"], "CODE1")
+
+    def test_producer_backs_off_on_failure(self):
+        outcomes = iter([False, False, False, True, False])
+
+        def render():
+            if not next(outcomes):
+                raise OSError("cannot open resource")
+            return b"png", "CODE"
+
+        class Stop(Exception):
+            pass
+
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 4:
+                raise Stop
+
+        pool = captcha_pool.CaptchaPool(size=2, render=render, autostart=False)
+        with mock.patch("app01.utils.captcha_pool.time.sleep", side_effect=sleep), self.assertLogs("app01.utils.captcha_pool"):
+            with self.assertRaises(Stop):
+                pool._produce()
+        # 成功一次后退避时间重新从头开始
+        self.assertEqual(sleeps, [1, 2, 4, 1])
+        self.assertEqual(pool.snapshot()["produced"], 1)
+
+    @override_settings(CAPTCHA_POOL_SIZE=0)
+    def test_pool_disabled(self):
+        response = self.client.get("/image/code/")
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+        self.assertEqual(len(self.client.session["image_code"]), 5)
+
+
+@override_settings(CAPTCHA_STATELESS=True, CAPTCHA_POOL_SIZE=0)
+class CaptchaTokenTests(TestCase):
+    """ 无状态验证码：答案在签名令牌中，不读写会话，令牌只能用一次 """
+
+    @classmethod
+    def setUpTestData(cls):
+        models.Admin.objects.create(username="admin", password=md5("secret"))
+
+    def login(self, code):
+        return self.client.post("/login/", data={
+            "username": "admin", "password": "secret", "code": code, "identity": "admin",
+        })
+
+    def test_image_code_does_not_touch_session(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/image/code/")
+        self.assertIn(CAPTCHA_COOKIE, response.cookies)
+        self.assertNotIn("sessionid", response.cookies)
+
+    def test_login_and_replay(self):
+        self.client.cookies[CAPTCHA_COOKIE] = make_token("ABCDE")
+        response = self.login("abcde")
+        self.assertRedirects(response, "/admin/list/", fetch_redirect_response=False)
+        # 同一个令牌不能再用
+        self.client.cookies[CAPTCHA_COOKIE] = self.client.cookies[CAPTCHA_COOKIE].value
+        self.assertContains(self.login("abcde"), "验证码已使用")
+
+    def test_wrong_answer_and_tampering(self):
+        self.assertIsNone(check_token(make_token("ABCDE"), "abcde", nonces=NonceCache()))
+        self.assertEqual(check_token(make_token("ABCDE"), "ABCDF", nonces=NonceCache()), "验证码错误")
+        self.assertEqual(check_token(make_token("ABCDE") + "x", "ABCDE", nonces=NonceCache()), "验证码已失效，请刷新验证码")
+
+    @override_settings(CAPTCHA_TOKEN_MAX_AGE=-1)
+    def test_expired(self):
+        self.assertEqual(check_token(make_token("ABCDE"), "ABCDE", nonces=NonceCache()), "验证码已过期，请刷新验证码")
+
+    def test_nonce_cache_evicts_expired(self):
+        nonces = NonceCache(capacity=2)
+        self.assertTrue(nonces.use("a", ttl=-1))
+        self.assertTrue(nonces.use("a", ttl=60))  # 已过期的随机数被淘汰
+        self.assertFalse(nonces.use("a", ttl=60))
+        nonces.use("b", ttl=60)
+        # 记满时拒绝新的令牌，不淘汰未过期的随机数（淘汰后令牌可以重放）
+        with self.assertRaises(NonceCacheFull):
+            nonces.use("c", ttl=60)
+        self.assertFalse(nonces.use("a", ttl=60))
+        self.assertEqual(len(nonces), 2)
+
+    def test_full_nonce_cache_fails_closed(self):
+        nonces = NonceCache(capacity=1)
+        self.assertIsNone(check_token(make_token("ABCDE"), "ABCDE", nonces=nonces))
+        self.assertEqual(check_token(make_token("ABCDE"), "ABCDE", nonces=nonces), "登录请求过多，请稍后刷新验证码重试")
+
+
+
+@override_settings(KEA_CALLBACK_INGEST_MODE="buffered")
+class CallbackIngestTests(TestCase):
+    """ 合并写回模式：视图只入队，写回时一个事务写回一组回调 """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.records = [
+            models.PrettyNum.objects.create(
+                ipv6_address=f"240c:c901:a:a:1010:11:2233:{i}", mac_address=f"02:00:00:00:00:{i:02X}",
+            )
+            for i in range(1, 4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.spool_dir = tempfile.mkdtemp()
+        self.buffer = callback_ingest.CallbackBuffer(spool_dir=self.spool_dir, autostart=False)
+        self.addCleanup(setattr, callback_ingest, "_buffer", callback_ingest._buffer)
+        callback_ingest._buffer = self.buffer
+
+    def callback(self, data):
+        return self.client.post("/api/kea/callback/", data=json.dumps(data), content_type="application/json").json()
+
+    def status(self, record):
+        record.refresh_from_db()
+        return record.send_status
+
+    def test_view_enqueues_without_queries(self):
+        with self.assertNumQueries(0):
+            result = self.callback({"success": 1, "record_id": str(self.records[0].id)})
+        self.assertTrue(result["queued"])
+        self.assertEqual(self.status(self.records[0]), "pending")
+        self.assertFalse(self.callback({"success": 1})["success"])
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.status(self.records[0]), "bound")
+        self.assertEqual(self.buffer.snapshot()["commits"], 1)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_group_applies_in_arrival_order(self):
+        first, second, third = self.records
+        result = self.callback({"results": [
+            {"success": 1, "record_id": str(first.id)},
+            {"success": 0, "message": "超时", "record_id": str(first.id)},
+            {"success": 0, "message": "超时", "record_id": str(second.id)},
+            {"success": 1, "record_id": str(second.id)},
+            {"success": 1, "record_id": "999", "processed_mac": third.mac_address},
+            {"success": 1, "record_id": "998"},
+            {"success": 1},
+        ]})
+        self.assertEqual((result["queued"], result["invalid"]), (6, 1))
+        with self.assertNumQueries(5):  # 事务开始/结束、按主键加锁、按MAC兜底、bulk_update
+            self.buffer.flush()
+        self.assertEqual([self.status(record) for record in self.records], ["bound", "bound", "bound"])
+        snapshot = self.buffer.snapshot()
+        self.assertEqual((snapshot["flushed"], snapshot["updated"], snapshot["not_found"]), (6, 3, 1))
+
+    def test_failed_flush_keeps_items(self):
+        self.buffer.apply = lambda items: 1 / 0
+        self.callback({"success": 1, "record_id": str(self.records[0].id)})
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.snapshot()["pending"], 1)
+        self.assertEqual(len(callback_ingest.spool_files(self.spool_dir)), 1)
+
+        self.buffer.apply = callback_ingest.apply_callback_results
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(callback_ingest.spool_files(self.spool_dir), [])
+
+    def test_out_of_range_record_id_rejected(self):
+        result = self.callback({"success": 1, "record_id": str(10 ** 20)})
+        self.assertEqual(result["message"], "record_id缺失或格式错误")
+        self.assertEqual(self.buffer.snapshot()["pending"], 0)
+
+    def test_failing_item_isolated_and_dead_lettered(self):
+        first, second, third = self.records
+
+        def apply(items):
+            if any(item["record_id"] == second.id for item in items):
+                raise ValueError("bad row")
+            return callback_ingest.apply_callback_results(items)
+
+        self.buffer.apply = apply
+        self.callback({"results": [{"success": 1, "record_id": str(record.id)} for record in self.records]})
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual([self.status(record) for record in self.records], ["bound", "pending", "bound"])
+        self.assertEqual(self.buffer.snapshot()["pending"], 1)
+
+        # 后到的回调不会被出错的回调挡住
+        self.callback({"success": 0, "message": "超时", "record_id": str(first.id)})
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.flush(), 0)
+        snapshot = self.buffer.snapshot()
+        self.assertEqual((snapshot["pending"], snapshot["dead_lettered"]), (0, 1))
+        self.assertEqual(callback_ingest.spool_files(self.spool_dir), [])
+        with open(os.path.join(self.spool_dir, callback_ingest.DEAD_LETTER_FILE), encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["record_id"] for line in f], [second.id])
+
+    def test_database_error_keeps_whole_group(self):
+        def apply(items):
+            raise OperationalError("connection lost")
+
+        self.buffer.apply = apply
+        self.callback({"results": [{"success": 1, "record_id": str(record.id)} for record in self.records]})
+        self.assertEqual(self.buffer.flush(), 0)
+        snapshot = self.buffer.snapshot()
+        self.assertEqual((snapshot["pending"], snapshot["errors"], snapshot["dead_lettered"]), (3, 1, 0))
+
+    def test_full_buffer_returns_503(self):
+        self.buffer.limit = 2
+        response = self.client.post("/api/kea/callback/", content_type="application/json", data=json.dumps(
+            {"results": [{"success": 1, "record_id": str(record.id)} for record in self.records]}))
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.json()["buffer_full"])
+        self.assertEqual(self.buffer.snapshot()["rejected"], 3)
+        self.assertEqual(self.buffer.snapshot()["pending"], 0)
+
+    def test_replay_spool(self):
+        self.callback({"success": 0, "message": "超时", "record_id": str(self.records[1].id)})
+        report = callback_ingest.replay_spool(self.spool_dir)
+        self.assertEqual((report["files"], report["updated"]), (1, 1))
+        self.assertEqual(self.status(self.records[1]), "bind_failed")
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+@override_settings(KEA_CALLBACK_SECRET="s3cret")
+class CallbackAuthTests(TestCase):
+    """ 机器回调只校验HMAC签名，不读会话、不查数据库 """
+
+    BODY = json.dumps({"success": 1, "record_id": "999"}).encode()
+
+    def post(self, path, headers=None):
+        extra = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in (headers or {}).items()}
+        return self.client.post(path, data=self.BODY, content_type="application/json", **extra)
+
+    def test_route_table(self):
+        self.assertEqual(resolve_route("/login/"), ROUTE_PUBLIC)
+        self.assertEqual(resolve_route("/api/kea/callback/"), ROUTE_SIGNED)
+        self.assertEqual(resolve_route("/api/ipv6/config/callback/"), ROUTE_SIGNED_OR_SESSION)
+        # 不在路由表中的回调地址不会被自动放行
+        self.assertIsNone(resolve_route("/api/new/thing/callback/"))
+        self.assertIsNone(resolve_route("/api/metrics/"))
+
+    def test_unsigned_rejected_without_queries(self):
+        for path in ("/api/kea/callback/", "/api/device/offline/callback/", "/api/ipv6/config/callback/"):
+            with self.assertNumQueries(0):
+                response = self.post(path)
+            self.assertEqual(response.status_code, 401)
+
+    def test_bad_signature_and_stale_timestamp(self):
+        headers = signature_headers(self.BODY, "wrong")
+        self.assertEqual(self.post("/api/kea/callback/", headers).status_code, 401)
+        headers = signature_headers(self.BODY, "s3cret", timestamp=int(time.time()) - 3600)
+        self.assertEqual(self.post("/api/kea/callback/", headers).json()["message"], "签名校验失败: 时间戳已过期")
+
+    def test_huge_timestamp_rejected(self):
+        headers = signature_headers(self.BODY, "s3cret", timestamp=10 ** 400)
+        response = self.post("/api/kea/callback/", headers)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["message"], "签名校验失败: 时间戳格式错误")
+
+    def test_signed_reaches_view(self):
+        response = self.post("/api/kea/callback/", signature_headers(self.BODY, "s3cret"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "未找到对应记录")
+
+    @override_settings(KEA_CALLBACK_SECRET="")
+    def test_no_secret_configured(self):
+        # 未配置密钥：KEA回调保持原来的免登录，设备下线和IPv6配置回调仍然要求登录
+        self.assertEqual(self.post("/api/kea/callback/").status_code, 200)
+        for path in ("/api/device/offline/callback/", "/api/ipv6/config/callback/"):
+            response = self.post(path, signature_headers(self.BODY, "anything"))
+            self.assertRedirects(response, "/login/", fetch_redirect_response=False)
+        session = self.client.session
+        session["info"] = {"id": 1, "name": "admin"}
+        session.save()
+        self.assertEqual(self.post("/api/device/offline/callback/").status_code, 200)
+
+
+class CircuitBreakerTests(TestCase):
+    """ KEA API 熔断器：失败比例/慢请求触发熔断，熔断中快速失败，半开试探后恢复 """
+
+    def setUp(self):
+        self.now = 1000.0
+        self.breaker = CircuitBreaker(window_size=4, min_calls=4, failure_rate=0.5, slow_call_seconds=5,
+                                      open_seconds=30, half_open_calls=1, clock=lambda: self.now)
+
+    def call(self, failed=False, seconds=0.1):
+        self.breaker.before_call()
+        self.breaker.record(failed, seconds)
+
+    def test_trip_reject_and_recover(self):
+        for failed in (False, True, False):
+            self.call(failed)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.call(seconds=6)  # 慢请求计为失败，4 次中 2 次失败
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.call()
+        self.assertEqual(cm.exception.retry_after, 30)
+
+        self.now += 30
+        self.breaker.before_call()  # 半开：放行一个试探请求
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.now += 30
+        self.call()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        snapshot = self.breaker.snapshot()
+        self.assertEqual((snapshot["trips"], snapshot["rejected"], snapshot["slow_calls"]), (2, 2, 1))
+
+    def test_open_breaker_fails_fast_into_retry(self):
+        for _ in range(4):
+            self.call(failed=True)
+        client = KeaClient(base_url="http://127.0.0.1:9", breaker=self.breaker)
+        self.addCleanup(setattr, kea_client, "_client", kea_client._client)
+        kea_client._client = client
+
+        result = send_device_offline_to_api(1, "00:01", "")
+        self.assertFalse(result["success"])
+        self.assertEqual(result["retry_after"], 30)
+        self.assertEqual(client.stats.snapshot()["requests"], 0)
+
+        record = models.PrettyNum(ipv6_address="240c:c901:a:a:1010:11:2233:4455", mac_address="02:00:00:00:00:01")
+        now = timezone.now()
+        self.assertFalse(apply_send_result(record, result, now))
+        self.assertEqual(record.send_status, "failed")
+        self.assertGreaterEqual((record.next_retry_time - now).total_seconds(), 30)
+
+
+@override_settings(KEA_RETRY_BASE_DELAY=30, KEA_RETRY_MAX_DELAY=3600, KEA_RETRY_MAX_ATTEMPTS=3)
+class KeaRetrySchedulerTests(TestCase):
+    """ 自动重试：退避时间、按租期领取、只写回仍由本次领取持有的记录 """
+
+    def setUp(self):
+        self.records = [
+            models.PrettyNum.objects.create(
+                ipv6_address=f"240c:c901:a:a:1010:11:2233:{i}", mac_address=f"02:00:00:00:01:{i:02X}",
+                send_status="failed", next_retry_time=timezone.now() - timedelta(seconds=1),
+            )
+            for i in range(1, 4)
+        ]
+
+    def test_backoff(self):
+        self.assertTrue(15 <= retry_delay(1) <= 30)
+        self.assertTrue(1800 <= retry_delay(20) <= 3600)
+        record = models.PrettyNum(retry_count=0)
+        now = timezone.now()
+        self.assertTrue(schedule_retry(record, now, min_delay=600))
+        self.assertGreaterEqual(record.next_retry_time - now, timedelta(seconds=600))
+        record.retry_count = 3
+        self.assertFalse(schedule_retry(record, now))
+        self.assertIsNone(record.next_retry_time)
+
+    def test_claim_respects_lease(self):
+        models.PrettyNum.objects.filter(id=self.records[2].id).update(next_retry_time=timezone.now() + timedelta(hours=1))
+        claimed = claim_due_retries(10, lease_seconds=60)
+        self.assertEqual([record.id for record in claimed], [self.records[0].id, self.records[1].id])
+        self.assertEqual({record.retry_count for record in claimed}, {1})
+        self.assertEqual(models.PrettyNum.objects.filter(send_status="retrying").count(), 2)
+        # 租期内不会被再次领取，租期过后重新领取
+        self.assertEqual(claim_due_retries(10), [])
+        models.PrettyNum.objects.filter(id=self.records[0].id).update(next_retry_time=timezone.now())
+        self.assertEqual([record.id for record in claim_due_retries(10)], [self.records[0].id])
+
+    def test_save_only_owned_claims(self):
+        first, second, third = claim_due_retries(10)
+        # 写回之前：second 已收到回调，third 租期过后被其他进程重新领取
+        models.PrettyNum.objects.filter(id=second.id).update(send_status="bound")
+        models.PrettyNum.objects.filter(id=third.id).update(last_send_time=timezone.now() + timedelta(seconds=1))
+        for record in (first, second, third):
+            apply_retry_result(record, {"success": True, "response_data": {"success": 1}})
+        self.assertEqual(save_retry_results([first, second, third]), 1)
+        self.assertEqual(
+            list(models.PrettyNum.objects.order_by("id").values_list("send_status", flat=True)),
+            ["pending", "bound", "retrying"],
+        )
+
+    def test_save_is_batched(self):
+        # 一次加锁查询 + 一次 bulk_update（另有事务的 SAVEPOINT/RELEASE），与记录数无关
+        records = claim_due_retries(10)
+        for record in records:
+            apply_retry_result(record, {"success": True, "response_data": {"success": 1}})
+        with self.assertNumQueries(4):
+            self.assertEqual(save_retry_results(records), 3)
+
+    def test_batch_fits_in_lease(self):
+        # 默认超时 连接3秒+读取10秒：60秒租期的 80% 内每个线程能发送 3 轮
+        self.assertEqual(lease_batch_limit(60, 4), 12)
+        self.assertEqual(lease_batch_limit(5, 4), 4)
+
+    @override_settings(KEA_CALLBACK_URL="")
+    def test_scheduler_requires_callback_url(self):
+        with self.assertRaises(CommandError):
+            call_command("kea_retry_scheduler", "--once", stdout=io.StringIO())
+
+    @override_settings(KEA_CALLBACK_URL="http://ipam.example/api/kea/callback/")
+    def test_scheduler_reuses_stored_callback_url(self):
+        # 入队时按请求地址保存的回调地址优先，没有时使用 settings.KEA_CALLBACK_URL
+        models.KeaOutbox.objects.create(pretty=self.records[0], callback_url="http://old.example/api/kea/callback/")
+        models.KeaOutbox.objects.create(pretty=self.records[0], callback_url="http://10.0.0.1/api/kea/callback/")
+        result = {"success": True, "status_code": 200, "response_data": {"success": 1}, "error": None}
+        with mock.patch("app01.management.commands.kea_retry_scheduler.send_to_kea_api", return_value=result) as send:
+            call_command("kea_retry_scheduler", "--once", stdout=io.StringIO())
+        self.assertEqual(
+            {c.args[0]: c.kwargs["callback_url"] for c in send.call_args_list},
+            {self.records[0].id: "http://10.0.0.1/api/kea/callback/",
+             self.records[1].id: "http://ipam.example/api/kea/callback/",
+             self.records[2].id: "http://ipam.example/api/kea/callback/"},
+        )
+
+    def test_manual_retry_sends_callback_url(self):
+        sent = []
+
+        def send(record_id, ipv6_address, mac_address, callback_url=None):
+            sent.append(callback_url)
+            return {"success": True, "status_code": 200, "response_data": {"success": 1}, "error": None}
+
+        with mock.patch("app01.management.commands.retry_ipv6_send.send_to_kea_api", side_effect=send):
+            with override_settings(KEA_CALLBACK_URL=""), self.assertRaises(CommandError):
+                call_command("retry_ipv6_send", stdout=io.StringIO())
+            call_command("retry_ipv6_send", callback_url="http://ipam.example/api/kea/callback/", stdout=io.StringIO())
+        self.assertEqual(sent, ["http://ipam.example/api/kea/callback/"] * 3)
+        self.assertEqual(models.PrettyNum.objects.filter(send_status="pending", retry_count=1).count(), 3)
+
+
+class KeaOutboxTests(TestCase):
+    """ KEA发送队列：入队、按租期领取、只完成仍由本次领取持有的记录 """
+
+    DELIVERED = {"success": True, "status_code": 200, "response_data": {"success": 1}, "error": None}
+    FAILED = {"success": False, "status_code": None, "response_data": None, "error": "无法连接到API服务器"}
+
+    def setUp(self):
+        self.records = [
+            models.PrettyNum.objects.create(
+                ipv6_address=f"240c:c901:a:a:1010:11:2233:{i}", mac_address=f"02:00:00:00:02:{i:02X}",
+                send_status="failed",
+            )
+            for i in range(1, 3)
+        ]
+        for record in self.records:
+            enqueue_kea_send(record, duid="00:01", callback_url="http://ipam.example/api/kea/callback/")
+
+    def status(self, model, obj_id):
+        return model.objects.values_list("send_status" if model is models.PrettyNum else "status", flat=True).get(id=obj_id)
+
+    def test_enqueue_and_claim(self):
+        self.assertEqual(self.status(models.PrettyNum, self.records[0].id), "pending")
+        entries = claim_outbox_batch(10, lease_seconds=60)
+        self.assertEqual([entry.pretty_id for entry in entries], [record.id for record in self.records])
+        self.assertEqual({(entry.status, entry.attempts) for entry in entries}, {("sending", 1)})
+        self.assertEqual(claim_outbox_batch(10), [])
+        # 租期过后重新领取
+        models.KeaOutbox.objects.update(available_time=timezone.now())
+        self.assertEqual(len(claim_outbox_batch(10)), 2)
+
+    def test_finish_entry(self):
+        delivered, failed = claim_outbox_batch(10)
+        self.assertTrue(finish_outbox_entry(delivered, self.DELIVERED))
+        self.assertFalse(finish_outbox_entry(failed, self.FAILED))
+        self.assertEqual(self.status(models.KeaOutbox, delivered.id), "done")
+        self.assertEqual(self.status(models.PrettyNum, delivered.pretty_id), "pending")
+        self.assertEqual(self.status(models.KeaOutbox, failed.id), "failed")
+        record = models.PrettyNum.objects.get(id=failed.pretty_id)
+        self.assertEqual(record.send_status, "failed")
+        self.assertIsNotNone(record.next_retry_time)
+
+    def test_lost_lease_is_not_written(self):
+        first, second = claim_outbox_batch(10)
+        # first 的租期过后被其他 worker 重新领取
+        models.KeaOutbox.objects.filter(id=first.id).update(available_time=timezone.now() + timedelta(minutes=5))
+        finish_outbox_entry(first, self.FAILED)
+        self.assertEqual(self.status(models.KeaOutbox, first.id), "sending")
+        self.assertEqual(self.status(models.PrettyNum, first.pretty_id), "pending")
+
+        self.assertTrue(finish_outbox_group([first, second], self.DELIVERED))
+        self.assertEqual(self.status(models.KeaOutbox, first.id), "sending")
+        self.assertEqual(self.status(models.KeaOutbox, second.id), "done")
+
+
+class QueryPlanAuditTests(TestCase):
+    """ audit_query_plans：热点查询在当前索引下不做全表扫描 """
+
+    def test_hot_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command("audit_query_plans", "--fail-on-scan", stdout=out)
+        self.assertIn("所有热点查询均命中索引", out.getvalue())
+
+    def test_sqlite_scan_detection(self):
+        self.assertEqual(_sqlite_full_scans("SCAN app01_prettynum"), ["app01_prettynum"])
+        self.assertEqual(_sqlite_full_scans("SCAN app01_prettynum USING INDEX prettynum_mac_idx"), [])
+        self.assertEqual(_sqlite_full_scans("SEARCH app01_prettynum USING INDEX prettynum_mac_idx (mac_address=?)"), [])
+
+
+class _KeaStubHandler(BaseHTTPRequestHandler):
+    """ 支持长连接的本地KEA接口桩 """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class KeaClientTests(TestCase):
+    """ 共享的KEA客户端：连接池中的长连接被后续请求复用 """
+
+    def setUp(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeaStubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.client = KeaClient(base_url=f"http://127.0.0.1:{server.server_address[1]}")
+        self.addCleanup(self.client.close)
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post("/webhook/kea", {"record_id": 1}).json(), {"success": True})
+        snapshot = self.client.stats.snapshot()
+        self.assertEqual((snapshot["requests"], snapshot["new_connections"], snapshot["reused_connections"]), (3, 1, 2))
+
+    @override_settings(KEA_API_CONNECT_TIMEOUT=1, KEA_API_READ_TIMEOUT=2)
+    def test_shared_client_from_settings(self):
+        self.addCleanup(setattr, kea_client, "_client", kea_client._client)
+        kea_client._client = None
+        client = kea_client.get_kea_client()
+        self.assertIs(kea_client.get_kea_client(), client)
+        self.assertEqual((client.connect_timeout, client.read_timeout), (1, 2))
+
+
+class DuidResolverTests(TestCase):
+    """ DUID查找：一次 UNION 查询，设备表优先，只取已审批的申请，作用域内缓存（包括查不到的MAC） """
+
+    A, B, C, D = "02:00:00:00:03:01", "02:00:00:00:03:02", "02:00:00:00:03:03", "02:00:00:00:03:04"
+
+    @classmethod
+    def setUpTestData(cls):
+        department = models.Department.objects.create(title="网络中心")
+        models.Device.objects.create(department=department, create_time=timezone.now(), mac_address=cls.A, duid="dev-a")
+        for mac, duid, status in ((cls.A, "app-a", 1), (cls.B, "app-b", 1), (cls.C, "app-c", 2)):
+            models.DeviceApproval.objects.create(user="u", department=department, mac_address=mac, duid=duid, status=status)
+
+    def test_one_query_device_first(self):
+        resolver = DuidResolver()
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.resolve_many([self.A, self.B, self.C, self.D]), {self.A: "dev-a", self.B: "app-b"})
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolver.resolve(self.D))
+            self.assertEqual(resolver.resolve(self.A), "dev-a")
+
+    def test_scope_shared_with_thread_pool(self):
+        self.assertIsNot(get_duid_resolver(), get_duid_resolver())
+        with duid_scope() as resolver:
+            self.assertIs(get_duid_resolver(), resolver)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                self.assertIs(executor.submit(in_current_scope(get_duid_resolver)).result(), resolver)
+                self.assertIsNot(executor.submit(get_duid_resolver).result(), resolver)
+
+
+class CursorPaginationTests(TestCase):
+    """ 游标分页：按排序字段的值定位，逐页向后/向前翻不重不漏，篡改的游标回到首页 """
+
+    @classmethod
+    def setUpTestData(cls):
+        models.Admin.objects.bulk_create([models.Admin(username=f"admin{i}", password="x") for i in range(25)])
+        cls.ids = list(models.Admin.objects.order_by("-id").values_list("id", flat=True))
+
+    def page(self, query="", queryset=None, ordering=("-id",)):
+        request = RequestFactory().get(f"/admin/list/?{query}")
+        page_object = Pagination(request, models.Admin.objects.all() if queryset is None else queryset, mode="cursor", ordering=ordering)
+        links = dict((text, url) for url, text in re.findall(r'href="\?([^"]*)">(.+?)</a>', page_object.html()))
+        return [obj.id for obj in page_object.page_queryset], links
+
+    def test_walk_forward_and_back(self):
+        rows, links = self.page()
+        pages = [rows]
+        while "下一页" in links:
+            rows, links = self.page(links["下一页"])
+            pages.append(rows)
+        self.assertEqual([len(rows) for rows in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), self.ids)
+
+        rows, links = self.page(links["上一页"])
+        self.assertEqual(rows, self.ids[10:20])
+        rows, _ = self.page(links["尾页"])
+        self.assertEqual(rows, self.ids[-10:])
+
+    def test_tampered_cursor_shows_first_page(self):
+        rows, _ = self.page("cursor=forged")
+        self.assertEqual(rows, self.ids[:10])
+
+    def test_cursor_from_other_list_shows_first_page(self):
+        _, links = self.page()
+        # 同一模型不同排序、以及其他模型的列表都不接受这个游标
+        rows, _ = self.page(links["下一页"], ordering=("id",))
+        self.assertEqual(rows, self.ids[::-1][:10])
+        models.Department.objects.bulk_create([models.Department(title=f"部门{i}") for i in range(15)])
+        departments = models.Department.objects.all()
+        rows, _ = self.page(links["下一页"], queryset=departments)
+        self.assertEqual(rows, list(departments.order_by("-id").values_list("id", flat=True)[:10]))
@@ -0,0 +1,239 @@
+"""
+进程内的IPv6地址分配表
+
+generate_ipv6 生成的地址 = 固定前缀 + 16位槽位（部门4位/楼栋8位/业务类型4位）+ MAC 48位，
+同一个槽位（即同一个 /64 下的同一组高16位）内只需要记住已分配地址的低48位。
+分配表按槽位懒加载：第一次访问某个槽位时用 (ipv6_prefix, ipv6_iid) 索引的一次范围查询取回，
+之后冲突检查、查找空闲地址都只查内存中的集合：
+
+    allocator = get_allocator()
+    allocator.check(address, owner_id=record.id)   # 被其他记录占用时抛出 AddressConflict
+    allocator.conflicts({address: owner_id, ...})   # 批量检查，返回被占用的地址
+    address = allocator.next_free(department, building, service)
+
+PrettyNum 保存/删除时由信号（app01/signals.py）同步到本进程的分配表。分配表只作为快速路径：
+
+- 地址不在表中：直接认为空闲，数据库唯一约束仍是最终保证（其他进程刚写入的地址要等下次校验才同步过来）；
+- 地址在表中：查库确认占用者，查不到（事务回滚、记录改了地址）时从表中移除，不会误报冲突。
+
+每个槽位加载超过 ADDRESS_ALLOCATOR_CHECK_INTERVAL 秒后，下次访问时与数据表重新核对一次。
+
+相关配置（settings.py，均有默认值）：
+    ADDRESS_ALLOCATOR_CHECK_INTERVAL  槽位与数据表核对的间隔（秒）
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+from app01 import models
+from app01.utils.ipv6_generator import (
+    ipv6_to_int_pair, ipv6_from_int_pair, u64_to_db, u64_from_db, slot_iid_ranges, IPV6_PREFIX_INT,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECK_INTERVAL = 300
+
+_SLOT_SHIFT = 48
+_HOST_MASK = (1 << _SLOT_SHIFT) - 1
+
+
+class AddressConflict(ValueError):
+    """ 地址已被其他记录占用 """
+
+    def __init__(self, address, owner_id):
+        self.address = address
+        self.owner_id = owner_id
+        super().__init__(f"IPv6地址 {address} 已被记录 #{owner_id} 占用")
+
+
+def slot_key(department, building, service, prefix=IPV6_PREFIX_INT):
+    """
+    部门/楼栋/业务类型对应的槽位 (前缀, 接口ID高16位)
+
+    Raises:
+        ValueError: 参数范围错误
+    """
+    ranges, _ = slot_iid_ranges(department, building, service)
+    return prefix, ranges[0][0] >> _SLOT_SHIFT
+
+
+def address_key(address):
+    """
+    地址对应的 (槽位, 低48位)
+
+    Raises:
+        ValueError: IPv6地址格式错误
+    """
+    prefix, interface_id = ipv6_to_int_pair(address)
+    return (prefix, interface_id >> _SLOT_SHIFT), interface_id & _HOST_MASK
+
+
+class AddressAllocator(object):
+    """ 按槽位懒加载的已分配地址集合，线程安全 """
+
+    def __init__(self, check_interval=None):
+        if check_interval is None:
+            check_interval = getattr(settings, 'ADDRESS_ALLOCATOR_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        self.check_interval = check_interval
+        self._slots = {}  # 槽位 -> 已分配地址低48位的集合
+        self._loaded_at = {}  # 槽位 -> 加载/核对时间
+        self._lock = threading.RLock()
+        self.loads = 0
+
+    def _query_slot(self, slot):
+        """ 一次范围查询取回槽位内所有地址的低48位 """
+        prefix, high = slot
+        first = high << _SLOT_SHIFT
+        interface_ids = models.PrettyNum.objects.filter(
+            ipv6_prefix=u64_to_db(prefix),
+            ipv6_iid__gte=u64_to_db(first),
+            ipv6_iid__lte=u64_to_db(first | _HOST_MASK),
+        ).values_list('ipv6_iid', flat=True)
+        return {u64_from_db(value) & _HOST_MASK for value in interface_ids.iterator()}
+
+    def _slot(self, slot):
+        """ 返回槽位的集合，未加载或超过核对间隔时从数据表（重新）加载 """
+        with self._lock:
+            loaded_at = self._loaded_at.get(slot)
+            if loaded_at is None or time.monotonic() - loaded_at > self.check_interval:
+                self.verify(slot)
+            return self._slots[slot]
+
+    def verify(self, slot):
+        """
+        用数据表中的地址替换槽位的集合（与数据表核对）
+
+        Returns:
+            tuple: (数据表中有但集合中没有的数量, 集合中有但数据表中没有的数量)，首次加载时为 (0, 0)
+        """
+        allocated = self._query_slot(slot)
+        with self._lock:
+            self.loads += 1
+            old = self._slots.get(slot)
+            self._slots[slot] = allocated
+            self._loaded_at[slot] = time.monotonic()
+        if old is None:
+            return 0, 0
+        missing, extra = len(allocated - old), len(old - allocated)
+        if missing or extra:
+            logger.warning(f"地址分配表槽位 {slot[1]:04x} 与数据表不一致：缺少 {missing} 个，多出 {extra} 个，已重新加载")
+        return missing, extra
+
+    def verify_all(self):
+        """ 核对所有已加载的槽位，返回 {槽位: (缺少, 多出)} """
+        return {slot: self.verify(slot) for slot in list(self._slots)}
+
+    def is_allocated(self, address):
+        """ 地址是否已分配（只查内存） """
+        slot, host = address_key(address)
+        return host in self._slot(slot)
+
+    def check(self, address, owner_id=None):
+        """
+        确认地址可以由 owner_id 对应的记录使用（owner_id 为 None 表示新记录）
+
+        Raises:
+            AddressConflict: 地址已被其他记录占用
+            ValueError: IPv6地址格式错误
+        """
+        slot, host = address_key(address)
+        if host not in self._slot(slot):
+            return
+        # 命中已分配地址时才查库确认占用者
+        owner = models.PrettyNum.objects.by_address(address).values_list('id', flat=True).first()
+        if owner is None:
+            self.discard(address)
+            return
+        if owner != owner_id:
+            raise AddressConflict(address, owner)
+
+    def conflicts(self, owners):
+        """
+        批量版 check()：owners 为 {地址: 使用该地址的记录ID（新记录为 None）}
+
+        只有命中分配表的地址才查库，全部合并为一次查询。
+
+        Returns:
+            dict: 被其他记录占用的地址 {地址: 占用者ID}
+        """
+        hits = {}
+        for address in owners:
+            slot, host = address_key(address)
+            if host in self._slot(slot):
+                hits[ipv6_to_int_pair(address)] = address
+        if not hits:
+            return {}
+
+        interface_ids = {}
+        for prefix, interface_id in hits:
+            interface_ids.setdefault(prefix, []).append(u64_to_db(interface_id))
+        condition = Q()
+        for prefix, values in interface_ids.items():
+            condition |= Q(ipv6_prefix=u64_to_db(prefix), ipv6_iid__in=values)
+        actual = {
+            (u64_from_db(prefix), u64_from_db(interface_id)): pk
+            for pk, prefix, interface_id in models.PrettyNum.objects.filter(condition).values_list(
+                'id', 'ipv6_prefix', 'ipv6_iid')
+        }
+
+        result = {}
+        for pair, address in hits.items():
+            owner = actual.get(pair)
+            if owner is None:
+                self.discard(address)
+            elif owner != owners[address]:
+                result[address] = owner
+        return result
+
+    def next_free(self, department, building, service, start=1, prefix=IPV6_PREFIX_INT):
+        """
+        槽位内从 start（低48位）开始的第一个空闲地址
+
+        Raises:
+            ValueError: 参数范围错误，或槽位已满
+        """
+        slot = slot_key(department, building, service, prefix)
+        allocated = self._slot(slot)
+        host = start
+        while host in allocated:
+            host += 1
+        if host > _HOST_MASK:
+            raise ValueError("该部门/楼栋/业务类型下已没有空闲地址")
+        return ipv6_from_int_pair(prefix, slot[1] << _SLOT_SHIFT | host)
+
+    def add(self, address):
+        """ 记录新分配的地址；槽位尚未加载时忽略，加载时会从数据表取到 """
+        slot, host = address_key(address)
+        with self._lock:
+            if slot in self._slots:
+                self._slots[slot].add(host)
+
+    def discard(self, address):
+        """ 移除释放的地址 """
+        slot, host = address_key(address)
+        with self._lock:
+            if slot in self._slots:
+                self._slots[slot].discard(host)
+
+    def stats(self):
+        """ 已加载的槽位数和地址数 """
+        with self._lock:
+            return {'slots': len(self._slots), 'addresses': sum(len(hosts) for hosts in self._slots.values())}
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    """ 返回本进程共用的 AddressAllocator """
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = AddressAllocator()
+    return _allocator
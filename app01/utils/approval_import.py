@@ -0,0 +1,419 @@
+"""
+设备审批批量导入（CSV / JSONL）
+
+文件按行流式读取，每 chunk_size 行为一批：
+
+1. 整批校验：MAC 用 validate_mac_address，楼栋/业务类型整列做范围检查（安装了 numpy 时向量化），部门按ID或名称匹配；
+2. 整批查重：一次 UNION ALL 查询取回设备表和审批表中与本批 MAC/DUID 相同的记录（MAC 经搜索索引忽略写法差异），
+   批内重复同样跳过；
+3. 有效行用 bulk_create 写入（状态为审批中），并补建搜索索引。
+
+内存占用只与批大小有关，与文件行数无关。前面批次写入的记录会被后面批次的查重查询查到，跨批次的重复也能发现。
+
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = import_approvals(iter_rows(f, 'csv'), progress=lambda r: print(r.to_dict()))
+
+文件列：user, department, building, business_type, duid, mac（department 可以是部门ID或部门名称）
+
+网页上传由 start_import_job() 保存文件并写入一条 ApprovalImportJob，由 approval_import_worker 命令领取执行，
+进度写回任务表，任何 Web 进程都能通过 get_import_progress(job_id) 查询。
+
+相关配置（settings.py，均有默认值）：
+    APPROVAL_IMPORT_DIR  上传文件的保存目录，为空时使用系统临时目录
+"""
+import csv
+import itertools
+import json
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, Q, Value
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，未安装时范围检查退化为逐行比较
+    np = None
+
+from app01 import models
+from app01.utils import search_index
+from app01.utils.count_cache import invalidate_model_counts
+from app01.utils.ipv6_generator import validate_mac_address
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('user', 'department', 'building', 'business_type', 'duid', 'mac')
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# 报告中最多保留的错误明细条数，超过的只计数
+MAX_ERRORS = 100
+
+# 后台导入任务的租期（秒）：每批处理完续期，worker 异常退出后任务在租期结束后被重新领取
+DEFAULT_JOB_LEASE_SECONDS = 600
+
+_BUILDINGS = [value for value, _ in models.BUILDING_CHOICES]
+_BUSINESS_TYPES = [value for value, _ in models.BUSINESS_TYPE_CHOICES]
+
+
+class ImportLeaseLost(Exception):
+    """ 导入任务的租期已过并被其他 worker 重新领取 """
+
+
+class ImportReport(object):
+    """ 导入进度/结果 """
+
+    def __init__(self):
+        self.total = 0  # 已读取的行数
+        self.created = 0
+        self.invalid = 0
+        self.duplicate = 0
+        self.errors = []  # [(行号, 原因)]，最多 MAX_ERRORS 条
+        self.finished = False
+        self.message = ""
+
+    def reject(self, line_no, reason, duplicate=False):
+        if duplicate:
+            self.duplicate += 1
+        else:
+            self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line_no, reason))
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'created': self.created,
+            'invalid': self.invalid,
+            'duplicate': self.duplicate,
+            'errors': [{'line': line_no, 'reason': reason} for line_no, reason in self.errors],
+            'finished': self.finished,
+            'message': self.message,
+        }
+
+
+def detect_format(filename):
+    """
+    根据文件扩展名判断格式
+
+    Raises:
+        ValueError: 不支持的文件格式
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError("只支持 .csv 和 .jsonl 文件")
+
+
+def iter_rows(lines, fmt):
+    """
+    逐行解析，产出 (行号, 行数据dict)；JSONL 中无法解析的行产出 (行号, None)
+
+    Raises:
+        ValueError: 不支持的格式，或CSV缺少必需的列
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        missing = set(COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV缺少列: {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"不支持的文件格式: {fmt}")
+
+
+def normalize_mac(mac):
+    """ 统一为大写、冒号分隔的MAC地址（调用前需已通过 validate_mac_address） """
+    clean = mac.replace(":", "").replace("-", "").upper()
+    return ":".join(clean[i:i + 2] for i in range(0, 12, 2))
+
+
+def _to_int(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _out_of_range(values, allowed):
+    """ 整列检查取值是否在 [min(allowed), max(allowed)] 内，返回每行是否越界 """
+    low, high = min(allowed), max(allowed)
+    if np is not None:
+        array = np.array([low - 1 if value is None else value for value in values], dtype=np.int64)
+        return ((array < low) | (array > high)).tolist()
+    return [value is None or not (low <= value <= high) for value in values]
+
+
+def _department_lookup():
+    """ 部门ID（文本）和部门名称 -> 部门ID """
+    lookup = {}
+    for department_id, title in models.Department.objects.values_list('id', 'title'):
+        lookup.setdefault(title, department_id)
+        lookup[str(department_id)] = department_id
+    return lookup
+
+
+def _validate_chunk(chunk, departments, report):
+    """ 校验一批行，返回 [(行号, DeviceApproval)]，不合格的行记入报告 """
+    rows = []
+    for line_no, row in chunk:
+        if row is None:
+            report.reject(line_no, "不是有效的JSON对象")
+        else:
+            rows.append((line_no, row))
+
+    bad_buildings = _out_of_range([_to_int(row.get('building')) for _, row in rows], _BUILDINGS)
+    bad_types = _out_of_range([_to_int(row.get('business_type')) for _, row in rows], _BUSINESS_TYPES)
+
+    valid = []
+    for (line_no, row), bad_building, bad_type in zip(rows, bad_buildings, bad_types):
+        user = str(row.get('user') or "").strip()
+        mac = str(row.get('mac') or "").strip()
+        duid = str(row.get('duid') or "").strip()
+        department_id = departments.get(str(row.get('department') or "").strip())
+        if not user or len(user) > 32:
+            report.reject(line_no, "用户不能为空且不能超过32个字符")
+        elif department_id is None:
+            report.reject(line_no, f"部门不存在: {row.get('department')}")
+        elif bad_building:
+            report.reject(line_no, f"楼栋必须在 {min(_BUILDINGS)}-{max(_BUILDINGS)} 范围内")
+        elif bad_type:
+            report.reject(line_no, f"业务类型必须在 {min(_BUSINESS_TYPES)}-{max(_BUSINESS_TYPES)} 范围内")
+        elif not validate_mac_address(mac):
+            report.reject(line_no, f"MAC地址格式错误: {mac}")
+        elif len(duid) > 64:
+            report.reject(line_no, "DUID不能超过64个字符")
+        else:
+            valid.append((line_no, models.DeviceApproval(
+                user=user,
+                department_id=department_id,
+                building=int(row['building']),
+                business_type=int(row['business_type']),
+                duid=duid or None,
+                mac_address=normalize_mac(mac),
+                status=2,
+            )))
+    return valid
+
+
+def _existing_keys(macs, duids):
+    """
+    一次查询取回设备表和审批表中已存在的MAC（规范化为十六进制小写）和DUID
+
+    已有记录的MAC可能是横线分隔、不带分隔符或小写的写法，按搜索索引中规范化后的 SearchEntry.mac 查找；
+    同时按原值精确匹配，索引还没有重建的记录只要写法相同也能查到。
+    """
+    condition = Q(mac_address__in=macs) | Q(duid__in=duids)
+    approvals = models.DeviceApproval.objects.filter(condition).values_list('mac_address', 'duid')
+    devices = models.Device.objects.filter(condition).values_list('mac_address', 'duid')
+    indexed = models.SearchEntry.objects.filter(
+        kind__in=('device', 'approval'), mac__in={search_index.normalize_hex(mac) for mac in macs},
+    ).annotate(no_duid=Value('', output_field=CharField())).values_list('mac', 'no_duid')
+    existing_macs, existing_duids = set(), set()
+    for mac, duid in approvals.union(devices, indexed, all=True):
+        if mac:
+            existing_macs.add(search_index.normalize_hex(mac))
+        if duid:
+            existing_duids.add(duid)
+    return existing_macs, existing_duids
+
+
+def _drop_duplicates(candidates, report):
+    """ 去掉与已有记录或本批前面的行 MAC/DUID 相同的行（MAC 忽略大小写和分隔符） """
+    if not candidates:
+        return []
+    existing_macs, existing_duids = _existing_keys(
+        {obj.mac_address for _, obj in candidates}, {obj.duid for _, obj in candidates if obj.duid}
+    )
+    objs = []
+    for line_no, obj in candidates:
+        mac_key = search_index.normalize_hex(obj.mac_address)
+        if mac_key in existing_macs:
+            report.reject(line_no, f"MAC地址已存在: {obj.mac_address}", duplicate=True)
+        elif obj.duid and obj.duid in existing_duids:
+            report.reject(line_no, f"DUID已存在: {obj.duid}", duplicate=True)
+        else:
+            existing_macs.add(mac_key)
+            if obj.duid:
+                existing_duids.add(obj.duid)
+            objs.append(obj)
+    return objs
+
+
+def _insert(objs):
+    """ 写入一批审批记录并补建搜索索引（bulk_create 不发 post_save 信号） """
+    with transaction.atomic():
+        models.DeviceApproval.objects.bulk_create(objs)
+        if not all(obj.pk for obj in objs):
+            # MySQL 的 bulk_create 不回填主键；本批MAC刚查过重，按MAC取回的就是新写入的记录
+            objs = models.DeviceApproval.objects.filter(
+                mac_address__in=[obj.mac_address for obj in objs]
+            ).only('id', 'mac_address', 'duid')
+        search_index.index_new_objects('approval', objs)
+    invalidate_model_counts(models.DeviceApproval)
+
+
+def import_approvals(rows, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    分批导入审批记录
+
+    :param rows: iter_rows() 产出的 (行号, 行数据) 迭代器
+    :param chunk_size: 每批行数
+    :param progress: 每批处理完后以 ImportReport 为参数调用
+    :return: ImportReport
+    """
+    departments = _department_lookup()
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.total += len(chunk)
+        objs = _drop_duplicates(_validate_chunk(chunk, departments, report), report)
+        if objs:
+            _insert(objs)
+            report.created += len(objs)
+        if progress:
+            progress(report)
+
+    report.finished = True
+    report.message = f"导入完成：新增 {report.created} 条，格式错误 {report.invalid} 条，重复 {report.duplicate} 条"
+    if progress:
+        progress(report)
+    return report
+
+
+def _upload_dir():
+    """ 上传文件的保存目录，approval_import_worker 必须能读到（同一台机器或共享存储） """
+    return getattr(settings, 'APPROVAL_IMPORT_DIR', '') or tempfile.gettempdir()
+
+
+def start_import_job(uploaded_file, fmt):
+    """
+    把上传的文件保存到 APPROVAL_IMPORT_DIR（请求结束后上传文件会被删除），写入一条等待导入的任务，
+    由 approval_import_worker 命令执行
+
+    Returns:
+        int: 任务ID，用 get_import_progress(job_id) 查询进度
+    """
+    with tempfile.NamedTemporaryFile(
+            dir=_upload_dir(), prefix='approval_import_', suffix='.' + fmt, delete=False) as f:
+        for data in uploaded_file.chunks():
+            f.write(data)
+    return models.ApprovalImportJob.objects.create(file_path=f.name, file_format=fmt).id
+
+
+def claim_import_job(lease_seconds=DEFAULT_JOB_LEASE_SECONDS):
+    """
+    领取一个等待导入（或租期已过）的任务
+
+    与 claim_outbox_batch 相同，使用 select_for_update(skip_locked=True)，领取后把可领取时间顺延一个租期，
+    新的 available_time 即本次领取的凭据。
+
+    Returns:
+        ApprovalImportJob 或 None
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            models.ApprovalImportJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'running'], available_time__lte=now)
+            .order_by('id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.available_time = now + timedelta(seconds=lease_seconds)
+        job.save(update_fields=['status', 'available_time', 'update_time'])
+    return job
+
+
+def _save_job(job, lease_seconds, **fields):
+    """ 凭据未变时写回任务进度并续期，任务已被重新领取时抛出 ImportLeaseLost """
+    now = timezone.now()
+    available_time = now + timedelta(seconds=lease_seconds)
+    updated = models.ApprovalImportJob.objects.filter(
+        id=job.id, status='running', available_time=job.available_time,
+    ).update(available_time=available_time, update_time=now, **fields)
+    if not updated:
+        raise ImportLeaseLost(f"导入任务 {job.id} 的租期已过并被重新领取")
+    job.available_time = available_time
+
+
+def _report_fields(report):
+    """ ImportReport -> ApprovalImportJob 的进度字段 """
+    data = report.to_dict()
+    fields = {name: data[name] for name in ('total', 'created', 'invalid', 'duplicate', 'errors', 'message')}
+    if report.finished:
+        fields['status'] = 'done'
+    return fields
+
+
+def run_import_job(job, lease_seconds=DEFAULT_JOB_LEASE_SECONDS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    执行一个已领取的导入任务：每批处理完写回进度并续期，结束后删除上传文件
+
+    上一次执行的 worker 异常退出、任务被重新领取时从头导入，已写入的行按重复跳过。
+
+    Returns:
+        ImportReport；导入失败或任务已被其他 worker 重新领取时返回 None
+    """
+    try:
+        # 开始前确认任务仍归本 worker 所有
+        _save_job(job, lease_seconds)
+        with open(job.file_path, encoding='utf-8-sig', newline='') as f:
+            report = import_approvals(
+                iter_rows(f, job.file_format),
+                chunk_size=chunk_size,
+                progress=lambda r: _save_job(job, lease_seconds, **_report_fields(r)),
+            )
+    except ImportLeaseLost as e:
+        # 上传文件留给重新领取的 worker
+        logger.warning(str(e))
+        return None
+    except Exception as e:
+        logger.exception(f"设备审批导入任务 {job.id} 失败")
+        try:
+            _save_job(job, lease_seconds, status='failed', message=f"导入失败：{str(e)}"[:255])
+        except ImportLeaseLost as lost:
+            logger.warning(str(lost))
+            return None
+        report = None
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    return report
+
+
+def get_import_progress(job_id):
+    """ 导入任务的进度（与 ImportReport.to_dict() 相同的字段，另有 status），任务不存在时返回 None """
+    job = models.ApprovalImportJob.objects.filter(id=job_id).first()
+    if job is None:
+        return None
+    return {
+        'status': job.status,
+        'total': job.total,
+        'created': job.created,
+        'invalid': job.invalid,
+        'duplicate': job.duplicate,
+        'errors': job.errors,
+        'finished': job.status in ('done', 'failed'),
+        'message': job.message or ('等待导入（approval_import_worker）' if job.status == 'pending' else ''),
+    }
@@ -0,0 +1,19 @@
+"""
+基准测试公共工具
+
+基准测试命令需要写入大量测试数据，统一在独立的测试数据库中运行（与 manage.py test 相同的创建方式），
+结束后自动销毁，不影响业务数据。
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """ 创建独立的测试数据库并切换过去，退出时销毁并切回原数据库 """
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
@@ -0,0 +1,103 @@
+"""
+IPv6绑定导出为 KEA reservations（JSON）或 CSV，用于与DHCP服务器核对
+
+导出全部 PrettyNum，DUID 按MAC从设备表/已审批的申请中查找（见 duid_resolver）。整个导出是生成器，
+按主键游标分页读取，每页一次查询取记录、一次 UNION ALL 查询取DUID，内存占用只与页大小有关：
+
+    for piece in export_bindings('json'):
+        f.write(piece)
+
+JSON 格式与 KEA Dhcp6 的 reservations 配置相同。KEA 要求每条保留只有一个标识，
+有DUID时用 duid（DHCPv6 客户端以 DUID 标识），否则用 hw-address；记录ID放在 user-context 中：
+
+    {"reservations": [
+    {"duid": "00:03:00:01:...", "ip-addresses": ["240c:..."], "user-context": {"record-id": 1, "user": "..."}},
+    {"hw-address": "aa:bb:...", "ip-addresses": ["240c:..."], "user-context": {"record-id": 2, "user": "..."}}
+    ]}
+
+CSV 列：record_id, user, ipv6_address, hw_address, duid
+"""
+import csv
+import json
+
+from app01 import models
+from app01.utils.duid_resolver import DuidResolver
+
+FORMATS = ('json', 'csv')
+
+CSV_COLUMNS = ('record_id', 'user', 'ipv6_address', 'hw_address', 'duid')
+
+DEFAULT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def iter_bindings(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按主键顺序逐条产出绑定 (记录ID, 用户, IPv6地址, MAC, DUID)
+
+    不使用 queryset.iterator()：MySQL 驱动会把整个结果集读入内存，这里用 id > 上一页最后ID 的游标分页，
+    每页走主键索引的范围扫描。
+    """
+    last_id = 0
+    while True:
+        rows = list(
+            models.PrettyNum.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'user', 'ipv6_address', 'mac_address')[:chunk_size]
+        )
+        if not rows:
+            return
+        # 每页使用新的 DuidResolver，缓存不随导出的条数增长
+        duid_by_mac = DuidResolver().resolve_many(mac for _, _, _, mac in rows)
+        for record_id, user, ipv6_address, mac_address in rows:
+            yield record_id, user, ipv6_address, mac_address, duid_by_mac.get(mac_address)
+        last_id = rows[-1][0]
+
+
+def reservation(record_id, user, ipv6_address, mac_address, duid):
+    """ 一条绑定对应的 KEA reservation """
+    item = {'duid': duid} if duid else {'hw-address': (mac_address or "").lower()}
+    item['ip-addresses'] = [ipv6_address]
+    item['user-context'] = {'record-id': record_id, 'user': user}
+    return item
+
+
+def iter_json(bindings):
+    """ 逐条产出 {"reservations": [...]} 的片段，每条保留一行 """
+    yield '{"reservations": ['
+    separator = '\n'
+    for binding in bindings:
+        yield separator + json.dumps(reservation(*binding), ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+class _Echo(object):
+    """ csv.writer 的输出目标，write() 直接返回写入的内容 """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(bindings):
+    """ 逐行产出CSV（含表头） """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record_id, user, ipv6_address, mac_address, duid in bindings:
+        yield writer.writerow([record_id, user, ipv6_address, mac_address or "", duid or ""])
+
+
+def export_bindings(fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    导出全部绑定，产出文本片段
+
+    Raises:
+        ValueError: 不支持的格式
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选 {', '.join(FORMATS)}")
+    bindings = iter_bindings(chunk_size)
+    return iter_json(bindings) if fmt == 'json' else iter_csv(bindings)
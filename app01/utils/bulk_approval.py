@@ -0,0 +1,235 @@
+"""
+设备审批批量同意/拒绝
+
+device_approval_approve 逐条处理：生成地址、查已有记录、写 PrettyNum、入队、写 Device、更新审批状态，
+每条十几次查询。这里按批（默认1000条）在一个事务中完成，每批的查询次数与条数无关：
+
+    1. 锁定本批中仍为审批中（status=2）的记录；
+    2. generate_ipv6_batch 批量生成地址，地址分配表批量检查冲突；
+    3. 一次查询取回已有的 IPv6记录（按MAC），一次查询取回已有的设备（按MAC/DUID）；
+    4. IPv6记录 bulk_update + bulk_create，发送队列和设备 bulk_create；
+    5. 一条 UPDATE ... WHERE id IN 更新审批状态。
+
+KEA发送由 kea_outbox_worker 从队列异步完成。批量写入不发信号，搜索索引、地址分配表、
+COUNT 缓存在这里同步维护。
+
+    result = approve_approvals(ids, callback_url)
+    result = reject_approvals(ids)
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app01 import models
+from app01.utils import search_index
+from app01.utils.address_allocator import get_allocator
+from app01.utils.count_cache import invalidate_model_counts
+from app01.utils.ipv6_generator import generate_ipv6_batch, validate_mac_address
+from app01.utils.kea_dispatch import enqueue_kea_sends
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# 批量同意时 IPv6记录 bulk_update 的字段
+PRETTY_FIELDS = ['user', 'ipv6_address', 'ipv6_prefix', 'ipv6_iid', 'department', 'building', 'send_status']
+
+
+class BulkResult(object):
+    """ 批量操作结果 """
+
+    def __init__(self):
+        self.done = 0
+        self.skipped = []  # [(审批ID, 原因)]
+
+    def skip(self, approval_id, reason):
+        self.skipped.append((approval_id, reason))
+
+    def to_dict(self):
+        return {
+            'done': self.done,
+            'skipped': [{'id': approval_id, 'reason': reason} for approval_id, reason in self.skipped],
+        }
+
+
+def _mac_key(mac):
+    return mac.replace(":", "").replace("-", "").lower()
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _select_candidates(approvals, result):
+    """ 去掉无法生成地址或在本批内MAC/DUID重复的记录 """
+    candidates = []
+    seen_macs, seen_duids = set(), set()
+    for obj in approvals:
+        if not validate_mac_address(obj.mac_address):
+            result.skip(obj.id, f"MAC地址格式错误: {obj.mac_address}")
+        elif not (0 <= obj.department_id < 16 and 0 <= obj.building < 256 and 0 <= obj.business_type < 16):
+            result.skip(obj.id, "部门/楼栋/业务类型编号超出地址编码范围")
+        elif _mac_key(obj.mac_address) in seen_macs:
+            result.skip(obj.id, f"与本批其他审批的MAC地址相同: {obj.mac_address}")
+        elif obj.duid and obj.duid in seen_duids:
+            result.skip(obj.id, f"与本批其他审批的DUID相同: {obj.duid}")
+        else:
+            seen_macs.add(_mac_key(obj.mac_address))
+            if obj.duid:
+                seen_duids.add(obj.duid)
+            candidates.append(obj)
+    return candidates
+
+
+def _existing_devices(candidates):
+    """ 一次查询取回MAC或DUID已登记为设备的 (MAC集合, DUID集合) """
+    macs = [obj.mac_address for obj in candidates]
+    duids = [obj.duid for obj in candidates if obj.duid]
+    device_macs, device_duids = set(), set()
+    for mac, duid in models.Device.objects.filter(Q(mac_address__in=macs) | Q(duid__in=duids)).values_list(
+            'mac_address', 'duid'):
+        if mac:
+            device_macs.add(_mac_key(mac))
+        if duid:
+            device_duids.add(duid)
+    return device_macs, device_duids
+
+
+def _fill_pks(objs, model, field):
+    """ MySQL 的 bulk_create 不回填主键，按唯一的 field 取回（本批内 field 已去重） """
+    if all(obj.pk for obj in objs):
+        return
+    values = [getattr(obj, field) for obj in objs]
+    pks = dict(model.objects.filter(**{f"{field}__in": values}).values_list(field, 'id'))
+    for obj in objs:
+        obj.pk = pks[getattr(obj, field)]
+
+
+def _approve_chunk(approval_ids, callback_url, result):
+    """ 在一个事务中同意一批审批，返回写入的IPv6地址 """
+    allocator = get_allocator()
+    with transaction.atomic():
+        approvals = list(
+            models.DeviceApproval.objects.select_for_update().filter(id__in=approval_ids, status=2).order_by('id')
+        )
+        found = {obj.id for obj in approvals}
+        for approval_id in approval_ids:
+            if approval_id not in found:
+                result.skip(approval_id, "审批记录不存在或不是审批中状态")
+
+        candidates = _select_candidates(approvals, result)
+        if not candidates:
+            return []
+
+        # 已有的IPv6记录（同一MAC复用ID最小的一条，与逐条审批一致）和已登记的设备
+        existing_pretty = {}
+        for ipv6_obj in models.PrettyNum.objects.filter(
+                mac_address__in=[obj.mac_address for obj in candidates]).order_by('-id'):
+            existing_pretty[_mac_key(ipv6_obj.mac_address)] = ipv6_obj
+        device_macs, device_duids = _existing_devices(candidates)
+
+        addresses = generate_ipv6_batch(
+            [obj.department_id for obj in candidates],
+            [obj.building for obj in candidates],
+            [obj.business_type for obj in candidates],
+            [obj.mac_address for obj in candidates],
+        )
+        owners = {}
+        for obj, address in zip(candidates, addresses):
+            ipv6_obj = existing_pretty.get(_mac_key(obj.mac_address))
+            owners[address] = ipv6_obj.id if ipv6_obj else None
+        conflicts = allocator.conflicts(owners)
+
+        now = timezone.now()
+        approved, updated, created, devices = [], [], [], []
+        for obj, address in zip(candidates, addresses):
+            if address in conflicts:
+                result.skip(obj.id, f"IPv6地址 {address} 已被记录 #{conflicts[address]} 占用")
+                continue
+            if _mac_key(obj.mac_address) in device_macs or (obj.duid and obj.duid in device_duids):
+                result.skip(obj.id, f"设备已存在: {obj.mac_address}")
+                continue
+
+            ipv6_obj = existing_pretty.get(_mac_key(obj.mac_address))
+            if ipv6_obj is None:
+                ipv6_obj = models.PrettyNum(mac_address=obj.mac_address)
+                created.append(ipv6_obj)
+            else:
+                updated.append(ipv6_obj)
+            ipv6_obj.user = obj.user
+            ipv6_obj.ipv6_address = address
+            ipv6_obj.department_id = obj.department_id
+            ipv6_obj.building = obj.building
+            ipv6_obj.send_status = 'pending'
+            ipv6_obj.sync_ipv6_int()
+
+            devices.append(models.Device(
+                user=obj.user,
+                create_time=now,
+                department_id=obj.department_id,
+                building=obj.building,
+                business_type=obj.business_type,
+                duid=obj.duid or None,
+                mac_address=obj.mac_address,
+            ))
+            approved.append(obj)
+
+        if not approved:
+            return []
+
+        models.PrettyNum.objects.bulk_update(updated, PRETTY_FIELDS, batch_size=500)
+        models.PrettyNum.objects.bulk_create(created, batch_size=500)
+        _fill_pks(created, models.PrettyNum, 'mac_address')
+        ipv6_objs = updated + created
+        duids = {_mac_key(obj.mac_address): obj.duid for obj in approved}
+        enqueue_kea_sends(ipv6_objs, [duids[_mac_key(o.mac_address)] for o in ipv6_objs], callback_url)
+
+        models.Device.objects.bulk_create(devices, batch_size=500)
+        _fill_pks(devices, models.Device, 'mac_address')
+        models.DeviceApproval.objects.filter(id__in=[obj.id for obj in approved]).update(status=1)
+
+        search_index.reindex_objects('pretty', updated)
+        search_index.index_new_objects('pretty', created)
+        search_index.index_new_objects('device', devices)
+
+    result.done += len(approved)
+    return [obj.ipv6_address for obj in ipv6_objs]
+
+
+def approve_approvals(approval_ids, callback_url=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    批量同意审批：生成IPv6地址、写入IPv6记录和设备、加入KEA发送队列
+
+    每批一个事务，某一批失败时回滚该批并抛出异常，之前的批次已经提交。
+
+    Returns:
+        BulkResult
+    """
+    result = BulkResult()
+    approval_ids = sorted(set(approval_ids))
+    allocator = get_allocator()
+    try:
+        for chunk in _chunks(approval_ids, chunk_size):
+            for address in _approve_chunk(chunk, callback_url, result):
+                allocator.add(address)
+    finally:
+        for model in (models.PrettyNum, models.Device, models.DeviceApproval, models.KeaOutbox):
+            invalidate_model_counts(model)
+    logger.info(f"批量同意设备审批: 同意 {result.done} 条，跳过 {len(result.skipped)} 条")
+    return result
+
+
+def reject_approvals(approval_ids):
+    """ 批量拒绝审批中的记录，一条 UPDATE """
+    result = BulkResult()
+    approval_ids = sorted(set(approval_ids))
+    pending = set(models.DeviceApproval.objects.filter(id__in=approval_ids, status=2).values_list('id', flat=True))
+    result.done = models.DeviceApproval.objects.filter(id__in=pending, status=2).update(status=0)
+    for approval_id in approval_ids:
+        if approval_id not in pending:
+            result.skip(approval_id, "审批记录不存在或不是审批中状态")
+    invalidate_model_counts(models.DeviceApproval)
+    return result
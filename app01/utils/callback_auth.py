@@ -0,0 +1,73 @@
+"""
+机器回调（KEA 等）的 HMAC 签名校验
+
+回调方在请求头中带上时间戳和签名：
+
+    X-KEA-Timestamp: 1760000000
+    X-KEA-Signature: hex(HMAC-SHA256(KEA_CALLBACK_SECRET, "<时间戳>." + 请求体))
+
+配置了密钥时 AuthMiddleware 对回调地址只做这一次校验（与请求体长度成正比的一次 HMAC 和一次常量时间比较），
+不读会话、不查数据库。时间戳与服务器时间相差超过 KEA_CALLBACK_MAX_SKEW 秒的请求视为重放。
+
+    headers = signature_headers(body, secret)     # 回调方（桩服务、测试）生成请求头
+    error = verify_request(request)               # 中间件校验，None 表示通过
+
+相关配置（settings.py，均有默认值）：
+    KEA_CALLBACK_SECRET    签名密钥；为空时 /api/kea/callback/ 保持原来的免登录，其他回调地址仍然要求登录
+    KEA_CALLBACK_MAX_SKEW  允许的时间偏差（秒）
+"""
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+
+TIMESTAMP_HEADER = 'X-KEA-Timestamp'
+SIGNATURE_HEADER = 'X-KEA-Signature'
+
+DEFAULT_MAX_SKEW = 300
+
+
+def compute_signature(secret, timestamp, body):
+    """ HMAC-SHA256("<时间戳>." + 请求体) 的十六进制摘要 """
+    message = str(timestamp).encode() + b"." + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signature_headers(body, secret, timestamp=None):
+    """ 回调方使用：生成签名请求头 """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return {
+        TIMESTAMP_HEADER: str(timestamp),
+        SIGNATURE_HEADER: compute_signature(secret, timestamp, body),
+    }
+
+
+def callback_secret():
+    return getattr(settings, 'KEA_CALLBACK_SECRET', '')
+
+
+def verify_request(request):
+    """
+    校验回调请求的签名
+
+    Returns:
+        str: 错误原因，校验通过时返回 None；未配置密钥时一律不通过
+    """
+    secret = callback_secret()
+    if not secret:
+        return "未配置签名密钥"
+    timestamp = request.headers.get(TIMESTAMP_HEADER, '')
+    signature = request.headers.get(SIGNATURE_HEADER, '')
+    if not timestamp or not signature:
+        return "缺少签名请求头"
+    try:
+        skew = abs(time.time() - int(timestamp))
+    except (ValueError, OverflowError):
+        # 超大的整数时间戳与 float 相减时溢出
+        return "时间戳格式错误"
+    if skew > getattr(settings, 'KEA_CALLBACK_MAX_SKEW', DEFAULT_MAX_SKEW):
+        return "时间戳已过期"
+    if not hmac.compare_digest(compute_signature(secret, timestamp, request.body), signature):
+        return "签名错误"
+    return None
@@ -0,0 +1,453 @@
+"""
+KEA回调的合并写入（write-behind）
+
+KEA 确认一大批绑定时 kea_callback 每秒会收到数百个 POST，默认（同步）模式下每个回调各自执行
+一次 UPDATE，在自动提交下就是一个事务、一次 fsync。KEA_CALLBACK_INGEST_MODE = 'buffered' 时，
+视图只校验回调并放入进程内缓冲区后立即返回 200，由后台线程每隔 KEA_CALLBACK_FLUSH_INTERVAL_MS 毫秒
+（或积累到 KEA_CALLBACK_FLUSH_SIZE 条时）把缓冲区中的结果在一个事务中用 bulk_update 合并写回：
+
+    items = [parse_callback(data)]           # 视图：校验，None 表示格式错误
+    get_callback_buffer().put(items)         # 视图：入队（配置了落盘目录时先追加写入落盘文件）
+    apply_callback_results(items)            # 后台线程：一个事务写回一组回调
+
+合并写回与同步模式遵循相同的状态条件（CALLBACK_UPDATABLE_STATUSES），同一记录在一组中的多个回调按到达顺序生效。
+
+配置了 KEA_CALLBACK_SPOOL_DIR 时，入队前先把回调追加写入 <目录>/kea-callback-<pid>.spool（写入操作系统缓存，
+进程崩溃不丢失，不做逐条 fsync）；每次写回前把当前落盘文件改名为 .flushing，写回提交后删除。
+进程异常退出后遗留的落盘文件由 replay_callback_spool 命令重放（在 Web 进程停止时执行，例如部署脚本中启动之前）。
+
+缓冲区最多保存 KEA_CALLBACK_BUFFER_LIMIT 条回调，满时 put() 返回 False，视图返回 503 由 KEA 稍后重投。
+写回失败时：数据库连接类错误（OperationalError/InterfaceError）整组留在缓冲区等待下次写回；
+其他错误按二分法找出出错的回调，其余照常写回，出错的回调重试 KEA_CALLBACK_MAX_ATTEMPTS 次后转入死信
+（记录错误日志，配置了落盘目录时追加写入 kea-callback-deadletter.jsonl），不会阻塞后面的回调。
+
+相关配置（settings.py，均有默认值）：
+    KEA_CALLBACK_INGEST_MODE        'sync'（默认，逐条写库）或 'buffered'（合并写回）
+    KEA_CALLBACK_FLUSH_INTERVAL_MS  最长写回间隔（毫秒）
+    KEA_CALLBACK_FLUSH_SIZE         缓冲区达到该条数时立即写回，也是一次写回的最大条数
+    KEA_CALLBACK_SPOOL_DIR          落盘目录，为空时只保存在内存中
+    KEA_CALLBACK_BUFFER_LIMIT       缓冲区最多保存的回调条数
+    KEA_CALLBACK_MAX_ATTEMPTS       单条回调写回出错的最多次数，超过后转入死信
+"""
+import atexit
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from app01 import models
+
+logger = logging.getLogger(__name__)
+
+INGEST_SYNC = 'sync'
+INGEST_BUFFERED = 'buffered'
+
+DEFAULT_FLUSH_INTERVAL_MS = 200
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_BUFFER_LIMIT = 20000
+DEFAULT_MAX_ATTEMPTS = 3
+
+# PrettyNum 主键（BigAutoField）的取值范围，超出范围的 record_id 在入队前拒绝，不会让整组写回失败
+MAX_RECORD_ID = 2 ** 63 - 1
+
+SPOOL_SUFFIX = '.spool'
+FLUSHING_SUFFIX = '.flushing'
+DEAD_LETTER_FILE = 'kea-callback-deadletter.jsonl'
+
+# kea_callback 写回的字段
+CALLBACK_RESULT_FIELDS = ['send_status', 'last_send_time', 'api_response', 'retry_count', 'next_retry_time']
+
+# 回调可以更新的原状态：成功回调不覆盖已绑定的记录（重复的成功回调不再写库），
+# 失败回调也不覆盖绑定成功/绑定失败的最终结果（晚到的旧回调不会把已绑定的记录改回失败）
+CALLBACK_UPDATABLE_STATUSES = {
+    True: ['pending', 'failed', 'retrying', 'bind_failed'],
+    False: ['pending', 'failed', 'retrying'],
+}
+
+
+def callback_updatable(record_id, is_success):
+    """ 单条回调可以按主键写回的记录（满足 CALLBACK_UPDATABLE_STATUSES 状态条件时才更新） """
+    return models.PrettyNum.objects.filter(id=record_id, send_status__in=CALLBACK_UPDATABLE_STATUSES[is_success])
+
+
+def is_callback_success(success_value):
+    """ 判断回调是否成功（支持多种格式：1、'1'、true、True） """
+    return (success_value == 1 or success_value == '1' or
+            success_value is True or success_value == 'true' or
+            success_value == 'True')
+
+
+def callback_record_id(callback_data):
+    """ 取回调中的record_id（根级别或data字段），返回去掉空格后的原始值 """
+    record_id = callback_data.get('record_id')
+    # 如果根级别没有数据，尝试从data字段获取
+    if not record_id:
+        data_field = callback_data.get('data', {})
+        if isinstance(data_field, dict):
+            record_id = data_field.get('record_id')
+    # 清理可能的前后空格
+    if isinstance(record_id, str):
+        record_id = record_id.strip()
+    return record_id
+
+
+def callback_result_fields(is_success, message, callback_data, now):
+    """ 一条回调结果对应的字段值，键与 CALLBACK_RESULT_FIELDS 相同 """
+    if is_success:
+        # API绑定成功
+        send_status, api_response = 'bound', json.dumps(callback_data)
+    else:
+        # API绑定失败，将错误信息保存到api_response中
+        send_status, api_response = 'bind_failed', json.dumps({
+            'error_message': message,
+            'callback_data': callback_data
+        })
+    return {
+        'send_status': send_status,
+        'last_send_time': now,
+        'api_response': api_response,
+        'retry_count': 0,
+        'next_retry_time': None,
+    }
+
+
+def ingest_mode():
+    return getattr(settings, 'KEA_CALLBACK_INGEST_MODE', INGEST_SYNC)
+
+
+def parse_callback(callback_data):
+    """
+    校验一条回调，转换为可以入队（JSON序列化）的结果
+
+    Returns:
+        dict: {'record_id', 'mac', 'success', 'message', 'data', 'received'}，格式错误时返回 None
+    """
+    if not isinstance(callback_data, dict):
+        return None
+    try:
+        record_id = int(callback_record_id(callback_data))
+    except (ValueError, TypeError):
+        return None
+    if not 0 < record_id <= MAX_RECORD_ID:
+        return None
+    return {
+        'record_id': record_id,
+        'mac': callback_data.get('processed_mac') or '',
+        'success': is_callback_success(callback_data.get('success')),
+        'message': callback_data.get('message', ''),
+        'data': callback_data,
+        'received': timezone.now().isoformat(),
+    }
+
+
+def apply_callback_results(items):
+    """
+    在一个事务中写回一组回调结果：锁定涉及的记录，按到达顺序逐条判断状态条件，最后一次 bulk_update
+
+    Returns:
+        dict: {'total', 'updated', 'skipped', 'not_found'}
+    """
+    ids = {item['record_id'] for item in items}
+    with transaction.atomic():
+        records = models.PrettyNum.objects.select_for_update().only(
+            'id', 'mac_address', 'send_status').in_bulk(ids)
+
+        # record_id 找不到的记录按MAC地址兜底，同样一次查询
+        fallback_macs = {item['mac'] for item in items if item['record_id'] not in records and item['mac']}
+        records_by_mac = {}
+        if fallback_macs:
+            queryset = models.PrettyNum.objects.select_for_update().only(
+                'id', 'mac_address', 'send_status').filter(mac_address__in=fallback_macs).order_by('id')
+            for ipv6_obj in queryset:
+                ipv6_obj = records.setdefault(ipv6_obj.id, ipv6_obj)
+                records_by_mac.setdefault(ipv6_obj.mac_address, ipv6_obj)
+
+        updated = {}
+        skipped = not_found = 0
+        for item in items:
+            ipv6_obj = records.get(item['record_id']) or records_by_mac.get(item['mac'])
+            if not ipv6_obj:
+                not_found += 1
+                continue
+            if ipv6_obj.send_status not in CALLBACK_UPDATABLE_STATUSES[item['success']]:
+                skipped += 1
+                continue
+            received = parse_datetime(item['received'])
+            fields = callback_result_fields(item['success'], item['message'], item['data'], received)
+            for field, value in fields.items():
+                setattr(ipv6_obj, field, value)
+            updated[ipv6_obj.id] = ipv6_obj
+
+        if updated:
+            models.PrettyNum.objects.bulk_update(list(updated.values()), CALLBACK_RESULT_FIELDS)
+
+    if not_found:
+        logger.warning(f"合并写回的回调中有 {not_found} 条未找到对应记录")
+    return {'total': len(items), 'updated': len(updated), 'skipped': skipped, 'not_found': not_found}
+
+
+class IngestStats(object):
+    """ 线程安全的合并写回计数 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.flushed = 0
+        self.updated = 0
+        self.not_found = 0
+        self.commits = 0
+        self.errors = 0
+        self.rejected = 0
+        self.dead_lettered = 0
+        self.last_flush_ms = 0.0
+
+    def incr(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def record_flush(self, result, seconds):
+        with self._lock:
+            self.flushed += result['total']
+            self.updated += result['updated']
+            self.not_found += result['not_found']
+            self.commits += 1
+            self.last_flush_ms = round(seconds * 1000, 2)
+
+    def snapshot(self, pending=0):
+        with self._lock:
+            return {
+                'enqueued': self.enqueued,
+                'flushed': self.flushed,
+                'updated': self.updated,
+                'not_found': self.not_found,
+                'commits': self.commits,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'dead_lettered': self.dead_lettered,
+                'last_flush_ms': self.last_flush_ms,
+                'pending': pending,
+            }
+
+
+class CallbackBuffer(object):
+    """ 进程内的回调缓冲区，autostart 为 True 时第一次 put() 启动后台写回线程 """
+
+    def __init__(self, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS, flush_size=DEFAULT_FLUSH_SIZE,
+                 spool_dir='', apply=apply_callback_results, autostart=True,
+                 limit=DEFAULT_BUFFER_LIMIT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_size = flush_size
+        self.spool_dir = spool_dir
+        self.limit = limit
+        self.max_attempts = max_attempts
+        self.apply = apply
+        self.autostart = autostart
+        self.stats = IngestStats()
+        self._pending = []
+        self._lock = threading.Lock()  # 保护 _pending 和落盘文件
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()  # 同一时刻只有一个线程在写回
+        self._flushing_paths = []  # 已改名、还未写回成功的落盘文件
+        self._spool_file = None
+        self._spool_seq = itertools.count()
+        self._worker = None
+
+    @property
+    def spool_path(self):
+        return os.path.join(self.spool_dir, f"kea-callback-{os.getpid()}{SPOOL_SUFFIX}")
+
+    def put(self, items):
+        """ 回调结果入队；配置了落盘目录时先追加写入落盘文件。缓冲区已满时不入队，返回 False """
+        if not items:
+            return True
+        if self.autostart and self._worker is None:
+            self.start()
+        with self._lock:
+            if len(self._pending) + len(items) > self.limit:
+                self.stats.incr('rejected', len(items))
+                return False
+            if self.spool_dir:
+                if self._spool_file is None:
+                    self._spool_file = open(self.spool_path, 'a', encoding='utf-8')
+                self._spool_file.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items))
+                self._spool_file.flush()
+            self._pending.extend(items)
+            if len(self._pending) >= self.flush_size:
+                self._wakeup.notify()
+        self.stats.incr('enqueued', len(items))
+        return True
+
+    def _take(self):
+        """ 取出待写回的回调（最多 flush_size 条），同时把当前落盘文件改名为 .flushing """
+        with self._lock:
+            items = self._pending[:self.flush_size]
+            del self._pending[:self.flush_size]
+            if self._spool_file is not None and not self._pending:
+                self._spool_file.close()
+                self._spool_file = None
+                flushing_path = f"{self.spool_path}.{next(self._spool_seq)}{FLUSHING_SUFFIX}"
+                os.replace(self.spool_path, flushing_path)
+                self._flushing_paths.append(flushing_path)
+            return items
+
+    def _apply_isolating(self, items):
+        """
+        写回一组回调；出错时二分，定位出错的回调，其余照常写回
+
+        Returns:
+            tuple: (写回的条数, 出错的单条回调列表)
+        """
+        start = time.perf_counter()
+        try:
+            result = self.apply(items)
+        except (OperationalError, InterfaceError):
+            raise
+        except Exception:
+            if len(items) == 1:
+                logger.exception(f"回调写回出错，record_id={items[0]['record_id']}")
+                return 0, items
+            middle = len(items) // 2
+            applied_left, failed_left = self._apply_isolating(items[:middle])
+            applied_right, failed_right = self._apply_isolating(items[middle:])
+            return applied_left + applied_right, failed_left + failed_right
+        self.stats.record_flush(result, time.perf_counter() - start)
+        return len(items), []
+
+    def _dead_letter(self, items):
+        """ 多次写回出错的回调转入死信：记录错误日志，配置了落盘目录时追加写入死信文件 """
+        self.stats.incr('dead_lettered', len(items))
+        logger.error(f"{len(items)} 条回调写回出错 {self.max_attempts} 次，转入死信: {items}")
+        if self.spool_dir:
+            with open(os.path.join(self.spool_dir, DEAD_LETTER_FILE), 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items))
+
+    def flush(self):
+        """
+        把缓冲区中的回调全部写回，返回写回的条数
+
+        数据库连接出错时整组放回缓冲区，下次重试；单条回调出错时只把这一条放回，
+        出错次数达到 max_attempts 后转入死信。
+        """
+        total = 0
+        retry_later = []
+        with self._flush_lock:
+            while True:
+                items = self._take()
+                if not items:
+                    break
+                try:
+                    applied, failed = self._apply_isolating(items)
+                except (OperationalError, InterfaceError):
+                    logger.exception(f"回调合并写回失败（数据库连接），{len(items)} 条留在缓冲区中等待重试")
+                    self.stats.incr('errors')
+                    retry_later.extend(items)
+                    break
+                total += applied
+                if failed:
+                    self.stats.incr('errors', len(failed))
+                    for item in failed:
+                        item['attempts'] = item.get('attempts', 0) + 1
+                    dead = [item for item in failed if item['attempts'] >= self.max_attempts]
+                    if dead:
+                        self._dead_letter(dead)
+                    retry_later.extend(item for item in failed if item['attempts'] < self.max_attempts)
+            with self._lock:
+                self._pending[:0] = retry_later
+                if not self._pending:
+                    for path in self._flushing_paths:
+                        os.remove(path)
+                    self._flushing_paths.clear()
+        return total
+
+    def _run(self):
+        """ 后台线程：每隔 flush_interval 或缓冲区满时写回一次 """
+        while True:
+            with self._lock:
+                if len(self._pending) < self.flush_size:
+                    self._wakeup.wait(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("回调写回线程出错")
+                time.sleep(self.flush_interval)
+
+    def start(self):
+        """ 启动后台写回线程（只启动一次），进程正常退出时写回剩余的回调 """
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='kea-callback-flusher', daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def snapshot(self):
+        with self._lock:
+            pending = len(self._pending)
+        return self.stats.snapshot(pending)
+
+
+def iter_spool(path):
+    """ 逐条读取落盘文件中的回调（跳过写了一半的最后一行） """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning(f"落盘文件 {path} 中有无法解析的行，已跳过")
+
+
+def spool_files(spool_dir):
+    """ 目录中遗留的落盘文件（.spool 和 .flushing），按修改时间排序 """
+    paths = glob.glob(os.path.join(spool_dir, f"kea-callback-*{SPOOL_SUFFIX}*"))
+    return sorted(paths, key=os.path.getmtime)
+
+
+def replay_spool(spool_dir, chunk_size=DEFAULT_FLUSH_SIZE):
+    """
+    重放目录中遗留的落盘文件（每 chunk_size 条一个事务），每个文件写回后删除
+
+    只能在没有 Web 进程写入该目录时执行，否则会重放正在使用的落盘文件。
+
+    Returns:
+        dict: {'files', 'total', 'updated', 'skipped', 'not_found'}
+    """
+    report = {'files': 0, 'total': 0, 'updated': 0, 'skipped': 0, 'not_found': 0}
+    for path in spool_files(spool_dir):
+        items = iter_spool(path)
+        while True:
+            chunk = list(itertools.islice(items, chunk_size))
+            if not chunk:
+                break
+            for key, value in apply_callback_results(chunk).items():
+                report[key] += value
+        os.remove(path)
+        report['files'] += 1
+    return report
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_callback_buffer():
+    """ 返回本进程共用的 CallbackBuffer """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = CallbackBuffer(
+                    flush_interval_ms=getattr(settings, 'KEA_CALLBACK_FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS),
+                    flush_size=getattr(settings, 'KEA_CALLBACK_FLUSH_SIZE', DEFAULT_FLUSH_SIZE),
+                    spool_dir=getattr(settings, 'KEA_CALLBACK_SPOOL_DIR', ''),
+                    limit=getattr(settings, 'KEA_CALLBACK_BUFFER_LIMIT', DEFAULT_BUFFER_LIMIT),
+                    max_attempts=getattr(settings, 'KEA_CALLBACK_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+                )
+    return _buffer
@@ -0,0 +1,133 @@
+"""
+预先生成的图片验证码池
+
+check_code 每次都要画文字和85个干扰元素、做边缘增强、再编码PNG，全部在请求中同步完成，
+被脚本频繁请求 /image/code/ 时（AuthMiddleware 放行该地址）CPU 会被占满。
+这里由后台线程预先生成验证码（PNG字节 + 答案）放入有界队列，请求只取出一张：
+
+    png, code_string = get_captcha_pool().get()
+
+每张验证码只发出一次；池为空时（命中失败）在请求中现场生成，不会阻塞。
+生成失败时（例如找不到字体文件）生产线程按指数退避等待后重试，不会空转占满CPU，期间请求照常现场生成。
+池的命中/未命中计数通过 /api/metrics/ 输出。
+
+相关配置（settings.py，均有默认值）：
+    CAPTCHA_POOL_SIZE  池中最多保存的验证码数，0 表示不使用验证码池
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+from app01.utils.code import render_png
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 200
+
+# 生产线程连续生成失败时的等待时间（秒）：从 FAILURE_BACKOFF 开始每次翻倍，最长 MAX_FAILURE_BACKOFF
+FAILURE_BACKOFF = 1
+MAX_FAILURE_BACKOFF = 300
+
+
+class PoolStats(object):
+    """ 线程安全的验证码池计数 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+
+    def incr(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self, size=0):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'produced': self.produced,
+                'size': size,
+            }
+
+
+class CaptchaPool(object):
+    """ 有界的验证码池，autostart 为 True 时第一次 get() 启动后台生产线程 """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, render=render_png, autostart=True):
+        self.size = size
+        self.render = render
+        self.autostart = autostart
+        self.stats = PoolStats()
+        self._queue = queue.Queue(maxsize=size)
+        self._producer = None
+        self._lock = threading.Lock()
+
+    def _produce(self):
+        """ 生产线程：池满时阻塞在 put() 上，取走一张就补一张；生成失败时按指数退避等待 """
+        delay = 0
+        while True:
+            try:
+                item = self.render()
+            except Exception:
+                delay = min(delay * 2 or FAILURE_BACKOFF, MAX_FAILURE_BACKOFF)
+                logger.exception(f"预生成验证码失败，{delay} 秒后重试")
+                time.sleep(delay)
+                continue
+            delay = 0
+            self._queue.put(item)
+            self.stats.incr('produced')
+
+    def start(self):
+        """ 启动生产线程（只启动一次） """
+        with self._lock:
+            if self._producer is None:
+                self._producer = threading.Thread(target=self._produce, name='captcha-pool', daemon=True)
+                self._producer.start()
+
+    def get(self):
+        """ 取出一张验证码 (PNG字节, 验证码)，池为空时现场生成 """
+        if self.autostart and self._producer is None:
+            self.start()
+        try:
+            item = self._queue.get_nowait()
+        except queue.Empty:
+            self.stats.incr('misses')
+            return self.render()
+        self.stats.incr('hits')
+        return item
+
+    def fill(self):
+        """ 在当前线程中把池填满（启动时预热、测试用） """
+        while not self._queue.full():
+            try:
+                self._queue.put_nowait(self.render())
+            except queue.Full:
+                break
+            self.stats.incr('produced')
+
+    def snapshot(self):
+        return self.stats.snapshot(self._queue.qsize())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_captcha_pool():
+    """ 返回本进程共用的 CaptchaPool；CAPTCHA_POOL_SIZE 为 0 时返回 None """
+    global _pool
+    size = getattr(settings, 'CAPTCHA_POOL_SIZE', DEFAULT_POOL_SIZE)
+    if size <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = CaptchaPool(size)
+    return _pool
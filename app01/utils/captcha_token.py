@@ -0,0 +1,140 @@
+"""
+无状态的图片验证码令牌
+
+默认模式下 /image/code/ 把答案写入会话（每次都写一次会话存储），login 再读回来比较。
+CAPTCHA_STATELESS = True 时改为把答案放进带 HMAC 签名和时间戳的令牌（Cookie），login 只验签，不访问会话存储：
+
+    token = make_token(code_string)          # image_code：写入 Cookie
+    error = check_token(token, user_input)   # login：None 表示通过，否则为错误提示
+
+令牌内容为 {随机数, HMAC(随机数 + 答案)}，不含答案明文；签名和过期时间由 django.core.signing 校验。
+每个令牌只能提交一次（无论答案对错）：用过的随机数记在进程内的 NonceCache 中，保留到令牌过期为止。
+多进程部署时各进程的 NonceCache 互不共享，同一令牌最多能在每个进程各用一次，仍然受过期时间限制。
+NonceCache 记满（未过期的随机数达到 CAPTCHA_NONCE_CAPACITY）时拒绝新的令牌，而不是淘汰未过期的随机数
+（淘汰后对应的令牌可以重放）；容量应不小于单个进程的登录提交峰值（次/秒）× CAPTCHA_TOKEN_MAX_AGE。
+
+相关配置（settings.py，均有默认值）：
+    CAPTCHA_STATELESS        是否使用无状态令牌
+    CAPTCHA_TOKEN_MAX_AGE    令牌有效期（秒）
+    CAPTCHA_NONCE_CAPACITY   每个进程最多记住的已用随机数个数
+"""
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+logger = logging.getLogger(__name__)
+
+COOKIE_NAME = 'captcha_token'
+
+DEFAULT_MAX_AGE = 60
+
+# NonceCache 最多记住的未过期随机数个数，记满时拒绝新的令牌
+DEFAULT_NONCE_CAPACITY = 100000
+
+_SALT = 'app01.captcha_token'
+
+
+def is_stateless():
+    return getattr(settings, 'CAPTCHA_STATELESS', False)
+
+
+def token_max_age():
+    return getattr(settings, 'CAPTCHA_TOKEN_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+class NonceCacheFull(Exception):
+    """ 未过期的随机数已记满，无法再确认新令牌没有被用过 """
+
+
+class NonceCache(object):
+    """ 带过期时间的已用随机数集合，线程安全 """
+
+    def __init__(self, capacity=DEFAULT_NONCE_CAPACITY):
+        self.capacity = capacity
+        self._expires = OrderedDict()  # 随机数 -> 过期时间，按写入顺序（令牌有效期相同，也就是按过期时间）
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """ 淘汰已过期的随机数 """
+        while self._expires and next(iter(self._expires.values())) <= now:
+            self._expires.popitem(last=False)
+
+    def use(self, nonce, ttl):
+        """
+        记录随机数，已经用过时返回 False
+
+        Raises:
+            NonceCacheFull: 未过期的随机数已记满
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            if nonce in self._expires:
+                return False
+            if len(self._expires) >= self.capacity:
+                raise NonceCacheFull(f"已用验证码令牌达到上限 {self.capacity}")
+            self._expires[nonce] = now + ttl
+            return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._expires)
+
+
+_used_nonces = None
+_used_nonces_lock = threading.Lock()
+
+
+def get_used_nonces():
+    """ 返回本进程共用的 NonceCache """
+    global _used_nonces
+    if _used_nonces is None:
+        with _used_nonces_lock:
+            if _used_nonces is None:
+                _used_nonces = NonceCache(getattr(settings, 'CAPTCHA_NONCE_CAPACITY', DEFAULT_NONCE_CAPACITY))
+    return _used_nonces
+
+
+def _answer_digest(nonce, answer):
+    return salted_hmac(_SALT, f"{nonce}:{answer.upper()}").hexdigest()
+
+
+def make_token(answer):
+    """ 生成验证码答案的签名令牌 """
+    nonce = secrets.token_urlsafe(12)
+    return signing.dumps({'n': nonce, 'd': _answer_digest(nonce, answer)}, salt=_SALT)
+
+
+def check_token(token, answer, nonces=None):
+    """
+    校验用户输入的验证码
+
+    Returns:
+        str: 错误提示，校验通过时返回 None
+    """
+    if not token:
+        return "验证码已失效，请刷新验证码"
+    max_age = token_max_age()
+    try:
+        payload = signing.loads(token, salt=_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        return "验证码已过期，请刷新验证码"
+    except signing.BadSignature:
+        return "验证码已失效，请刷新验证码"
+    if nonces is None:
+        nonces = get_used_nonces()
+    try:
+        if not nonces.use(payload['n'], max_age):
+            return "验证码已使用，请刷新验证码"
+    except NonceCacheFull:
+        logger.warning("已用验证码令牌记满，拒绝登录提交，请调大 CAPTCHA_NONCE_CAPACITY")
+        return "登录请求过多，请稍后刷新验证码重试"
+    if not constant_time_compare(payload['d'], _answer_digest(payload['n'], answer or "")):
+        return "验证码错误"
+    return None
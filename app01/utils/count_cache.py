@@ -0,0 +1,76 @@
+"""
+列表页 COUNT 缓存
+
+Pagination 每次翻页都要执行 SELECT COUNT(*)，这里把结果按 “模型 + 查询SQL” 缓存起来：
+
+    total_count = cached_count(queryset)
+
+缓存键中包含查询涉及的每张表的“版本号”，任何一张表的记录保存/删除时（post_save / post_delete 信号，
+见 app01/signals.py）版本号加一，旧的缓存自然失效；另外设置过期时间，兜底 update()/bulk_create()
+这类不发信号的批量操作。
+
+相关配置（settings.py，均有默认值）：
+    COUNT_CACHE_TIMEOUT  缓存秒数
+"""
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_TIMEOUT = 60
+
+_VERSION_KEY = "count:version:{}"
+
+
+def _new_version():
+    """ 新的版本号取当前时间，版本键被缓存淘汰后重新生成也不会与旧缓存键中的版本号相同 """
+    return time.time_ns()
+
+
+def _model_version(label):
+    """ 取表的版本号，不存在时初始化 """
+    key = _VERSION_KEY.format(label)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _query_models(queryset):
+    """ 查询涉及的所有模型（主表 + JOIN 的表） """
+    tables = {alias.table_name for alias in queryset.query.alias_map.values()}
+    labels = {queryset.model._meta.label_lower}
+    for model in apps.get_models():
+        if model._meta.db_table in tables:
+            labels.add(model._meta.label_lower)
+    return sorted(labels)
+
+
+def cached_count(queryset, timeout=None):
+    """ 返回 queryset.count()，结果按查询SQL和所涉及表的版本号缓存 """
+    if timeout is None:
+        timeout = getattr(settings, 'COUNT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    sql, params = queryset.query.sql_with_params()
+    signature = hashlib.md5(repr((sql, params)).encode('utf-8')).hexdigest()
+    versions = ",".join(f"{label}.{_model_version(label)}" for label in _query_models(queryset))
+    key = f"count:{queryset.model._meta.label_lower}:{signature}:{versions}"
+
+    total_count = cache.get(key)
+    if total_count is None:
+        total_count = queryset.count()
+        cache.set(key, total_count, timeout)
+    return total_count
+
+
+def invalidate_model_counts(model):
+    """ 使某个模型相关的 COUNT 缓存全部失效 """
+    key = _VERSION_KEY.format(model._meta.label_lower)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 版本号还不存在（或已被淘汰）
+        cache.set(key, _new_version(), None)
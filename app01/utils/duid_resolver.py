@@ -0,0 +1,113 @@
+"""
+按MAC地址查找设备DUID
+
+DUID 优先取设备表（Device），设备表中没有时取已审批（status=1）的申请（DeviceApproval）。
+两张表通过 UNION ALL 在一次查询中取回，结果在当前作用域内缓存（包括查不到的MAC），
+同一请求/同一批次内重复查找同一个MAC不会再访问数据库。
+
+    resolver = get_duid_resolver()
+    duid = resolver.resolve(mac)                 # 单个
+    duid_by_mac = resolver.resolve_many(macs)    # 批量，一次查询
+
+作用域由 duid_scope() 建立：每个HTTP请求由 DuidScopeMiddleware 建立一个作用域，
+管理命令可以用 with duid_scope(): 包住一个批次。没有作用域时每次调用都使用新的缓存。
+线程池中的任务不会继承作用域，需要用 in_current_scope(fn) 包装后再提交。
+"""
+import contextvars
+import logging
+from contextlib import contextmanager
+
+from django.db.models import IntegerField, Value
+
+from app01 import models
+
+logger = logging.getLogger(__name__)
+
+# 来源优先级：数字越小越优先
+SOURCE_DEVICE = 0
+SOURCE_APPROVAL = 1
+
+_current_resolver = contextvars.ContextVar('duid_resolver', default=None)
+
+
+class DuidResolver(object):
+    """ 带缓存的DUID查找 """
+
+    def __init__(self):
+        self._cache = {}  # mac -> duid（查不到为 None）
+        self.queries = 0
+
+    def resolve(self, mac_address):
+        """ 返回MAC对应的DUID，查不到返回 None """
+        if not mac_address:
+            return None
+        return self.resolve_many([mac_address]).get(mac_address)
+
+    def resolve_many(self, mac_addresses):
+        """
+        批量查找DUID，未缓存的MAC合并为一次查询
+
+        Returns:
+            dict: {mac: duid}，只包含查到DUID的MAC
+        """
+        macs = {mac for mac in mac_addresses if mac}
+        missing = macs - self._cache.keys()
+        if missing:
+            found = self._query(missing)
+            for mac in missing:
+                self._cache[mac] = found.get(mac)
+        return {mac: self._cache[mac] for mac in macs if self._cache[mac]}
+
+    def _query(self, macs):
+        """ 执行查询，同一MAC在两张表中都有时取设备表的DUID """
+        self.queries += 1
+        found = {}
+        for mac, duid, source in duid_queryset(macs):
+            if not duid:
+                continue
+            if mac not in found or source < found[mac][1]:
+                found[mac] = (duid, source)
+        logger.info(f"批量查找DUID: {len(macs)} 个MAC，找到 {len(found)} 个")
+        return {mac: duid for mac, (duid, _) in found.items()}
+
+
+def duid_queryset(macs):
+    """ 一次 UNION ALL 查询设备表和已审批的申请，返回 (mac, duid, 来源) """
+    devices = models.Device.objects.filter(mac_address__in=macs, duid__isnull=False).annotate(
+        source=Value(SOURCE_DEVICE, output_field=IntegerField())
+    ).values_list('mac_address', 'duid', 'source')
+    approvals = models.DeviceApproval.objects.filter(
+        mac_address__in=macs, status=1, duid__isnull=False
+    ).annotate(
+        source=Value(SOURCE_APPROVAL, output_field=IntegerField())
+    ).values_list('mac_address', 'duid', 'source')
+    return devices.union(approvals, all=True)
+
+
+def get_duid_resolver():
+    """ 返回当前作用域的 DuidResolver，没有作用域时返回一个新的 """
+    return _current_resolver.get() or DuidResolver()
+
+
+@contextmanager
+def duid_scope():
+    """ 建立一个DUID缓存作用域，作用域内的 get_duid_resolver() 共用同一个缓存 """
+    resolver = DuidResolver()
+    token = _current_resolver.set(resolver)
+    try:
+        yield resolver
+    finally:
+        _current_resolver.reset(token)
+
+
+def in_current_scope(fn):
+    """ 包装在线程池中执行的函数，使其共享调用方当前作用域的DUID缓存 """
+    resolver = _current_resolver.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current_resolver.set(resolver)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_resolver.reset(token)
+    return wrapper
@@ -89,7 +89,10 @@ class PrettyModelForm(BootStrapModelForm):
 
     def clean_ipv6_address(self):
         txt_ipv6_address = self.cleaned_data["ipv6_address"]
-        exists = models.PrettyNum.objects.filter(ipv6_address=txt_ipv6_address).exists()
+        try:
+            exists = models.PrettyNum.objects.by_address(txt_ipv6_address).exists()
+        except ValueError:
+            raise ValidationError("IPv6地址格式错误")
         if exists:
             raise ValidationError("IPv6地址已存在")
         return txt_ipv6_address
@@ -102,7 +105,10 @@ class PrettyEditModelForm(BootStrapModelForm):
 
     def clean_ipv6_address(self):
         txt_ipv6_address = self.cleaned_data["ipv6_address"]
-        exists = models.PrettyNum.objects.exclude(id=self.instance.pk).filter(ipv6_address=txt_ipv6_address).exists()
+        try:
+            exists = models.PrettyNum.objects.exclude(id=self.instance.pk).by_address(txt_ipv6_address).exists()
+        except ValueError:
+            raise ValidationError("IPv6地址格式错误")
         if exists:
             raise ValidationError("IPv6地址已存在")
         return txt_ipv6_address
@@ -2,11 +2,43 @@ import requests
 import json
 import logging
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
+from app01.utils.kea_client import get_kea_client, circuit_open_result, CircuitOpenError
+from app01.utils.duid_resolver import get_duid_resolver
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# KEA API 接口路径（地址见 settings.KEA_API_BASE_URL）
+KEA_WEBHOOK_PATH = "/webhook/kea"
+KEA_BATCH_WEBHOOK_PATH = "/webhook/kea/batch"
+
+# 批量发送时每个请求最多携带的记录数，可在 settings.KEA_API_BATCH_SIZE 中覆盖
+DEFAULT_BATCH_SIZE = 100
+
+# 未配置 settings.KEA_CALLBACK_URL 时使用的占位回调地址
+PLACEHOLDER_CALLBACK_URL = "http://your-server-ip:8000/api/kea/callback/"
+
+
+def _is_api_success(response_data):
+    """ 检查KEA API返回数据中的成功标志（支持 1、'1'、True、'true'、'success' 等多种格式） """
+    if not isinstance(response_data, dict):
+        return False
+    # 可能的成功标志字段
+    success_indicators = [
+        response_data.get('success'),
+        response_data.get('status'),
+        response_data.get('result'),
+        response_data.get('code')
+    ]
+    return any(
+        indicator == 1 or indicator == '1' or indicator is True or
+        indicator == 'true' or indicator == 'success' or indicator == 'Success'
+        for indicator in success_indicators if indicator is not None
+    )
+
+
 def extract_ipv6_last_64_bits(ipv6_address):
     """
     提取IPv6地址的后64位
@@ -35,6 +67,15 @@ def extract_ipv6_last_64_bits(ipv6_address):
         return None
 
 
+def default_callback_url():
+    """
+    没有请求可以推算本系统地址时（命令行中的重试等）使用的 kea_callback 地址
+
+    未配置 settings.KEA_CALLBACK_URL 时返回占位地址，KEA 的回调无法送达，记录会一直停在 pending。
+    """
+    return getattr(settings, 'KEA_CALLBACK_URL', '') or PLACEHOLDER_CALLBACK_URL
+
+
 def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_url=None):
     """
     发送完整的IPv6地址和MAC地址到KEA API，并包含对应的DUID信息
@@ -44,7 +85,7 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
         ipv6_address (str): 完整的IPv6地址
         mac_address (str): MAC地址
         duid (str): 设备DUID，如果不提供则尝试通过MAC地址查找
-        callback_url (str): 回调URL，如果不提供则自动生成
+        callback_url (str): 回调URL，如果不提供则使用 settings.KEA_CALLBACK_URL
 
     Returns:
         dict: 包含发送结果的字典
@@ -65,23 +106,14 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
                 'error': 'IPv6地址不能为空'
             }
 
-        # 处理DUID：优先使用传入参数，如果没有则通过MAC地址查找
+        # 处理DUID：优先使用传入参数，如果没有则通过MAC地址查找（设备表优先，其次已审批的申请）
         if not duid and mac_address:
             try:
-                from app01 import models
-                # 在设备表中查找对应的DUID
-                device = models.Device.objects.filter(mac_address=mac_address).first()
-                if device and device.duid:
-                    duid = device.duid
+                duid = get_duid_resolver().resolve(mac_address)
+                if duid:
                     logger.info(f"通过MAC地址 {mac_address} 找到对应的DUID: {duid}")
                 else:
-                    # 如果设备表没有DUID，则尝试在审批表中查找已审批的记录
-                    approval = models.DeviceApproval.objects.filter(mac_address=mac_address, status=1).first()
-                    if approval and approval.duid:
-                        duid = approval.duid
-                        logger.info(f"通过审批表根据MAC {mac_address} 找到对应的DUID: {duid}")
-                    else:
-                        logger.info(f"MAC地址 {mac_address} 在设备表和审批表中均未找到对应的DUID记录")
+                    logger.info(f"MAC地址 {mac_address} 在设备表和审批表中均未找到对应的DUID记录")
             except Exception as e:
                 logger.warning(f"查找DUID时出现异常: {str(e)}")
 
@@ -90,7 +122,7 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
             logger.warning(f"无法获取DUID信息，MAC地址: {mac_address}")
 
         # 准备发送数据
-        api_url = "http://222.204.3.179:3003/webhook/kea"
+        client = get_kea_client()
         headers = {
             "Content-Type": "application/json",
             "User-Agent": "IoT-IPv6-Management-System/1.0"
@@ -98,7 +130,7 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
 
         # 如果没有提供回调URL，生成默认的回调URL
         if not callback_url:
-            callback_url = "http://your-server-ip:8000/api/kea/callback/"  # 替换为实际的服务器地址
+            callback_url = default_callback_url()
 
         payload = {
             "record_id": record_id,  # 添加记录ID
@@ -109,17 +141,12 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
             "callback_url": callback_url  # 添加回调URL
         }
 
-        logger.info(f"发送到KEA API: {api_url}")
+        logger.info(f"发送到KEA API: {client.url(KEA_WEBHOOK_PATH)}")
         logger.info(f"发送的payload数据: record_id={record_id}, ipv6_address={ipv6_address}, mac_address={mac_address}")
         print(f"DEBUG API发送: record_id={record_id}, ipv6_address={ipv6_address}, mac_address={mac_address}")
         
-        # 发送请求（设置10秒超时）
-        response = requests.post(
-            api_url,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=10
-        )
+        # 通过共享连接池发送请求（连接/读取超时见 settings.KEA_API_*_TIMEOUT）
+        response = client.post(KEA_WEBHOOK_PATH, payload, headers=headers)
         
         # 解析响应
         try:
@@ -128,30 +155,13 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
             response_data = {"raw_response": response.text}
         
         # 检查API返回的成功标志
-        api_success = False
-        if response.status_code == 200:
-            # 检查返回数据中的成功标志
-            if isinstance(response_data, dict):
-                # 可能的成功标志字段
-                success_indicators = [
-                    response_data.get('success'),
-                    response_data.get('status'),
-                    response_data.get('result'),
-                    response_data.get('code')
-                ]
-                # 检查是否有成功标志 (支持多种成功标志格式)
-                api_success = any(
-                    indicator == 1 or indicator == '1' or indicator is True or 
-                    indicator == 'true' or indicator == 'success' or indicator == 'Success'
-                    for indicator in success_indicators if indicator is not None
-                )
-        
+        api_success = response.status_code == 200 and _is_api_success(response_data)
+
         logger.info(f"API响应: 状态码={response.status_code}, 数据={response_data}, 成功={api_success}")
 
         # 调试信息：记录具体的判断过程
         if not api_success and response.status_code == 200:
             logger.warning(f"KEA API返回200但判断为失败，响应数据: {response_data}")
-            logger.warning(f"成功指标检查: {success_indicators}")
 
         return {
             'success': api_success,
@@ -160,8 +170,12 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
             'error': None
         }
         
+    except CircuitOpenError as e:
+        # 熔断中不发出请求、不等待超时
+        return circuit_open_result(e)
+
     except requests.exceptions.Timeout:
-        error_msg = "API请求超时（10秒）"
+        error_msg = f"API请求超时（{get_kea_client().timeout_text}）"
         logger.error(error_msg)
         return {
             'success': False,
@@ -191,6 +205,120 @@ def send_to_kea_api(record_id, ipv6_address, mac_address, duid=None, callback_ur
         }
 
 
+def send_batch_to_kea_api(entries, callback_url=None):
+    """
+    把多条IPv6绑定请求打包成一个请求发送到KEA API（批量接口）
+
+    KEA 对每条记录的绑定结果仍然通过回调返回，批量回调为结果数组，由 kea_callback 统一处理。
+
+    Args:
+        entries (list): 每项为 {'record_id', 'ipv6_address', 'mac_address', 'duid'}，
+            条数不能超过 settings.KEA_API_BATCH_SIZE；duid 为空时按MAC地址一次查询批量查找
+        callback_url (str): 回调URL，如果不提供则使用 settings.KEA_CALLBACK_URL
+
+    Returns:
+        dict: 与 send_to_kea_api 相同格式的结果，作用于整批记录
+    """
+    batch_size = get_batch_size()
+    if len(entries) > batch_size:
+        raise ValueError(f"单次批量发送最多 {batch_size} 条，实际 {len(entries)} 条")
+
+    try:
+        if not entries:
+            return {
+                'success': False,
+                'status_code': None,
+                'response_data': None,
+                'error': '批量发送的记录不能为空'
+            }
+
+        # 一次查询补齐缺少的DUID
+        duid_by_mac = get_duid_resolver().resolve_many(
+            entry['mac_address'] for entry in entries if not entry.get('duid')
+        )
+
+        records = [
+            {
+                "record_id": entry['record_id'],
+                "ipv6_address": entry['ipv6_address'],
+                "mac_address": entry['mac_address'],
+                "duid": entry.get('duid') or duid_by_mac.get(entry['mac_address']),
+            }
+            for entry in entries
+        ]
+
+        client = get_kea_client()
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "IoT-IPv6-Management-System/1.0"
+        }
+        if not callback_url:
+            callback_url = default_callback_url()
+
+        payload = {
+            "records": records,
+            "timestamp": datetime.now().isoformat(),
+            "callback_url": callback_url
+        }
+
+        logger.info(f"批量发送到KEA API: {client.url(KEA_BATCH_WEBHOOK_PATH)}, 记录数={len(records)}")
+        response = client.post(KEA_BATCH_WEBHOOK_PATH, payload, headers=headers)
+
+        try:
+            response_data = response.json()
+        except ValueError:
+            response_data = {"raw_response": response.text}
+
+        api_success = response.status_code == 200 and _is_api_success(response_data)
+        logger.info(f"批量API响应: 状态码={response.status_code}, 记录数={len(records)}, 成功={api_success}")
+
+        return {
+            'success': api_success,
+            'status_code': response.status_code,
+            'response_data': response_data,
+            'error': None
+        }
+
+    except CircuitOpenError as e:
+        # 熔断中不发出请求、不等待超时
+        return circuit_open_result(e)
+
+    except requests.exceptions.Timeout:
+        error_msg = f"批量API请求超时（{get_kea_client().timeout_text}）"
+        logger.error(error_msg)
+        return {
+            'success': False,
+            'status_code': None,
+            'response_data': None,
+            'error': error_msg
+        }
+
+    except requests.exceptions.ConnectionError:
+        error_msg = "无法连接到API服务器"
+        logger.error(error_msg)
+        return {
+            'success': False,
+            'status_code': None,
+            'response_data': None,
+            'error': error_msg
+        }
+
+    except Exception as e:
+        error_msg = f"批量发送API请求时出错: {str(e)}"
+        logger.error(error_msg)
+        return {
+            'success': False,
+            'status_code': None,
+            'response_data': None,
+            'error': error_msg
+        }
+
+
+def get_batch_size():
+    """ 批量发送时每个请求最多携带的记录数 """
+    return getattr(settings, 'KEA_API_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
 def send_device_offline_to_api(device_id, duid, mac_address):
     """
     发送设备下线请求到KEA API，并包含对应的IPv6地址信息
@@ -216,7 +344,7 @@ def send_device_offline_to_api(device_id, duid, mac_address):
             try:
                 from app01 import models
                 # 在IPv6地址表中查找对应的记录
-                ipv6_record = models.PrettyNum.objects.filter(mac_address=mac_address).first()
+                ipv6_record = models.PrettyNum.objects.by_mac(mac_address).first()
                 if ipv6_record and ipv6_record.ipv6_address:
                     # 获取完整的IPv6地址
                     ipv6_address = ipv6_record.ipv6_address
@@ -227,7 +355,7 @@ def send_device_offline_to_api(device_id, duid, mac_address):
                 logger.warning(f"查找IPv6地址时出现异常: {str(e)}")
 
         # 准备发送数据
-        api_url = "http://222.204.3.179:3003/webhook/kea"
+        client = get_kea_client()
         headers = {
             "Content-Type": "application/json",
             "User-Agent": "IoT-IPv6-Management-System/1.0"
@@ -248,15 +376,10 @@ def send_device_offline_to_api(device_id, duid, mac_address):
             "callback_url": callback_url,  # 设备下线回调URL
         }
 
-        logger.info(f"发送设备下线请求到API: {api_url}, 数据: {payload}")
+        logger.info(f"发送设备下线请求到API: {client.url(KEA_WEBHOOK_PATH)}, 数据: {payload}")
 
-        # 发送请求（设置10秒超时）
-        response = requests.post(
-            api_url,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=10
-        )
+        # 通过共享连接池发送请求
+        response = client.post(KEA_WEBHOOK_PATH, payload, headers=headers)
 
         # 解析响应
         try:
@@ -294,8 +417,12 @@ def send_device_offline_to_api(device_id, duid, mac_address):
             'error': None
         }
 
+    except CircuitOpenError as e:
+        # 熔断中不发出请求、不等待超时
+        return circuit_open_result(e)
+
     except requests.exceptions.Timeout:
-        error_msg = "设备下线API请求超时（10秒）"
+        error_msg = f"设备下线API请求超时（{get_kea_client().timeout_text}）"
         logger.error(error_msg)
         return {
             'success': False,
@@ -3,6 +3,7 @@ import json
 import logging
 from datetime import datetime
 from django.utils import timezone
+from app01.utils.kea_client import get_kea_client, circuit_open_result, CircuitOpenError
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -36,7 +37,7 @@ def send_ipv6_config_to_api(config_obj, callback_url=None):
             }
 
         # 准备发送数据
-        api_url = "http://222.204.3.179:3003/webhook/kea-add"
+        client = get_kea_client()
         headers = {
             "Content-Type": "application/json",
             "User-Agent": "IPv6-Config-System/1.0"
@@ -57,17 +58,12 @@ def send_ipv6_config_to_api(config_obj, callback_url=None):
             "callback_url": callback_url
         }
 
-        logger.info(f"发送IPv6配置到API: {api_url}")
+        logger.info(f"发送IPv6配置到API: {client.url(API_ENDPOINTS['KEA_ADD'])}")
         logger.info(f"发送的payload数据: config_id={config_obj.id}, VLAN={config_obj.vlan_id}, gateway={config_obj.gateway}")
         print(f"DEBUG IPv6配置API发送: config_id={config_obj.id}, VLAN={config_obj.vlan_id}, gateway={config_obj.gateway}")
         
-        # 发送请求（设置10秒超时）
-        response = requests.post(
-            api_url,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=10
-        )
+        # 通过共享连接池发送请求
+        response = client.post(API_ENDPOINTS['KEA_ADD'], payload, headers=headers)
         
         # 解析响应
         try:
@@ -87,8 +83,12 @@ def send_ipv6_config_to_api(config_obj, callback_url=None):
             'error': None
         }
         
+    except CircuitOpenError as e:
+        # 熔断中不发出请求、不等待超时
+        return circuit_open_result(e)
+
     except requests.exceptions.Timeout:
-        error_msg = "IPv6配置API请求超时（10秒）"
+        error_msg = f"IPv6配置API请求超时（{get_kea_client().timeout_text}）"
         logger.error(error_msg)
         return {
             'success': False,
@@ -212,9 +212,9 @@ def format_conflict_message(conflicts):
     return f"数据有冲突: {', '.join(conflict_fields)}"
 
 
-# 常量定义
+# 常量定义（接口路径，地址见 settings.KEA_API_BASE_URL）
 API_ENDPOINTS = {
-    'KEA_ADD': 'http://222.204.3.179:3003/webhook/kea-add'
+    'KEA_ADD': '/webhook/kea-add'
 }
 
 DEFAULT_HEADERS = {
@@ -222,5 +222,4 @@ DEFAULT_HEADERS = {
     "User-Agent": "IPv6-Config-System/1.0"
 }
 
-# 请求超时设置（秒）
-REQUEST_TIMEOUT = 10
+# 请求超时设置（秒）见 settings.KEA_API_CONNECT_TIMEOUT / KEA_API_READ_TIMEOUT
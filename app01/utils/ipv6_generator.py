@@ -1,4 +1,10 @@
 import ipaddress
+import re
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，未安装时批量生成退化为纯Python整数运算
+    np = None
 
 
 def generate_ipv6(department: int, building: int, service: int, mac: str) -> str:
@@ -76,3 +82,335 @@ def validate_mac_address(mac: str) -> bool:
         return True
     except ValueError:
         return False
+
+
+# ---------------------------------------------------------------------------
+# 批量生成
+# ---------------------------------------------------------------------------
+
+IPV6_PREFIX = "240c:c901:a:a"
+
+# 0-0xffff 的十六进制文本（不补零），与 ipaddress 压缩表示中每组的写法一致
+_HEX16 = [format(i, "x") for i in range(1 << 16)]
+_HEX_ONLY = re.compile(r"[0-9a-f]*")
+
+
+def _zero_run(mask):
+    """
+    计算后4组中需要用 "::" 压缩的连续零组区间
+
+    与 ipaddress 的规则一致：取最长的一段连续零组（长度至少为2），长度相同时取靠前的一段。
+    前缀4组固定非零，因此零组只可能出现在后4组。
+
+    Args:
+        mask: 4位掩码，第i位为1表示后4组中的第i组为0
+
+    Returns:
+        tuple: (起始组, 结束组(不含))，没有可压缩的零组时返回 None
+    """
+    best_start, best_len = -1, 0
+    i = 0
+    while i < 4:
+        if mask >> i & 1:
+            j = i
+            while j < 4 and mask >> j & 1:
+                j += 1
+            if j - i > best_len:
+                best_start, best_len = i, j - i
+            i = j
+        else:
+            i += 1
+    if best_len < 2:
+        return None
+    return best_start, best_start + best_len
+
+
+_ZERO_RUNS = [_zero_run(mask) for mask in range(16)]
+
+
+def _format_groups(groups, run):
+    """ 把后4组的十六进制文本按压缩规则拼接成完整地址（纯Python路径） """
+    if run is None:
+        return f"{IPV6_PREFIX}:{':'.join(groups)}"
+    start, end = run
+    head = IPV6_PREFIX + "".join(":" + g for g in groups[:start])
+    return head + "::" + ":".join(groups[end:])
+
+
+def _broadcast(values, size, name):
+    """ 把标量参数扩展成长度为 size 的列表，序列参数则校验长度 """
+    if isinstance(values, int):
+        return [values] * size
+    values = list(values)
+    if len(values) != size:
+        raise ValueError(f"{name} 的长度({len(values)})与MAC地址数量({size})不一致")
+    return values
+
+
+def _clean_macs(macs):
+    """
+    批量清洗MAC地址，与 generate_ipv6 的处理保持一致：去掉冒号并转为小写
+
+    先对拼接后的整段文本做一次十六进制校验，只有校验失败时才逐行定位出错的行。
+
+    Returns:
+        str: 所有MAC地址拼接后的十六进制文本（每个12字符）
+
+    Raises:
+        ValueError: MAC地址格式错误，错误信息中包含出错的行号
+    """
+    cleaned = [mac.replace(":", "").lower() for mac in macs]
+    joined = "".join(cleaned)
+    if len(joined) == 12 * len(cleaned) and _HEX_ONLY.fullmatch(joined):
+        return joined
+    for index, mac_hex in enumerate(cleaned):
+        if len(mac_hex) != 12:
+            raise ValueError(f"第{index}行: MAC 地址格式错误，应为 12 个十六进制字符")
+        if not _HEX_ONLY.fullmatch(mac_hex):
+            raise ValueError(f"第{index}行: MAC 地址包含非十六进制字符: {macs[index]}")
+    return joined
+
+
+def _check_range(values, upper, message):
+    """ 校验编号范围 [0, upper)，失败时抛出带行号的 ValueError """
+    if np is not None and isinstance(values, np.ndarray):
+        bad = np.flatnonzero((values < 0) | (values >= upper))
+        index = int(bad[0]) if bad.size else None
+    else:
+        index = next((i for i, value in enumerate(values) if not (0 <= value < upper)), None)
+    if index is not None:
+        raise ValueError(f"第{index}行: {message}")
+
+
+def _str_add(left, right):
+    """ 逐元素拼接字符串数组（numpy 2.x 为 np.strings，旧版本为 np.char） """
+    return getattr(np, "strings", np.char).add(left, right)
+
+
+def _generate_batch_numpy(departments, buildings, services, mac_hex):
+    """ NumPy 路径：整列做位运算打包接口ID，再按零组掩码分组批量拼接文本 """
+    departments = np.asarray(departments, dtype=np.int64)
+    buildings = np.asarray(buildings, dtype=np.int64)
+    services = np.asarray(services, dtype=np.int64)
+
+    _check_range(departments, 16, "部门编号必须在 0-15 范围内")
+    _check_range(buildings, 256, "楼栋编号必须在 0-255 范围内")
+    _check_range(services, 16, "业务类型编号必须在 0-15 范围内")
+
+    # 部门4b + 楼栋8b + 业务4b 组成接口ID的最高16位，MAC 为低48位
+    extra = (departments << 12) | (buildings << 4) | services
+    mac_bytes = np.frombuffer(bytes.fromhex(mac_hex), dtype=np.uint8).reshape(-1, 6).astype(np.uint64)
+    mac = np.zeros(len(mac_bytes), dtype=np.uint64)
+    for column in range(6):
+        mac = (mac << np.uint64(8)) | mac_bytes[:, column]
+    interface_id = (extra.astype(np.uint64) << np.uint64(48)) | mac
+
+    # 拆成4个16位分组
+    shifts = np.array([48, 32, 16, 0], dtype=np.uint64)
+    groups = ((interface_id[:, None] >> shifts) & np.uint64(0xFFFF)).astype(np.intp)
+    hex_text = np.array(_HEX16)[groups]
+    masks = (groups == 0).astype(np.intp) @ np.array([1, 2, 4, 8], dtype=np.intp)
+
+    result = np.empty(len(groups), dtype=object)
+    for mask in np.unique(masks):
+        rows = np.flatnonzero(masks == mask)
+        part = hex_text[rows]
+        run = _ZERO_RUNS[int(mask)]
+        start, end = run if run is not None else (4, 4)
+
+        text = np.full(len(rows), IPV6_PREFIX, dtype="<U39")
+        for column in range(start):
+            text = _str_add(_str_add(text, ":"), part[:, column])
+        if run is not None:
+            text = _str_add(text, "::")
+            for column in range(end, 4):
+                if column > end:
+                    text = _str_add(text, ":")
+                text = _str_add(text, part[:, column])
+        result[rows] = text.tolist()
+    return result.tolist()
+
+
+def _generate_batch_python(departments, buildings, services, mac_hex):
+    """ 纯Python路径：逐行做整数位运算，跳过 ipaddress 解析 """
+    _check_range(departments, 16, "部门编号必须在 0-15 范围内")
+    _check_range(buildings, 256, "楼栋编号必须在 0-255 范围内")
+    _check_range(services, 16, "业务类型编号必须在 0-15 范围内")
+
+    hex16 = _HEX16
+    result = []
+    for index, (department, building, service) in enumerate(zip(departments, buildings, services)):
+        extra = (department << 12) | (building << 4) | service
+        mac = int(mac_hex[index * 12:index * 12 + 12], 16)
+        groups = (extra, mac >> 32, (mac >> 16) & 0xFFFF, mac & 0xFFFF)
+        mask = (groups[0] == 0) | (groups[1] == 0) << 1 | (groups[2] == 0) << 2 | (groups[3] == 0) << 3
+        result.append(_format_groups([hex16[g] for g in groups], _ZERO_RUNS[mask]))
+    return result
+
+
+def generate_ipv6_batch(departments, buildings, services, macs):
+    """
+    批量生成IPv6地址，输出与逐个调用 generate_ipv6 完全一致
+
+    整列校验参数范围，用整数位移一次性拼出接口ID，再批量输出压缩格式的文本，
+    省去逐个地址的二进制字符串拼接和 ipaddress 解析。安装了 numpy 时走向量化路径。
+
+    Args:
+        departments: 部门编号序列 (0-15)，也可以传单个整数表示全部相同
+        buildings: 楼栋编号序列 (0-255)，也可以传单个整数
+        services: 业务类型编号序列 (0-15)，也可以传单个整数
+        macs: MAC地址序列 (格式: XX:XX:XX:XX:XX:XX)
+
+    Returns:
+        list: 与 macs 一一对应的IPv6地址字符串
+
+    Raises:
+        ValueError: 参数范围错误或MAC地址格式错误，错误信息中包含出错的行号
+    """
+    macs = list(macs)
+    size = len(macs)
+    departments = _broadcast(departments, size, "departments")
+    buildings = _broadcast(buildings, size, "buildings")
+    services = _broadcast(services, size, "services")
+    if not size:
+        return []
+
+    mac_hex = _clean_macs(macs)
+    if np is not None:
+        return _generate_batch_numpy(departments, buildings, services, mac_hex)
+    return _generate_batch_python(departments, buildings, services, mac_hex)
+
+
+# ---------------------------------------------------------------------------
+# 整数表示
+# ---------------------------------------------------------------------------
+
+_SIGN_BIT = 1 << 63
+_LOW64 = (1 << 64) - 1
+
+
+def u64_to_db(value: int) -> int:
+    """
+    把无符号64位整数映射到有符号 BIGINT 的取值范围
+
+    减去 2^63 是保序映射：无符号大小关系与映射后的有符号大小关系一致，
+    因此数据库里的等值和范围查询都可以直接使用映射后的值。
+    """
+    return value - _SIGN_BIT
+
+
+def u64_from_db(value: int) -> int:
+    """ u64_to_db 的逆映射 """
+    return value + _SIGN_BIT
+
+
+def ipv6_to_int_pair(ipv6_address: str) -> tuple:
+    """
+    把IPv6地址拆成 (高64位前缀, 低64位接口ID) 两个无符号整数
+
+    压缩格式和完整格式的同一地址得到相同的结果。
+
+    Raises:
+        ValueError: IPv6地址格式错误
+    """
+    value = int(ipaddress.IPv6Address(ipv6_address))
+    return value >> 64, value & _LOW64
+
+
+def ipv6_from_int_pair(prefix: int, interface_id: int) -> str:
+    """ ipv6_to_int_pair 的逆运算，返回压缩格式的IPv6地址 """
+    return str(ipaddress.IPv6Address((prefix << 64) | interface_id))
+
+
+def ipv6_to_db_pair(ipv6_address: str) -> tuple:
+    """
+    返回写入 PrettyNum.ipv6_prefix / ipv6_iid 两列的值
+
+    Raises:
+        ValueError: IPv6地址格式错误
+    """
+    prefix, interface_id = ipv6_to_int_pair(ipv6_address)
+    return u64_to_db(prefix), u64_to_db(interface_id)
+
+
+# ---------------------------------------------------------------------------
+# 按地址结构查询
+# ---------------------------------------------------------------------------
+
+IPV6_PREFIX_INT = int(ipaddress.IPv6Address(IPV6_PREFIX + "::")) >> 64
+
+# 接口ID高16位的字段布局: (字段名, 位宽, 最低位所在位置)
+SLOT_FIELDS = (
+    ("department", 4, 60),
+    ("building", 8, 52),
+    ("service", 4, 48),
+)
+
+# 未指定的高位字段展开成多个区间时允许的最大区间数，超过后改用位运算过滤
+MAX_SLOT_RANGES = 16
+
+
+def slot_iid_ranges(department=None, building=None, service=None, max_ranges=MAX_SLOT_RANGES):
+    """
+    把 "部门/楼栋/业务类型" 条件转换为接口ID（无符号）的区间
+
+    三个字段在接口ID中从高到低排列，连续指定的高位字段直接对应一个区间；
+    中间缺失的字段在区间数不超过 max_ranges 时逐个展开，否则剩余字段
+    交给调用方用位运算过滤。
+
+    Args:
+        department: 部门编号 (0-15)，None 表示不限
+        building: 楼栋编号 (0-255)，None 表示不限
+        service: 业务类型编号 (0-15)，None 表示不限
+
+    Returns:
+        tuple: (区间列表 [(起始, 结束)]（闭区间）, 需要位运算过滤的字段列表 [(位置, 位宽, 值)])
+
+    Raises:
+        ValueError: 参数范围错误
+    """
+    values = {"department": department, "building": building, "service": service}
+    for name, width, _ in SLOT_FIELDS:
+        value = values[name]
+        if value is not None and not (0 <= value < 1 << width):
+            raise ValueError(f"{name} 必须在 0-{(1 << width) - 1} 范围内")
+
+    # 从高位开始逐个字段展开：每个区间用 (已确定的高位值, 已确定的位数) 表示
+    ranges = [(0, 0)]
+    residual = []
+    for index, (name, width, shift) in enumerate(SLOT_FIELDS):
+        value = values[name]
+        later_specified = any(values[n] is not None for n, _, _ in SLOT_FIELDS[index + 1:])
+        if value is not None:
+            ranges = [((high << width) | value, bits + width) for high, bits in ranges]
+        elif later_specified and len(ranges) << width <= max_ranges:
+            ranges = [((high << width) | v, bits + width) for high, bits in ranges for v in range(1 << width)]
+        else:
+            # 从这个字段开始无法再用区间表达，剩余已指定的字段改用位运算过滤
+            residual = [
+                (s, w, values[n]) for n, w, s in SLOT_FIELDS[index + 1:] if values[n] is not None
+            ]
+            break
+
+    # 合并首尾相接的区间（例如展开后又全部需要位运算过滤时，16个区间合并为1个）
+    result = []
+    for high, bits in ranges:
+        low_bits = 64 - bits
+        first = high << low_bits
+        last = first | ((1 << low_bits) - 1)
+        if result and result[-1][1] + 1 == first:
+            result[-1] = (result[-1][0], last)
+        else:
+            result.append((first, last))
+    return result, residual
+
+
+def network_int_range(cidr: str) -> tuple:
+    """
+    返回网段 (如 240c:c901:a:a:1a00::/72) 覆盖的128位整数闭区间
+
+    Raises:
+        ValueError: 网段格式错误
+    """
+    network = ipaddress.IPv6Network(cidr, strict=False)
+    return int(network.network_address), int(network.broadcast_address)
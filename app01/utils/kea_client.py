@@ -0,0 +1,373 @@
+"""
+KEA API 共享HTTP客户端
+
+进程内所有发往KEA的请求（IPv6绑定、设备下线、IPv6配置）共用一个带连接池的
+requests.Session，保持长连接，避免每次请求都重新建立TCP连接。
+
+使用方式：
+    from app01.utils.kea_client import get_kea_client
+
+    client = get_kea_client()
+    response = client.post('/webhook/kea', payload, headers={...})
+
+请求经过熔断器（CircuitBreaker）：最近的请求中失败（网络错误、5xx、超过慢请求阈值）的比例达到阈值时熔断，
+熔断期间 post() 直接抛出 CircuitOpenError，不再等待超时；熔断时间过后放行少量试探请求（半开），
+试探成功则恢复，失败则再次熔断。
+
+相关配置（settings.py，均有默认值）：
+    KEA_API_BASE_URL         KEA API 地址
+    KEA_API_POOL_SIZE        每个主机保持的最大连接数
+    KEA_API_CONNECT_TIMEOUT  建立连接超时（秒）
+    KEA_API_READ_TIMEOUT     读取响应超时（秒）
+    KEA_BREAKER_*            熔断器参数，见 CircuitBreaker
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "http://222.204.3.179:3003"
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3
+DEFAULT_READ_TIMEOUT = 10
+
+DEFAULT_BREAKER_WINDOW = 20
+DEFAULT_BREAKER_MIN_CALLS = 5
+DEFAULT_BREAKER_FAILURE_RATE = 0.5
+DEFAULT_BREAKER_SLOW_CALL_SECONDS = 5
+DEFAULT_BREAKER_OPEN_SECONDS = 30
+DEFAULT_BREAKER_HALF_OPEN_CALLS = 1
+
+
+class ClientStats(object):
+    """ 线程安全的请求计数，用于观察连接复用情况 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+    def incr(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            requests_count = self.requests
+            new_connections = self.new_connections
+            return {
+                'requests': requests_count,
+                'new_connections': new_connections,
+                # 没有新建连接的请求即复用了连接池中的长连接，省掉了一次TCP握手
+                'reused_connections': max(requests_count - new_connections, 0),
+                'reuse_ratio': round(1 - new_connections / requests_count, 4) if requests_count else 0.0,
+                'errors': self.errors,
+                'avg_latency_ms': round(self.total_seconds * 1000 / requests_count, 2) if requests_count else 0.0,
+            }
+
+
+def _counting_pool(pool_class, stats):
+    """ 生成一个在新建连接时计数的连接池类 """
+
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            stats.incr('new_connections')
+            return super()._new_conn()
+
+    CountingPool.__name__ = f"Counting{pool_class.__name__}"
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    """ 使用计数连接池的 HTTPAdapter """
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """ 熔断器打开，请求未发出 """
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"KEA API 熔断中，{retry_after:.0f} 秒后重试" if retry_after else "KEA API 熔断中，正在试探恢复")
+
+
+def circuit_open_result(error):
+    """
+    熔断中请求未发出时各发送函数的返回值（格式与 send_to_kea_api 等相同），调用方按发送失败处理（进入重试）
+
+    :param error: CircuitOpenError
+    """
+    logger.warning(str(error))
+    return {
+        'success': False,
+        'status_code': None,
+        'response_data': None,
+        'error': str(error),
+        'retry_after': error.retry_after
+    }
+
+
+class CircuitBreaker(object):
+    """
+    线程安全的熔断器
+
+    closed:    正常放行，记录最近 window_size 次请求的结果；至少 min_calls 次且失败比例 >= failure_rate 时熔断
+    open:      直接拒绝（CircuitOpenError），open_seconds 秒后进入 half_open
+    half_open: 最多放行 half_open_calls 个试探请求，全部成功则恢复 closed，任一失败则重新 open
+
+    耗时超过 slow_call_seconds 的请求即使成功也计为失败（KEA 变慢时同样会占满工作线程）。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window_size=DEFAULT_BREAKER_WINDOW, min_calls=DEFAULT_BREAKER_MIN_CALLS,
+                 failure_rate=DEFAULT_BREAKER_FAILURE_RATE, slow_call_seconds=DEFAULT_BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds=DEFAULT_BREAKER_OPEN_SECONDS, half_open_calls=DEFAULT_BREAKER_HALF_OPEN_CALLS,
+                 clock=time.monotonic):
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._window = deque(maxlen=window_size)  # 最近的请求结果，True 表示失败
+        self._opened_at = 0.0
+        self._trial_calls = 0  # 半开状态已放行的试探请求数
+        self._trial_successes = 0
+        self.trips = 0
+        self.rejected = 0
+        self.slow_calls = 0
+
+    def _retry_after(self, now):
+        return max(self._opened_at + self.open_seconds - now, 0.0)
+
+    def _trip(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._window.clear()
+        self.trips += 1
+        logger.warning(f"KEA API 熔断：{self.open_seconds} 秒内请求直接失败（累计熔断 {self.trips} 次）")
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and not self._retry_after(self.clock()):
+                return self.HALF_OPEN
+            return self._state
+
+    def retry_after(self):
+        """ 距离恢复试探还有多少秒，未熔断时为 0 """
+        with self._lock:
+            return self._retry_after(self.clock()) if self._state == self.OPEN else 0.0
+
+    def before_call(self):
+        """ 请求前调用：熔断中（或半开状态的试探名额已用完）时抛出 CircuitOpenError """
+        with self._lock:
+            now = self.clock()
+            if self._state == self.OPEN:
+                retry_after = self._retry_after(now)
+                if retry_after:
+                    self.rejected += 1
+                    raise CircuitOpenError(retry_after)
+                self._state = self.HALF_OPEN
+                self._trial_calls = self._trial_successes = 0
+            if self._state == self.HALF_OPEN:
+                if self._trial_calls >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(0)
+                self._trial_calls += 1
+
+    def record(self, failed, seconds):
+        """ 请求结束后调用：failed 为网络错误或 5xx，耗时超过慢请求阈值同样计为失败 """
+        with self._lock:
+            if seconds >= self.slow_call_seconds:
+                self.slow_calls += 1
+                failed = True
+            now = self.clock()
+            if self._state == self.HALF_OPEN:
+                if failed:
+                    self._trip(now)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self._state = self.CLOSED
+                        logger.info("KEA API 试探请求成功，熔断恢复")
+                return
+            if self._state == self.OPEN:
+                # 熔断前已经发出的请求，结果不再计入
+                return
+            self._window.append(failed)
+            if len(self._window) >= self.min_calls and sum(self._window) / len(self._window) >= self.failure_rate:
+                self._trip(now)
+
+    def snapshot(self):
+        with self._lock:
+            now = self.clock()
+            state = self._state
+            if state == self.OPEN and not self._retry_after(now):
+                state = self.HALF_OPEN
+            return {
+                'state': state,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'slow_calls': self.slow_calls,
+                'failure_rate': round(sum(self._window) / len(self._window), 4) if self._window else 0.0,
+                'retry_after': round(self._retry_after(now), 1) if self._state == self.OPEN else 0.0,
+            }
+
+
+class KeaClient(object):
+    """ 带连接池和长连接的KEA API客户端 """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT, breaker=None):
+        """
+        :param base_url: KEA API 地址，例如 http://222.204.3.179:3003
+        :param pool_size: 每个主机保持的最大连接数，并发超过该值时新建的连接用完即关闭
+        :param connect_timeout: 建立连接超时（秒）
+        :param read_timeout: 读取响应超时（秒）
+        :param breaker: 熔断器，默认使用默认参数的 CircuitBreaker
+        """
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.stats = ClientStats()
+        self.breaker = breaker or CircuitBreaker()
+
+        adapter = _CountingAdapter(self.stats, pool_connections=4, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def timeout_text(self):
+        """ 用于错误提示的超时说明 """
+        return f"连接{self.connect_timeout}秒/读取{self.read_timeout}秒"
+
+    @property
+    def host(self):
+        """ KEA API 主机（用于按主机限速） """
+        return urlsplit(self.base_url).netloc
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def post(self, path, payload, headers=None):
+        """
+        以JSON格式POST到KEA API
+
+        :param path: 接口路径，例如 /webhook/kea
+        :param payload: 请求数据（会被序列化为JSON）
+        :param headers: 额外的请求头
+        :return: requests.Response，网络错误时抛出 requests 的异常，熔断中抛出 CircuitOpenError
+        """
+        self.breaker.before_call()
+        start = time.perf_counter()
+        self.stats.incr('requests')
+        failed = True
+        try:
+            response = self.session.post(
+                self.url(path),
+                headers=headers,
+                data=json.dumps(payload),
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+            failed = response.status_code >= 500
+            return response
+        except requests.exceptions.RequestException:
+            self.stats.incr('errors')
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.stats.incr('total_seconds', seconds)
+            self.breaker.record(failed, seconds)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_kea_client():
+    """ 返回进程内共享的 KeaClient，首次调用时按 settings 创建 """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = KeaClient(
+                    base_url=getattr(settings, 'KEA_API_BASE_URL', DEFAULT_BASE_URL),
+                    pool_size=getattr(settings, 'KEA_API_POOL_SIZE', DEFAULT_POOL_SIZE),
+                    connect_timeout=getattr(settings, 'KEA_API_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                    read_timeout=getattr(settings, 'KEA_API_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+                    breaker=CircuitBreaker(
+                        window_size=getattr(settings, 'KEA_BREAKER_WINDOW', DEFAULT_BREAKER_WINDOW),
+                        min_calls=getattr(settings, 'KEA_BREAKER_MIN_CALLS', DEFAULT_BREAKER_MIN_CALLS),
+                        failure_rate=getattr(settings, 'KEA_BREAKER_FAILURE_RATE', DEFAULT_BREAKER_FAILURE_RATE),
+                        slow_call_seconds=getattr(settings, 'KEA_BREAKER_SLOW_CALL_SECONDS',
+                                                  DEFAULT_BREAKER_SLOW_CALL_SECONDS),
+                        open_seconds=getattr(settings, 'KEA_BREAKER_OPEN_SECONDS', DEFAULT_BREAKER_OPEN_SECONDS),
+                        half_open_calls=getattr(settings, 'KEA_BREAKER_HALF_OPEN_CALLS',
+                                                DEFAULT_BREAKER_HALF_OPEN_CALLS),
+                    ),
+                )
+                logger.info(f"创建KEA API客户端: {_client.base_url}, 连接池大小={getattr(settings, 'KEA_API_POOL_SIZE', DEFAULT_POOL_SIZE)}")
+    return _client
+
+
+class HostRateLimiter(object):
+    """
+    按主机限速的令牌桶，多线程共享
+
+    每个主机每秒最多放行 rate 个请求，允许 burst 个请求的突发（默认 1，即均匀放行）；
+    rate 为 0 或 None 时不限速。
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or 1
+        self._lock = threading.Lock()
+        self._buckets = {}  # host -> (剩余令牌, 上次补充时间)
+
+    def acquire(self, host):
+        """ 取一个令牌，令牌不足时阻塞等待 """
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,424 @@
+"""
+KEA发送调度
+
+视图只负责把待发送的记录写入发送队列（KeaOutbox），与 PrettyNum 在同一事务中提交，
+随后立即返回；kea_outbox_worker 命令从队列中领取记录并发往KEA，
+KEA 的最终绑定结果仍然通过 kea_callback 回调写回。
+
+发送失败的记录按指数退避（带随机抖动）设置 next_retry_time，
+由 kea_retry_scheduler 命令在到期后自动重试，超过最大次数后停止自动重试。
+
+    视图:      enqueue_kea_send(ipv6_obj, duid, callback_url)，批量审批: enqueue_kea_sends()
+    worker:    claim_outbox_batch() -> send_outbox_entry() -> finish_outbox_entry()
+               批量模式: group_outbox_entries() -> send_outbox_group() -> finish_outbox_group()
+    scheduler: claim_due_retries() -> send_to_kea_api() -> apply_retry_result() -> save_retry_results()
+               回调地址优先使用入队时保存的地址（stored_callback_urls()），没有时使用 settings.KEA_CALLBACK_URL
+
+领取时设置的租期不会续期：每批领取的记录数不超过 lease_batch_limit()，最慢的情况下也能在租期内写回；
+写回时只更新仍由本次领取持有的记录（状态和领取时写入的时间都没有变），
+租期过后被其他进程重新领取的记录、以及期间已经收到 kea_callback 的记录都不会被覆盖。
+"""
+import json
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from app01 import models
+from app01.utils.ipv6_api import send_to_kea_api, send_batch_to_kea_api
+from app01.utils.kea_client import get_kea_client
+
+logger = logging.getLogger(__name__)
+
+# 领取后的租期（秒），超过租期仍未完成的记录会被其他 worker 重新领取
+DEFAULT_LEASE_SECONDS = 60
+
+# 一批记录需要在租期的这个比例内发送完，剩余时间留给DUID查询和写回结果
+LEASE_SEND_BUDGET = 0.8
+
+# 自动重试的默认退避参数，可在 settings 中用 KEA_RETRY_* 覆盖
+DEFAULT_RETRY_BASE_DELAY = 30
+DEFAULT_RETRY_MAX_DELAY = 3600
+DEFAULT_RETRY_MAX_ATTEMPTS = 8
+
+# 重试结果写回数据库时更新的字段
+RETRY_RESULT_FIELDS = ['send_status', 'api_response', 'next_retry_time']
+
+
+def retry_delay(attempt):
+    """
+    第 attempt 次重试前的等待秒数
+
+    指数增长并封顶，取其一半作为固定部分、另一半随机抖动，
+    避免同一时刻失败的大量记录在同一时刻集中重试。
+    """
+    base = getattr(settings, 'KEA_RETRY_BASE_DELAY', DEFAULT_RETRY_BASE_DELAY)
+    cap = getattr(settings, 'KEA_RETRY_MAX_DELAY', DEFAULT_RETRY_MAX_DELAY)
+    delay = min(base * 2 ** max(attempt - 1, 0), cap)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def schedule_retry(ipv6_obj, now=None, min_delay=0):
+    """
+    为发送失败的记录设置下一次自动重试时间（不保存）
+
+    min_delay 为最短等待秒数（KEA 熔断中被拒绝的请求至少等到熔断结束）
+
+    Returns:
+        bool: 是否安排了重试；重试次数已达上限时返回 False，next_retry_time 置空，只能手动重试
+    """
+    max_attempts = getattr(settings, 'KEA_RETRY_MAX_ATTEMPTS', DEFAULT_RETRY_MAX_ATTEMPTS)
+    if ipv6_obj.retry_count >= max_attempts:
+        ipv6_obj.next_retry_time = None
+        return False
+    delay = max(retry_delay(ipv6_obj.retry_count + 1), min_delay)
+    ipv6_obj.next_retry_time = (now or timezone.now()) + timedelta(seconds=delay)
+    return True
+
+
+def enqueue_kea_send(ipv6_obj, duid=None, callback_url=None):
+    """
+    把IPv6记录加入KEA发送队列，并把记录状态置为 pending
+
+    需要在调用方的事务中执行，保证队列记录与 PrettyNum 同时提交或同时回滚。
+    """
+    if ipv6_obj.send_status != 'pending':
+        ipv6_obj.send_status = 'pending'
+        ipv6_obj.save(update_fields=['send_status'])
+    return models.KeaOutbox.objects.create(pretty=ipv6_obj, duid=duid, callback_url=callback_url)
+
+
+def enqueue_kea_sends(ipv6_objs, duids, callback_url=None):
+    """
+    批量加入KEA发送队列（批量审批使用），duids 与 ipv6_objs 一一对应
+
+    记录的 send_status 由调用方置为 pending 并写入；需要在调用方的事务中执行。
+    """
+    return models.KeaOutbox.objects.bulk_create(
+        [models.KeaOutbox(pretty=obj, duid=duid, callback_url=callback_url) for obj, duid in zip(ipv6_objs, duids)],
+        batch_size=500,
+    )
+
+
+def stored_callback_urls(record_ids):
+    """
+    各记录最近一次入队时保存的回调地址（视图按请求地址生成），重试时优先使用
+
+    Returns:
+        dict: {记录ID: 回调地址}，没有保存回调地址的记录不在其中
+    """
+    urls = {}
+    rows = (models.KeaOutbox.objects.filter(pretty_id__in=record_ids)
+            .exclude(callback_url__isnull=True).exclude(callback_url='')
+            .order_by('-id').values_list('pretty_id', 'callback_url'))
+    for pretty_id, callback_url in rows:
+        urls.setdefault(pretty_id, callback_url)
+    return urls
+
+
+def claimable_outbox(now):
+    """ 可以领取的队列记录：待发送，或发送中但租期已过（命中 outbox_status_time_idx） """
+    return models.KeaOutbox.objects.filter(
+        status__in=['pending', 'sending'], available_time__lte=now
+    ).order_by('id')
+
+
+def claim_outbox_batch(limit, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    领取一批待发送的队列记录
+
+    使用 select_for_update(skip_locked=True)，多个 worker 同时运行时不会领取到同一条记录。
+    领取后状态改为 sending，并把可领取时间顺延一个租期；新的 available_time 即本次领取的凭据，
+    finish_outbox_entry()/finish_outbox_group() 只完成凭据未变（没有被重新领取）的记录。
+
+    Returns:
+        list: KeaOutbox 列表（已关联 pretty）
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            claimable_outbox(now).select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        models.KeaOutbox.objects.filter(id__in=ids).update(
+            status='sending',
+            attempts=F('attempts') + 1,
+            available_time=now + timedelta(seconds=lease_seconds),
+        )
+    return list(models.KeaOutbox.objects.filter(id__in=ids).select_related('pretty').order_by('id'))
+
+
+def send_outbox_entry(entry):
+    """ 发送一条队列记录到KEA，只做网络请求，不写数据库，可以在线程池中并发执行 """
+    ipv6_obj = entry.pretty
+    return send_to_kea_api(
+        record_id=ipv6_obj.id,
+        ipv6_address=ipv6_obj.ipv6_address,
+        mac_address=ipv6_obj.mac_address,
+        duid=entry.duid,
+        callback_url=entry.callback_url
+    )
+
+
+def apply_send_result(ipv6_obj, result, now=None):
+    """
+    把 send_to_kea_api 的结果写到 IPv6 记录上（不保存）
+
+    HTTP 200 表示请求已送达，状态保持 pending 等待 kea_callback 确认；
+    其余情况置为 failed，并安排自动重试。
+
+    Returns:
+        bool: HTTP请求是否送达
+    """
+    ipv6_obj.last_send_time = now or timezone.now()
+    ipv6_obj.api_response = json.dumps(result['response_data']) if result['response_data'] else result.get('error', '')
+    ipv6_obj.retry_count = 0
+    ipv6_obj.next_retry_time = None
+    delivered = result.get('status_code') == 200
+    ipv6_obj.send_status = 'pending' if delivered else 'failed'
+    if not delivered:
+        schedule_retry(ipv6_obj, ipv6_obj.last_send_time, result.get('retry_after', 0))
+    return delivered
+
+
+def _owned_outbox(entries):
+    """ 锁定仍由本次领取持有的队列记录（状态为 sending 且 available_time 仍为领取时的租期），返回其ID集合 """
+    return set(
+        models.KeaOutbox.objects.select_for_update()
+        .filter(id__in=[entry.id for entry in entries], status='sending',
+                available_time=entries[0].available_time)
+        .values_list('id', flat=True)
+    )
+
+
+def finish_outbox_entry(entry, result):
+    """
+    根据发送结果更新队列记录和对应的IPv6记录
+
+    租期已过、记录已被其他 worker 重新领取时不写回（由重新领取的 worker 完成）。
+    """
+    ipv6_obj = entry.pretty
+    delivered = apply_send_result(ipv6_obj, result)
+    status = 'done' if delivered else 'failed'
+    last_error = None if delivered else (
+        result.get('error') or f"API返回失败状态码: {result.get('status_code', 'Unknown')}"
+    )
+    with transaction.atomic():
+        if not _owned_outbox([entry]):
+            logger.warning(f"队列ID {entry.id} 的租期已过并被重新领取，本次发送结果不写回")
+            return delivered
+        # 只在记录仍为 pending 时更新，避免覆盖已经先一步到达的 kea_callback 结果
+        models.PrettyNum.objects.filter(id=ipv6_obj.id, send_status='pending').update(
+            send_status=ipv6_obj.send_status,
+            last_send_time=ipv6_obj.last_send_time,
+            api_response=ipv6_obj.api_response,
+            retry_count=ipv6_obj.retry_count,
+            next_retry_time=ipv6_obj.next_retry_time,
+        )
+        models.KeaOutbox.objects.filter(id=entry.id).update(status=status, last_error=last_error)
+    entry.status, entry.last_error = status, last_error
+    if not delivered:
+        logger.warning(f"KEA发送失败，记录ID {ipv6_obj.id} 已置为failed: {entry.last_error}")
+    return delivered
+
+
+def group_outbox_entries(entries, batch_size):
+    """ 按 callback_url 分组并切成每组不超过 batch_size 条，用于批量发送 """
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry.callback_url, []).append(entry)
+    return [
+        group[start:start + batch_size]
+        for group in groups.values()
+        for start in range(0, len(group), batch_size)
+    ]
+
+
+def send_outbox_group(entries):
+    """ 把同一 callback_url 的一组队列记录打包成一个请求发送，只做网络请求，不写数据库 """
+    return send_batch_to_kea_api(
+        [
+            {
+                'record_id': entry.pretty.id,
+                'ipv6_address': entry.pretty.ipv6_address,
+                'mac_address': entry.pretty.mac_address,
+                'duid': entry.duid,
+            }
+            for entry in entries
+        ],
+        callback_url=entries[0].callback_url
+    )
+
+
+def finish_outbox_group(entries, result):
+    """
+    根据批量发送结果更新一组队列记录和对应的IPv6记录，已被其他 worker 重新领取的记录不写回
+
+    Returns:
+        bool: 整批是否送达
+    """
+    now = timezone.now()
+    ipv6_objs = [entry.pretty for entry in entries]
+    delivered = False
+    for ipv6_obj in ipv6_objs:
+        delivered = apply_send_result(ipv6_obj, result, now)
+    last_error = None if delivered else (
+        result.get('error') or f"API返回失败状态码: {result.get('status_code', 'Unknown')}"
+    )
+
+    with transaction.atomic():
+        owned = _owned_outbox(entries)
+        if len(owned) < len(entries):
+            logger.warning(f"{len(entries) - len(owned)} 条队列记录的租期已过并被重新领取，本次发送结果不写回")
+        owned_pretty_ids = [entry.pretty_id for entry in entries if entry.id in owned]
+        # 只更新仍为 pending 的记录，避免覆盖已经先一步到达的 kea_callback 结果；
+        # 加行锁直到事务结束，读取之后、bulk_update 之前提交的回调会等本事务结束后再写入，不会被覆盖
+        still_pending = set(
+            models.PrettyNum.objects.select_for_update()
+            .filter(id__in=owned_pretty_ids, send_status='pending')
+            .values_list('id', flat=True)
+        )
+        models.PrettyNum.objects.bulk_update(
+            [obj for obj in ipv6_objs if obj.id in still_pending],
+            ['send_status', 'last_send_time', 'api_response', 'retry_count', 'next_retry_time']
+        )
+        models.KeaOutbox.objects.filter(id__in=owned).update(
+            status='done' if delivered else 'failed',
+            last_error=last_error,
+        )
+    for entry in entries:
+        if entry.id in owned:
+            entry.status = 'done' if delivered else 'failed'
+            entry.last_error = last_error
+    if not delivered:
+        logger.warning(f"KEA批量发送失败，{len(entries)} 条记录已置为failed: {last_error}")
+    return delivered
+
+
+def lease_batch_limit(lease_seconds, concurrency, items_per_request=1):
+    """
+    一个租期内能发送完的最大记录数，按每个请求都等满连接超时+读取超时估算
+
+    每批领取的记录数不超过该值，KEA 无响应时整批也能在租期内写回结果，不会被其他进程重新领取后重复发送。
+    租期短于单个请求的超时时间时仍然返回一轮并发的记录数，并记录警告。
+    """
+    client = get_kea_client()
+    per_request = client.connect_timeout + client.read_timeout
+    rounds = int(lease_seconds * LEASE_SEND_BUDGET // per_request)
+    if rounds < 1:
+        logger.warning(f"租期 {lease_seconds} 秒短于KEA请求超时（{client.timeout_text}），记录可能被重复领取")
+        rounds = 1
+    return rounds * max(concurrency, 1) * items_per_request
+
+
+def due_retries(now):
+    """ 到期需要自动重试的记录，按到期时间排序（命中 prettynum_retry_due_idx） """
+    return models.PrettyNum.objects.filter(
+        send_status__in=['failed', 'retrying'], next_retry_time__lte=now
+    ).order_by('next_retry_time')
+
+
+def manual_retries(now):
+    """
+    手动重试（retry_ipv6_send）的记录：发送失败或重试中的记录
+
+    pending 状态是等待API回调，不重试；正被 kea_retry_scheduler 处理（租期未到）的记录也跳过。
+    """
+    return models.PrettyNum.objects.filter(
+        send_status__in=['failed', 'retrying']
+    ).exclude(
+        send_status='retrying', next_retry_time__gt=now
+    )
+
+
+def claim_due_retries(limit, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    领取一批到期需要重试的IPv6记录
+
+    条件为 send_status 为 failed/retrying 且 next_retry_time <= now（命中 prettynum_retry_due_idx），
+    使用 select_for_update(skip_locked=True)，多个调度进程同时运行时不会重复发送。
+    领取后状态改为 retrying、重试次数加一，last_send_time 记为领取时间，next_retry_time 顺延一个租期，
+    调度进程中途退出时记录会在租期结束后被重新领取。结果用 save_retry_results() 写回。
+
+    Returns:
+        list: PrettyNum 列表
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            due_retries(now).select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        models.PrettyNum.objects.filter(id__in=ids).update(
+            send_status='retrying',
+            retry_count=F('retry_count') + 1,
+            last_send_time=now,
+            next_retry_time=now + timedelta(seconds=lease_seconds),
+        )
+    return list(
+        models.PrettyNum.objects.filter(id__in=ids)
+        .only('id', 'ipv6_address', 'mac_address', 'retry_count', 'last_send_time')
+        .order_by('id')
+    )
+
+
+def apply_retry_result(ipv6_obj, result, now=None):
+    """
+    把重试发送的结果写到IPv6记录上（不保存）
+
+    送达后置为 pending 等待回调；失败则置为 failed 并按退避策略安排下一次重试。
+    需要保存的字段见 RETRY_RESULT_FIELDS。
+
+    Returns:
+        bool: HTTP请求是否送达
+    """
+    ipv6_obj.api_response = json.dumps(result['response_data']) if result['response_data'] else result.get('error', '')
+    if result['success']:
+        ipv6_obj.send_status = 'pending'
+        ipv6_obj.next_retry_time = None
+        return True
+    ipv6_obj.send_status = 'failed'
+    schedule_retry(ipv6_obj, now, result.get('retry_after', 0))
+    return False
+
+
+def save_retry_results(records):
+    """
+    写回重试结果（RETRY_RESULT_FIELDS），只更新仍由本次领取持有的记录
+
+    在一个事务中锁定 send_status 仍为 retrying 且 last_send_time 仍为领取时写入的时间的记录，
+    再一次 bulk_update 写回：期间 kea_callback 已写回结果、或租期过后被其他进程重新领取的记录不会被覆盖。
+
+    Returns:
+        int: 实际写回的记录数
+    """
+    if not records:
+        return 0
+    # 按领取时间分组（一次领取的记录领取时间相同），每组一个条件
+    claims = {}
+    for ipv6_obj in records:
+        claims.setdefault(ipv6_obj.last_send_time, []).append(ipv6_obj.id)
+    owned_condition = Q()
+    for claim_time, ids in claims.items():
+        owned_condition |= Q(id__in=ids, last_send_time=claim_time)
+
+    with transaction.atomic():
+        owned = set(
+            models.PrettyNum.objects.select_for_update()
+            .filter(owned_condition, send_status='retrying')
+            .values_list('id', flat=True)
+        )
+        models.PrettyNum.objects.bulk_update(
+            [ipv6_obj for ipv6_obj in records if ipv6_obj.id in owned], RETRY_RESULT_FIELDS
+        )
+    if len(owned) < len(records):
+        logger.warning(f"{len(records) - len(owned)} 条重试结果未写回：记录已收到回调或已被重新领取")
+    return len(owned)
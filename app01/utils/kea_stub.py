@@ -0,0 +1,133 @@
+"""
+本地KEA webhook桩服务，用于开发和压测
+
+模拟KEA API的 /webhook/kea（单条）和 /webhook/kea/batch（批量）接口：
+收到请求后立即返回 {"success": 1}，并把每条记录的绑定结果放入回调队列，
+按请求中的 callback_url 回调（单条请求回调一个JSON对象，批量请求回调一个结果数组）。
+
+    python manage.py kea_stub_server --port 3003
+
+在进程内使用时（例如基准测试），可以不启动回调线程，直接从 server.callbacks 取出回调自行处理。
+"""
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from app01.utils.callback_auth import signature_headers
+
+logger = logging.getLogger(__name__)
+
+SINGLE_PATH = "/webhook/kea"
+BATCH_PATH = "/webhook/kea/batch"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持长连接
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._reply(400, {'success': 0, 'message': '请求体不是合法的JSON'})
+            return
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        if self.path == BATCH_PATH:
+            records, batched = payload.get('records', []), True
+        elif self.path == SINGLE_PATH and 'record_id' in payload:
+            records, batched = [payload], False
+        else:
+            # 设备下线、IPv6配置等其他接口只返回成功
+            records, batched = [], False
+
+        server.stats_incr(len(records))
+        if records and server.enable_callback:
+            results = [server.bind_result(record) for record in records]
+            server.callbacks.put((payload.get('callback_url'), results if batched else results[0]))
+
+        self._reply(200, {'success': 1, 'received': len(records)})
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class KeaStubServer(ThreadingHTTPServer):
+    """ KEA webhook 桩服务 """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0, fail_rate=0, enable_callback=True, callback_secret=''):
+        """
+        :param address: 监听地址，端口为 0 时自动分配
+        :param delay: 每个请求的模拟处理耗时（秒）
+        :param fail_rate: 绑定失败的比例（0~1），失败的记录回调 success=0
+        :param enable_callback: 是否生成回调
+        :param callback_secret: 回调签名密钥（与 settings.KEA_CALLBACK_SECRET 相同），为空时不签名
+        """
+        super().__init__(address, _Handler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.enable_callback = enable_callback
+        self.callback_secret = callback_secret
+        self.callbacks = queue.Queue()
+        self.request_count = 0
+        self.record_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats_incr(self, records):
+        with self._lock:
+            self.request_count += 1
+            self.record_count += records
+
+    def bind_result(self, record):
+        """ 生成一条记录的回调结果，格式与KEA回调一致 """
+        if self.fail_rate and random.random() < self.fail_rate:
+            return {'success': 0, 'message': '绑定失败(桩服务模拟)', 'record_id': str(record.get('record_id')),
+                    'processed_mac': record.get('mac_address')}
+        return {'success': 1, 'message': '绑定成功', 'record_id': str(record.get('record_id')),
+                'processed_mac': record.get('mac_address')}
+
+    def start(self):
+        """ 在后台线程中运行服务 """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def deliver_callbacks_forever(self, timeout=5):
+        """ 持续把回调队列中的结果POST到各自的 callback_url """
+        session = requests.Session()
+        while True:
+            callback_url, body = self.callbacks.get()
+            if not callback_url:
+                continue
+            data = json.dumps(body).encode()
+            headers = {'Content-Type': 'application/json'}
+            if self.callback_secret:
+                headers.update(signature_headers(data, self.callback_secret))
+            try:
+                session.post(callback_url, data=data, headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"回调 {callback_url} 失败: {e}")
@@ -26,20 +26,83 @@
         {{ page_string }}
     </ul>
 
+游标（keyset）分页：
+    数据量大时，OFFSET 分页翻到越后面越慢（数据库要先跳过前面所有行），每页还要执行一次 COUNT。
+    游标模式按排序字段的值定位（WHERE id < 上一页最后一条的id ORDER BY id DESC LIMIT n），
+    任何一页的代价都相同；总数使用近似值（表统计信息或缓存的 COUNT）。
+
+        page_object = Pagination(request, queryset, mode="cursor", ordering=("-id",))
+
+    ordering 最后一个字段必须唯一（通常是 id），例如 ("-create_time", "-id")；排序字段不能为 NULL。
+    URL 中的 cursor 参数是签名后的不透明令牌，页码组件只提供 首页/上一页/下一页/尾页，模板无需修改。
+    令牌的签名与模型和排序字段绑定，其他列表（或排序不同）的游标视为无效，回到首页。
+
 """
 
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
 from django.utils.safestring import mark_safe
 
+from app01.utils.count_cache import cached_count
+
+CURSOR_SALT = "app01.pagination.cursor"
+
+
+def cursor_salt(model, ordering):
+    """ 游标令牌的签名盐：包含模型和排序字段，令牌只在生成它的列表中有效 """
+    return "{}:{}:{}".format(CURSOR_SALT, model._meta.label, ",".join(ordering))
+
+
+def _table_row_estimate(model):
+    """ 从数据库的表统计信息读取行数估计值，不支持或读取失败时返回 None """
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table]
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except Exception:
+        return None
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def approximate_count(queryset):
+    """
+    返回查询结果的近似总数
+
+    没有筛选条件时使用表统计信息（MySQL information_schema / PostgreSQL pg_class），
+    否则（或数据库不提供统计信息时）使用缓存的 COUNT（见 app01/utils/count_cache.py）。
+    """
+    if not queryset.query.where:
+        estimate = _table_row_estimate(queryset.model)
+        if estimate is not None:
+            return estimate
+    return cached_count(queryset)
+
 
 class Pagination(object):
 
-    def __init__(self, request, queryset, page_size=10, page_param="page", plus=5):
+    def __init__(self, request, queryset, page_size=10, page_param="page", plus=5,
+                 mode="offset", ordering=("id",), cursor_param="cursor"):
         """
         :param request: 请求的对象
         :param queryset: 符合条件的数据（根据这个数据给他进行分页处理）
         :param page_size: 每页显示多少条数据
         :param page_param: 在URL中传递的获取分页的参数，例如：/etty/list/?page=12
         :param plus: 显示当前页的 前或后几页（页码）
+        :param mode: "offset" 按页码分页（默认）；"cursor" 按游标分页，适合数据量大的列表
+        :param ordering: 游标模式的排序字段，最后一个字段必须唯一，例如 ("-id",)
+        :param cursor_param: 游标模式在URL中传递游标的参数
         """
 
         from django.http.request import QueryDict
@@ -48,7 +111,14 @@ class Pagination(object):
         query_dict._mutable = True
         self.query_dict = query_dict
 
+        self.mode = mode
         self.page_param = page_param
+        self.page_size = page_size
+        self.plus = plus
+
+        if mode == "cursor":
+            self._init_cursor(request, queryset, ordering, cursor_param)
+            return
         page = request.GET.get(page_param, "1")
 
         if page.isdecimal():
@@ -57,21 +127,125 @@ class Pagination(object):
             page = 1
 
         self.page = page
-        self.page_size = page_size
 
         self.start = (page - 1) * page_size
         self.end = page * page_size
 
         self.page_queryset = queryset[self.start:self.end]
 
-        total_count = queryset.count()
+        # COUNT 结果按查询缓存，相关表有增删改时自动失效
+        total_count = cached_count(queryset)
         total_page_count, div = divmod(total_count, page_size)
         if div:
             total_page_count += 1
         self.total_page_count = total_page_count
-        self.plus = plus
+
+    def _init_cursor(self, request, queryset, ordering, cursor_param):
+        """ 游标模式：按 ordering 字段的值定位当前页 """
+        self.cursor_param = cursor_param
+        self.ordering = tuple(ordering)
+        self.cursor_salt = cursor_salt(queryset.model, self.ordering)
+        self.query_dict.pop(self.page_param, None)
+
+        try:
+            token = signing.loads(request.GET.get(cursor_param, ""), salt=self.cursor_salt)
+        except signing.BadSignature:
+            token = {}
+        direction = token.get("d")
+        values = token.get("v")
+        self.page = token.get("p", 1)
+
+        reverse_ordering = tuple(f[1:] if f.startswith("-") else "-" + f for f in self.ordering)
+        if direction == "next" and values:
+            rows = list(queryset.filter(self._keyset_q(values, after=True)).order_by(*self.ordering)[:self.page_size + 1])
+            self.has_next = len(rows) > self.page_size
+            self.has_prev = True
+            rows = rows[:self.page_size]
+        elif direction == "prev" and values:
+            rows = list(queryset.filter(self._keyset_q(values, after=False)).order_by(*reverse_ordering)[:self.page_size + 1])
+            self.has_prev = len(rows) > self.page_size
+            self.has_next = True
+            rows = rows[:self.page_size][::-1]
+        elif direction == "last":
+            # 尾页：按相反顺序取第一页
+            rows = list(queryset.order_by(*reverse_ordering)[:self.page_size + 1])
+            self.has_prev = len(rows) > self.page_size
+            self.has_next = False
+            rows = rows[:self.page_size][::-1]
+        else:
+            rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+            self.has_next = len(rows) > self.page_size
+            self.has_prev = False
+            rows = rows[:self.page_size]
+            self.page = 1
+
+        self.page_queryset = rows
+        self.total_count = approximate_count(queryset)
+        total_page_count, div = divmod(self.total_count, self.page_size)
+        self.total_page_count = total_page_count + (1 if div else 0)
+        if direction == "last":
+            self.page = max(self.total_page_count, 1)
+
+    def _keyset_q(self, values, after):
+        """
+        生成“排在 values 之后（after=True）/之前”的条件：
+        (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ...，降序字段方向相反
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            descending = field.startswith("-")
+            lookup = "lt" if descending == after else "gt"
+            condition |= Q(**equal, **{"{}__{}".format(name, lookup): value})
+            equal[name] = value
+        return condition
+
+    def _cursor_values(self, obj):
+        """ 取一条记录在排序字段上的值，日期时间转为字符串以便放入令牌 """
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip("-"))
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def _cursor_url(self, direction, obj=None, page=1):
+        token = {"d": direction, "p": page}
+        if obj is not None:
+            token["v"] = self._cursor_values(obj)
+        self.query_dict.setlist(self.cursor_param, [signing.dumps(token, salt=self.cursor_salt, compress=True)])
+        return self.query_dict.urlencode()
+
+    def _cursor_html(self):
+        """ 游标模式的页码：首页、上一页、当前页/约总页数、下一页、尾页 """
+        rows = self.page_queryset
+        self.query_dict.pop(self.cursor_param, None)
+        page_str_list = ['<li><a href="?{}">首页</a></li>'.format(self.query_dict.urlencode())]
+
+        if self.has_prev and rows:
+            prev_url = self._cursor_url("prev", rows[0], max(self.page - 1, 1))
+            page_str_list.append('<li><a href="?{}">上一页</a></li>'.format(prev_url))
+        else:
+            page_str_list.append('<li class="disabled"><a>上一页</a></li>')
+
+        page_str_list.append('<li class="active"><a>第{}页 / 约{}页</a></li>'.format(
+            self.page, max(self.total_page_count, 1)))
+
+        if self.has_next and rows:
+            next_url = self._cursor_url("next", rows[-1], self.page + 1)
+            page_str_list.append('<li><a href="?{}">下一页</a></li>'.format(next_url))
+        else:
+            page_str_list.append('<li class="disabled"><a>下一页</a></li>')
+
+        page_str_list.append('<li><a href="?{}">尾页</a></li>'.format(self._cursor_url("last")))
+        return mark_safe("".join(page_str_list))
 
     def html(self):
+        if self.mode == "cursor":
+            return self._cursor_html()
+
         # 计算出，显示当前页的前5页、后5页
         if self.total_page_count <= 2 * self.plus + 1:
             # 数据库中的数据比较少，都没有达到11页。
@@ -0,0 +1,384 @@
+"""
+IPv6绑定与 KEA 租约/保留导出文件的核对
+
+绑定状态原来只取决于最后一次 kea_callback，这里把 KEA 的实际数据与 PrettyNum 逐条比较。
+两边都按同一个键排序后做一次归并（sorted merge），不逐条查库，文件只读一遍：
+
+- 导出文件：逐行解析，外部排序（每 run_size 行排序后写入一个临时文件，再用 heapq.merge 合并），
+  内存占用只与 run_size 有关，几百万行的文件也能处理；
+- 数据表：按 address 核对时直接按 (ipv6_prefix, ipv6_iid) 索引顺序游标分页读取；
+  按 mac 核对时库中的MAC写法不统一，同样规范化后外部排序。DUID 每页一次查询（见 duid_resolver）。
+
+核对键：
+    address  IPv6地址（128位整数，默认）；同一地址的MAC/DUID不同为 mismatch
+    mac      MAC地址；同一MAC在两边的地址不同为 mismatch（没有MAC的租约行和IPv6记录无法比较，计入 unkeyed）
+
+结果：
+    missing   库中有、KEA中没有
+    extra     KEA中有、库中没有
+    mismatch  两边都有但内容不同
+
+fix=True 时批量修正 send_status：一致的记录置为 bound；missing/mismatch 中状态为 bound 的记录置为 failed
+并立即到期，由 kea_retry_scheduler 重新发送。
+
+支持的文件格式：
+    leases        KEA memfile 的 lease6 CSV（address, duid, hwaddr 列），也接受 export_kea_reservations 的 CSV
+    reservations  每行一个 reservation 的 JSON（export_kea_reservations 的 JSON 输出，或 JSONL）
+"""
+import csv
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+
+from django.db.models import Q
+from django.utils import timezone
+
+from app01 import models
+from app01.utils.duid_resolver import DuidResolver
+from app01.utils.ipv6_generator import ipv6_to_int_pair, ipv6_from_int_pair, u64_from_db
+from app01.utils.search_index import normalize_hex
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('leases', 'reservations')
+KEYS = ('address', 'mac')
+
+DEFAULT_RUN_SIZE = 200000
+DEFAULT_PAGE_SIZE = 5000
+
+# 修正状态时每条 UPDATE 的记录数
+FIX_BATCH_SIZE = 1000
+
+# 租约CSV各字段可用的列名：KEA memfile / export_kea_reservations
+_CSV_ALIASES = {
+    'address': ('address', 'ipv6_address'),
+    'hwaddr': ('hwaddr', 'hw_address'),
+    'duid': ('duid',),
+}
+
+DIFF_COLUMNS = ('kind', 'key', 'record_id', 'db_address', 'kea_address', 'db_mac', 'kea_mac', 'db_duid', 'kea_duid')
+
+
+class ReconcileReport(object):
+    """ 核对结果统计 """
+
+    def __init__(self):
+        self.dump_rows = 0  # 文件中解析出的绑定数
+        self.bad_lines = 0  # 无法解析的行
+        self.unkeyed = 0  # 缺少核对键的行
+        self.db_rows = 0
+        self.matched = 0
+        self.missing = 0
+        self.extra = 0
+        self.mismatch = 0
+        self.fixed_bound = 0
+        self.fixed_failed = 0
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def detect_format(filename):
+    """
+    根据扩展名判断文件格式
+
+    Raises:
+        ValueError: 无法判断
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == '.csv':
+        return 'leases'
+    if extension in ('.json', '.jsonl', '.ndjson'):
+        return 'reservations'
+    raise ValueError("无法根据扩展名判断格式，请指定 --format")
+
+
+def _address_key(address):
+    """ IPv6地址 -> 32位十六进制文本（按文本排序即按地址排序），格式错误返回 None """
+    try:
+        prefix, interface_id = ipv6_to_int_pair(address)
+    except ValueError:
+        return None
+    return f"{prefix:016x}{interface_id:016x}"
+
+
+def _key_address(key):
+    """ _address_key 的逆运算，用于输出 """
+    return ipv6_from_int_pair(int(key[:16], 16), int(key[16:], 16))
+
+
+def iter_lease_rows(lines):
+    """
+    解析租约CSV，产出 (地址, MAC, DUID)；坏行产出 None
+
+    Raises:
+        ValueError: 缺少地址列
+    """
+    reader = csv.DictReader(lines)
+    columns = {}
+    for field, aliases in _CSV_ALIASES.items():
+        columns[field] = next((name for name in aliases if name in (reader.fieldnames or ())), None)
+    if columns['address'] is None:
+        raise ValueError("CSV缺少地址列（address 或 ipv6_address）")
+    for row in reader:
+        address = (row.get(columns['address']) or "").strip()
+        if not address:
+            yield None
+            continue
+        mac = row.get(columns['hwaddr']) if columns['hwaddr'] else ""
+        duid = row.get(columns['duid']) if columns['duid'] else ""
+        yield address, mac or "", duid or ""
+
+
+def iter_reservation_rows(lines):
+    """
+    解析每行一个 reservation 的JSON，产出 (地址, MAC, DUID)；一个 reservation 有多个地址时产出多条
+
+    首尾的 {"reservations": [ 和 ]} 行跳过，其余无法解析的行产出 None。
+    """
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if not line or line in ('{"reservations": [', ']}', '[', ']'):
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = None
+        if not isinstance(item, dict) or not item.get('ip-addresses'):
+            yield None
+            continue
+        for address in item['ip-addresses']:
+            yield address, item.get('hw-address') or "", item.get('duid') or ""
+
+
+def iter_dump(lines, fmt):
+    """
+    Raises:
+        ValueError: 不支持的格式
+    """
+    if fmt == 'leases':
+        return iter_lease_rows(lines)
+    if fmt == 'reservations':
+        return iter_reservation_rows(lines)
+    raise ValueError(f"不支持的文件格式: {fmt}")
+
+
+def _record(key, record_id, address_key, mac, duid):
+    """ 排序用的一行文本：键在最前，各字段不含制表符 """
+    return "\t".join((key, str(record_id), address_key, mac, duid))
+
+
+def _parse_record(line):
+    key, record_id, address_key, mac, duid = line.rstrip("\n").split("\t")
+    return key, int(record_id), address_key, mac, duid
+
+
+def _dump_records(rows, key, report):
+    """ 把解析出的 (地址, MAC, DUID) 规范化为排序行 """
+    for row in rows:
+        if row is None:
+            report.bad_lines += 1
+            continue
+        address_key = _address_key(row[0])
+        if address_key is None:
+            report.bad_lines += 1
+            continue
+        mac, duid = normalize_hex(row[1]), normalize_hex(row[2])
+        if key == 'mac' and len(mac) != 12:
+            report.unkeyed += 1
+            continue
+        report.dump_rows += 1
+        yield _record(address_key if key == 'address' else mac, 0, address_key, mac, duid)
+
+
+def external_sort(lines, run_size=DEFAULT_RUN_SIZE, directory=None):
+    """
+    外部排序：每 run_size 行在内存中排序后写入临时文件，最后多路归并
+
+    产出排好序的行（不含换行符），结束或中途关闭时删除临时文件。
+    """
+    lines = iter(lines)
+    runs = []
+    try:
+        while True:
+            chunk = sorted(itertools.islice(lines, run_size))
+            if not chunk:
+                break
+            run = tempfile.TemporaryFile(mode='w+', encoding='utf-8', dir=directory)
+            run.writelines(line + "\n" for line in chunk)
+            run.seek(0)
+            runs.append(run)
+            del chunk
+        for line in heapq.merge(*runs):
+            yield line.rstrip("\n")
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _pages(queryset, page_size):
+    """ 按 (ipv6_prefix, ipv6_iid) 游标分页读取IPv6记录，每页同时取回DUID """
+    queryset = queryset.filter(ipv6_prefix__isnull=False, ipv6_iid__isnull=False).order_by('ipv6_prefix', 'ipv6_iid')
+    after = Q()
+    while True:
+        rows = list(queryset.filter(after).values_list('id', 'ipv6_prefix', 'ipv6_iid', 'mac_address')[:page_size])
+        if not rows:
+            return
+        duid_by_mac = DuidResolver().resolve_many(mac for _, _, _, mac in rows)
+        yield rows, duid_by_mac
+        _, prefix, interface_id, _ = rows[-1]
+        after = Q(ipv6_prefix__gt=prefix) | Q(ipv6_prefix=prefix, ipv6_iid__gt=interface_id)
+
+
+def _db_records(key, report, page_size):
+    """ IPv6记录的排序行，address 键直接按索引顺序产出 """
+    for rows, duid_by_mac in _pages(models.PrettyNum.objects.all(), page_size):
+        for record_id, prefix, interface_id, mac_address in rows:
+            report.db_rows += 1
+            address_key = f"{u64_from_db(prefix):016x}{u64_from_db(interface_id):016x}"
+            mac = normalize_hex(mac_address)
+            if key == 'mac' and len(mac) != 12:
+                report.unkeyed += 1
+                continue
+            duid = normalize_hex(duid_by_mac.get(mac_address))
+            yield _record(address_key if key == 'address' else mac, record_id, address_key, mac, duid)
+
+
+def _grouped(lines):
+    """ 排序行按键分组，产出 (键, [记录]) """
+    for record_key, group in itertools.groupby((_parse_record(line) for line in lines), key=lambda r: r[0]):
+        yield record_key, list(group)
+
+
+def merge_groups(db_groups, dump_groups):
+    """ 归并两个按键排序的分组流，产出 (键, 库中记录, 文件中记录) """
+    sentinel = (None, [])
+    db_key, db_items = next(db_groups, sentinel)
+    dump_key, dump_items = next(dump_groups, sentinel)
+    while db_key is not None or dump_key is not None:
+        if dump_key is None or (db_key is not None and db_key < dump_key):
+            yield db_key, db_items, []
+            db_key, db_items = next(db_groups, sentinel)
+        elif db_key is None or dump_key < db_key:
+            yield dump_key, [], dump_items
+            dump_key, dump_items = next(dump_groups, sentinel)
+        else:
+            yield db_key, db_items, dump_items
+            db_key, db_items = next(db_groups, sentinel)
+            dump_key, dump_items = next(dump_groups, sentinel)
+
+
+def _same_binding(db_item, dump_item):
+    """ 地址相同的两条记录：文件中有MAC/DUID时必须与库中一致 """
+    _, _, _, db_mac, db_duid = db_item
+    _, _, _, dump_mac, dump_duid = dump_item
+    if dump_mac and db_mac and dump_mac != db_mac:
+        return False
+    if dump_duid and db_duid and dump_duid != db_duid:
+        return False
+    return True
+
+
+def compare_group(record_key, db_items, dump_items):
+    """
+    比较同一个键下两边的记录
+
+    Returns:
+        list: [(类型, 库中记录或 None, 文件中记录或 None)]，类型为 matched/missing/extra/mismatch
+    """
+    if not dump_items:
+        return [('missing', item, None) for item in db_items]
+    if not db_items:
+        return [('extra', None, item) for item in dump_items]
+
+    by_address = {}
+    for item in dump_items:
+        by_address.setdefault(item[2], []).append(item)
+    results = []
+    for db_item in db_items:
+        candidates = by_address.get(db_item[2])
+        if candidates and any(_same_binding(db_item, item) for item in candidates):
+            results.append(('matched', db_item, candidates[0]))
+        else:
+            # 按 address 核对时地址相同而MAC/DUID不同；按 mac 核对时KEA中该MAC绑定的是其他地址
+            results.append(('mismatch', db_item, (candidates or dump_items)[0]))
+    return results
+
+
+class _StatusFixer(object):
+    """ 攒够一批记录ID后用一条 UPDATE 修正 send_status """
+
+    def __init__(self, report):
+        self.report = report
+        self.bound_ids = []
+        self.failed_ids = []
+
+    def add(self, kind, record_id):
+        if kind == 'matched':
+            self.bound_ids.append(record_id)
+        elif kind in ('missing', 'mismatch'):
+            self.failed_ids.append(record_id)
+        if len(self.bound_ids) >= FIX_BATCH_SIZE or len(self.failed_ids) >= FIX_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        now = timezone.now()
+        if self.bound_ids:
+            self.report.fixed_bound += models.PrettyNum.objects.filter(id__in=self.bound_ids).exclude(
+                send_status='bound').update(send_status='bound', retry_count=0, next_retry_time=None)
+            self.bound_ids = []
+        if self.failed_ids:
+            # 立即到期，kea_retry_scheduler 会重新发送
+            self.report.fixed_failed += models.PrettyNum.objects.filter(
+                id__in=self.failed_ids, send_status='bound').update(
+                send_status='failed', retry_count=0, next_retry_time=now)
+            self.failed_ids = []
+
+
+def reconcile(rows, key='address', fix=False, on_diff=None, run_size=DEFAULT_RUN_SIZE, page_size=DEFAULT_PAGE_SIZE):
+    """
+    核对导出文件与IPv6记录
+
+    :param rows: iter_dump() 产出的 (地址, MAC, DUID)
+    :param key: 'address' 或 'mac'
+    :param fix: 是否批量修正 send_status
+    :param on_diff: 每条差异调用一次，参数为 DIFF_COLUMNS 对应的dict
+    :return: ReconcileReport
+
+    Raises:
+        ValueError: 不支持的核对键
+    """
+    if key not in KEYS:
+        raise ValueError(f"不支持的核对键: {key}，可选 {', '.join(KEYS)}")
+    report = ReconcileReport()
+    fixer = _StatusFixer(report) if fix else None
+
+    dump_lines = external_sort(_dump_records(rows, key, report), run_size)
+    db_lines = _db_records(key, report, page_size)
+    if key == 'mac':
+        db_lines = external_sort(db_lines, run_size)
+
+    for record_key, db_items, dump_items in merge_groups(_grouped(db_lines), _grouped(dump_lines)):
+        for kind, db_item, dump_item in compare_group(record_key, db_items, dump_items):
+            setattr(report, kind, getattr(report, kind) + 1)
+            if fixer and db_item:
+                fixer.add(kind, db_item[1])
+            if kind != 'matched' and on_diff:
+                on_diff({
+                    'kind': kind,
+                    'key': _key_address(record_key) if key == 'address' else record_key,
+                    'record_id': db_item[1] if db_item else "",
+                    'db_address': _key_address(db_item[2]) if db_item else "",
+                    'kea_address': _key_address(dump_item[2]) if dump_item else "",
+                    'db_mac': db_item[3] if db_item else "",
+                    'kea_mac': dump_item[3] if dump_item else "",
+                    'db_duid': db_item[4] if db_item else "",
+                    'kea_duid': dump_item[4] if dump_item else "",
+                })
+    if fixer:
+        fixer.flush()
+    logger.info(f"KEA绑定核对完成: {report.to_dict()}")
+    return report
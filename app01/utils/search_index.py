@@ -0,0 +1,184 @@
+"""
+MAC / DUID / IPv6 子串搜索索引
+
+原来的搜索是 mac_address__contains 这类前置通配的 LIKE '%xx%'，无法使用B树索引，只能全表扫描。
+这里为每条记录维护一行 SearchEntry（规范化后的字段值）和若干 SearchGram（n-gram）：
+
+    MAC   "AA:BB:CC:DD:EE:FF"                -> mac  "aabbccddeeff"（12个十六进制字符）
+    DUID  "00:01:00:01:2A:..."               -> duid "000100012a..."（只保留十六进制字符）
+    IPv6  "240c:c901:a:a:1010:11:2233:4455"  -> ipv6 原文小写；iid "1010001122334455"（后64位）
+
+n-gram 是字段值从每个位置开始的最多8个字符（"aabbccddeeff" -> aabbccdd / abbccdde / ... / ff），
+任何不超过8个字符的子串都是某个 n-gram 的前缀，于是子串搜索变成 (kind, gram) 索引上的
+一次前缀区间查找，代价只与命中的条数有关，与表的大小无关：
+
+    搜索 "bb:cc:d" -> 规范化为 "bbccd" -> gram 在 ["m:bbccd", "m:bbccdz") 区间内的记录
+
+超过8个字符的输入用其最后8个字符查候选（DUID/MAC 的开头多为固定的类型/厂商前缀，结尾区分度更高），
+再在 SearchEntry 上做一次完整子串校验。
+
+    ids = search_ids('device', '00:1a:2b')          # 可直接用于 queryset.filter(id__in=ids)
+
+索引在记录保存/删除时由信号维护（app01/signals.py）；bulk_create/update 等不发信号的批量操作之后，
+执行 python manage.py rebuild_search_index 重建。
+"""
+import ipaddress
+import itertools
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from app01 import models
+
+_NON_HEX = re.compile(r"[^0-9a-f]")
+
+# 字段 -> n-gram 前缀
+FIELD_TAGS = {'mac': 'm', 'duid': 'd', 'ipv6': 'a', 'iid': 'i'}
+
+# 各类记录参与搜索的字段
+KIND_FIELDS = {
+    'device': ('mac', 'duid'),
+    'approval': ('mac', 'duid'),
+    'pretty': ('mac', 'ipv6', 'iid'),
+}
+
+GRAM_SIZE = 8
+
+# 前缀区间的上界后缀：大于 n-gram 中可能出现的所有字符（十六进制、':'、'.'），
+# 在二进制排序和 MySQL 不区分大小写的排序规则下都成立
+_RANGE_END = "z"
+
+
+def normalize_hex(value):
+    """ 只保留十六进制字符（小写），用于 MAC / DUID / 接口ID """
+    return _NON_HEX.sub("", (value or "").lower())
+
+
+def ipv6_iid(ipv6_address):
+    """ IPv6地址后64位的16个十六进制字符，地址不合法时返回空串 """
+    try:
+        return ipaddress.IPv6Address((ipv6_address or "").strip()).exploded.replace(":", "")[16:]
+    except ValueError:
+        return ""
+
+
+def normalize_query(field, query):
+    """ 把用户输入规范化为与该字段索引值相同的形式 """
+    if field == 'ipv6':
+        return query.strip().lower()
+    return normalize_hex(query)
+
+
+def entry_values(kind, obj):
+    """ 记录的规范化字段值 """
+    values = {'mac': normalize_hex(obj.mac_address), 'duid': '', 'ipv6': '', 'iid': ''}
+    if kind == 'pretty':
+        values['ipv6'] = (obj.ipv6_address or "").lower()
+        values['iid'] = ipv6_iid(obj.ipv6_address)
+    else:
+        values['duid'] = normalize_hex(obj.duid)
+    return values
+
+
+def grams(text):
+    """ 从每个位置开始的最多 GRAM_SIZE 个字符（去重） """
+    return {text[i:i + GRAM_SIZE] for i in range(len(text))}
+
+
+def entry_grams(kind, values):
+    """ 一条记录的全部 n-gram，形如 "m:aabbccdd" """
+    return {
+        f"{FIELD_TAGS[field]}:{gram}"
+        for field in KIND_FIELDS[kind]
+        for gram in grams(values[field])
+    }
+
+
+def index_object(kind, obj):
+    """ 重建一条记录的搜索索引（在一个事务中，不会留下只删了旧 n-gram 的半截索引） """
+    values = entry_values(kind, obj)
+    with transaction.atomic():
+        models.SearchEntry.objects.update_or_create(kind=kind, object_id=obj.pk, defaults=values)
+        models.SearchGram.objects.filter(kind=kind, object_id=obj.pk).delete()
+        models.SearchGram.objects.bulk_create(
+            [models.SearchGram(kind=kind, gram=gram, object_id=obj.pk) for gram in entry_grams(kind, values)]
+        )
+
+
+def unindex_object(kind, object_id):
+    """ 删除一条记录的搜索索引 """
+    with transaction.atomic():
+        models.SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+        models.SearchGram.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_new_objects(kind, objs):
+    """ 为一批尚无索引的记录批量写入搜索索引（bulk_create 之后调用，它不发 post_save 信号） """
+    entries, gram_rows = [], []
+    for obj in objs:
+        values = entry_values(kind, obj)
+        entries.append(models.SearchEntry(kind=kind, object_id=obj.pk, **values))
+        gram_rows.extend(models.SearchGram(kind=kind, gram=gram, object_id=obj.pk) for gram in entry_grams(kind, values))
+    models.SearchEntry.objects.bulk_create(entries, batch_size=2000)
+    models.SearchGram.objects.bulk_create(gram_rows, batch_size=8000)
+    return len(entries)
+
+
+def reindex_objects(kind, objs):
+    """ 批量重建一批已有记录的搜索索引（bulk_update 之后调用） """
+    object_ids = [obj.pk for obj in objs]
+    models.SearchEntry.objects.filter(kind=kind, object_id__in=object_ids).delete()
+    models.SearchGram.objects.filter(kind=kind, object_id__in=object_ids).delete()
+    return index_new_objects(kind, objs)
+
+
+def rebuild_index(kind, queryset, batch_size=2000):
+    """
+    批量重建某类记录的搜索索引（先清空再写入）
+
+    Returns:
+        int: 写入的记录数
+    """
+    models.SearchEntry.objects.filter(kind=kind).delete()
+    models.SearchGram.objects.filter(kind=kind).delete()
+
+    count = 0
+    objs = queryset.iterator(chunk_size=batch_size)
+    while True:
+        batch = list(itertools.islice(objs, batch_size))
+        if not batch:
+            return count
+        count += index_new_objects(kind, batch)
+
+
+def search_ids(kind, query, fields=None):
+    """
+    按子串搜索记录，任一字段匹配即可（OR）
+
+    :param kind: 'device' / 'approval' / 'pretty'
+    :param query: 用户输入
+    :param fields: 参与搜索的字段，默认 KIND_FIELDS[kind]
+    :return: 记录ID的子查询（values_list），可直接用于 filter(id__in=...)
+    """
+    ranges, contains, verify = Q(), Q(), False
+    for field in fields or KIND_FIELDS[kind]:
+        needle = normalize_query(field, query)
+        if not needle:
+            continue
+        prefix = f"{FIELD_TAGS[field]}:{needle[-GRAM_SIZE:]}"
+        ranges |= Q(kind=kind, gram__gte=prefix, gram__lt=prefix + _RANGE_END)
+        contains |= Q(**{f"{field}__contains": needle})
+        verify = verify or len(needle) > GRAM_SIZE
+
+    if not ranges:
+        return models.SearchEntry.objects.none().values_list('object_id', flat=True)
+    # 各字段的前缀区间合并为一个子查询，不要写成多个 IN 子查询的 OR，否则数据库无法把子查询转为半连接；
+    # kind 条件写在每个区间内，SQLite 才会对每个区间分别使用 (kind, gram) 索引
+    candidates = models.SearchGram.objects.filter(ranges).values_list('object_id', flat=True)
+    if not verify:
+        # 输入不超过8个字符时，前缀区间内的记录就是结果
+        return candidates
+    # 更长的输入只用最后8个字符找到候选，再按唯一索引取出 SearchEntry 校验完整子串
+    return models.SearchEntry.objects.filter(contains, kind=kind, object_id__in=candidates).values_list(
+        'object_id', flat=True)
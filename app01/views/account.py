@@ -1,8 +1,11 @@
 from django.shortcuts import render, HttpResponse, redirect
 from django import forms
-from io import BytesIO
 
-from app01.utils.code import check_code
+from app01.utils.code import render_png
+from app01.utils.captcha_pool import get_captcha_pool
+from app01.utils.captcha_token import (
+    COOKIE_NAME as CAPTCHA_COOKIE, is_stateless, make_token, check_token, token_max_age,
+)
 from app01 import models
 from app01.utils.bootstrap import BootStrapForm
 from app01.utils.encrypt import md5
@@ -39,9 +42,14 @@ def login(request):
     if form.is_valid():
         # 验证码的校验
         user_input_code = form.cleaned_data.pop('code')
-        code = request.session.get('image_code', "")
-        if code.upper() != user_input_code.upper():
-            form.add_error("code", "验证码错误")
+        if is_stateless():
+            # 无状态模式：验证签名令牌，不读会话
+            code_error = check_token(request.COOKIES.get(CAPTCHA_COOKIE), user_input_code)
+        else:
+            code = request.session.get('image_code', "")
+            code_error = "验证码错误" if code.upper() != user_input_code.upper() else None
+        if code_error:
+            form.add_error("code", code_error)
             return render(request, 'login.html', {'form': form})
 
         # 身份和用户对象已在 form 的 clean 方法中处理
@@ -81,13 +89,18 @@ def login(request):
 #     return render(request, 'user_login.html', {'form': form})
 
 def image_code(request):
-    """ 生成图片验证码 """
-    img, code_string = check_code()
+    """ 生成图片验证码（优先从预生成的验证码池中取） """
+    pool = get_captcha_pool()
+    png, code_string = pool.get() if pool else render_png()
+    response = HttpResponse(png, content_type='image/png')
+    if is_stateless():
+        # 无状态模式：答案放在签名令牌中，不写会话
+        response.set_cookie(CAPTCHA_COOKIE, make_token(code_string), max_age=token_max_age(),
+                            httponly=True, samesite='Lax')
+        return response
     request.session['image_code'] = code_string
     request.session.set_expiry(60)
-    stream = BytesIO()
-    img.save(stream, 'png')
-    return HttpResponse(stream.getvalue())
+    return response
 
 def logout(request):
     """ 注销 """
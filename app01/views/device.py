@@ -5,6 +5,7 @@ from app01 import models
 from app01.utils.pagination import Pagination
 from app01.utils.form import DeviceModelForm
 from app01.utils.ipv6_generator import generate_ipv6, validate_mac_address
+from app01.utils.search_index import search_ids
 import json
 
 def device_list(request):
@@ -13,14 +14,12 @@ def device_list(request):
     if not request.session.get("info"):
         return redirect('/login/') # 非管理员重定向到登录页
 
-    # 构造搜索
-    data_dict = {}
-    search_data = request.GET.get('q', "")
-    if search_data:
-        data_dict["duid__contains"] = search_data
-        data_dict["mac_address__contains"] = search_data # 允许搜索MAC地址
+    queryset = models.Device.objects.select_related('department').order_by('-create_time') # 按审批时间倒序排列
 
-    queryset = models.Device.objects.filter(**data_dict).order_by('-create_time') # 按审批时间倒序排列
+    # 构造搜索：DUID 或 MAC 任一包含搜索内容即可，走搜索索引
+    search_data = request.GET.get('q', "").strip()
+    if search_data:
+        queryset = queryset.filter(id__in=search_ids('device', search_data))
 
     page_object = Pagination(request, queryset, page_size=10)
     context = {
@@ -1,9 +1,17 @@
 from django.shortcuts import render, redirect
+from django.http import JsonResponse
 from django.contrib import messages
-from django.db.models import Max
+from django.db import transaction
+from django.utils import timezone
 from app01 import models
 from app01.utils.pagination import Pagination
 from app01.utils.form import DeviceApprovalModelForm
+from app01.utils.kea_dispatch import enqueue_kea_send
+from app01.utils.search_index import search_ids
+from app01.utils.address_allocator import get_allocator
+from app01.utils.approval_import import detect_format, start_import_job, get_import_progress
+from app01.utils.bulk_approval import approve_approvals, reject_approvals
+import json
 
 def device_approval_list(request):
     """ 设备审批列表 """
@@ -11,23 +19,18 @@ def device_approval_list(request):
     admin_info = request.session.get("info")
     user_info = request.session.get("user_info")
 
+    queryset = models.DeviceApproval.objects.select_related('department').order_by('-id')
+
     # 构造搜索 - 只对普通用户启用搜索功能
-    data_dict = {}
     search_data = ""
-    
     if user_info:  # 只有普通用户才能搜索
-        search_data = request.GET.get('q', "")
+        search_data = request.GET.get('q', "").strip()
         if search_data:
-            # 用户只能通过DUID或MAC搜索（使用OR逻辑）
-            from django.db.models import Q
-            data_dict = Q(duid__contains=search_data) | Q(mac_address__contains=search_data)
-
-    if data_dict:
-        queryset = models.DeviceApproval.objects.filter(data_dict).order_by('-id')
-    else:
-        queryset = models.DeviceApproval.objects.all().order_by('-id')
+            # 用户只能通过DUID或MAC搜索（使用OR逻辑），走搜索索引
+            queryset = queryset.filter(id__in=search_ids('approval', search_data))
     
-    page_object = Pagination(request, queryset, page_size=10)
+    # 游标分页：翻到任何一页的代价相同，总数使用近似值
+    page_object = Pagination(request, queryset, page_size=10, mode="cursor", ordering=("-id",))
     context = {
         "search_data": search_data,
         "queryset": page_object.page_queryset,
@@ -60,6 +63,38 @@ def device_approval_add(request):
         return redirect('/device/approval/list/')
     return render(request, 'change.html', {"form": form, "title": "提交设备审批"})
 
+def device_approval_import(request):
+    """ 批量导入设备审批（CSV/JSONL），保存为导入任务由 approval_import_worker 执行，返回进度查询地址 """
+    if not request.session.get("info"):
+        return JsonResponse({'success': False, 'message': '只有管理员可以导入'}, status=403)
+    if request.method != "POST":
+        return JsonResponse({'success': False, 'message': '只接受POST请求'}, status=405)
+
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'success': False, 'message': '请选择要导入的文件'})
+    try:
+        fmt = detect_format(upload.name)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+
+    job_id = start_import_job(upload, fmt)
+    return JsonResponse({
+        'success': True,
+        'job_id': job_id,
+        'progress_url': f'/device/approval/import/{job_id}/',
+    })
+
+def device_approval_import_progress(request, job_id):
+    """ 查询批量导入进度 """
+    if not request.session.get("info"):
+        return JsonResponse({'success': False, 'message': '只有管理员可以查看导入进度'}, status=403)
+
+    progress = get_import_progress(job_id)
+    if progress is None:
+        return JsonResponse({'success': False, 'message': '导入任务不存在'}, status=404)
+    return JsonResponse({'success': True, **progress})
+
 def device_approval_edit(request, nid):
     """ 编辑设备审批请求 """
     row_object = models.DeviceApproval.objects.filter(id=nid).first()
@@ -82,7 +117,7 @@ def device_approval_edit(request, nid):
 def device_approval_delete(request, nid):
     """ 删除设备审批请求 """
     try:
-        device_approval_obj = models.DeviceApproval.objects.filter(id=nid).first()
+        device_approval_obj = models.DeviceApproval.objects.filter(id=nid).select_related('department').first()
         if not device_approval_obj:
             messages.error(request, "审批记录不存在")
             return redirect('/device/approval/list/')
@@ -101,12 +136,12 @@ def device_approval_delete(request, nid):
     return redirect('/device/approval/list/')
 
 def device_approval_approve(request, nid):
-    """ 同意设备审批 - 自动生成IPv6并发送到API """
+    """ 同意设备审批 - 自动生成IPv6并加入KEA发送队列 """
     # 权限检查
     if not request.session.get("info"):
         return redirect('/login/') # 非管理员重定向到登录页
 
-    device_approval_obj = models.DeviceApproval.objects.filter(id=nid).first()
+    device_approval_obj = models.DeviceApproval.objects.filter(id=nid).select_related('department').first()
     if not device_approval_obj:
         messages.error(request, "审批记录不存在")
         return redirect('/device/approval/list/')
@@ -116,7 +151,7 @@ def device_approval_approve(request, nid):
             # 1. 生成IPv6地址
             from app01.utils.ipv6_generator import generate_ipv6
 
-            department_id = device_approval_obj.department.id
+            department_id = device_approval_obj.department_id
             building_id = device_approval_obj.building
             business_type_id = device_approval_obj.business_type
             mac_address = device_approval_obj.mac_address
@@ -128,64 +163,43 @@ def device_approval_approve(request, nid):
                 mac=mac_address
             )
 
-            # 2. 检查是否已存在相同MAC地址的记录（避免重复创建）
-            existing_ipv6 = models.PrettyNum.objects.filter(mac_address=device_approval_obj.mac_address).first()
-
-            if existing_ipv6:
-                # 如果已存在相同MAC地址的记录，使用现有记录
-                ipv6_obj = existing_ipv6
-                print(f"DEBUG: 发现已存在的IPv6记录，ID={ipv6_obj.id}, 复用该记录")
-                # 更新现有记录的信息
-                ipv6_obj.user = device_approval_obj.user
-                ipv6_obj.ipv6_address = generated_ipv6
-                ipv6_obj.department = device_approval_obj.department
-                ipv6_obj.building = device_approval_obj.building
-                ipv6_obj.send_status = 'pending'
-                ipv6_obj.save()
-            else:
-                # 创建新的IPv6记录
-                ipv6_obj = models.PrettyNum.objects.create(
-                    user=device_approval_obj.user,
-                    ipv6_address=generated_ipv6,
-                    mac_address=device_approval_obj.mac_address,
-                    department=device_approval_obj.department,  # 添加部门信息
-                    building=device_approval_obj.building,     # 添加楼栋信息
-                    send_status='pending'  # 等待API回调确认绑定结果
-                )
-                print(f"DEBUG: 创建新的IPv6记录，ID={ipv6_obj.id}")
-
-            # 强制保存并刷新对象，确保数据库中存在记录
-            ipv6_obj.refresh_from_db()
-            print(f"DEBUG: IPv6记录已创建，ID={ipv6_obj.id}, IPv6={ipv6_obj.ipv6_address}")
-
-            # 验证IPv6记录确实存在于数据库中
-            check_ipv6 = models.PrettyNum.objects.filter(id=ipv6_obj.id).first()
-            if not check_ipv6:
-                raise Exception(f"IPv6记录创建失败，ID={ipv6_obj.id}在数据库中不存在")
-
-            # 3. 发送IPv6到API - 使用IPv6记录的ID作为record_id
-            from app01.utils.ipv6_api import send_to_kea_api
-
-            # 构建回调URL
+            # 回调URL
             callback_url = request.build_absolute_uri('/api/kea/callback/')
 
-            print(f"DEBUG: 准备发送到API，record_id={ipv6_obj.id}, IPv6={generated_ipv6}")
-            print(f"DEBUG: 当前数据库中最大的IPv6记录ID: {models.PrettyNum.objects.all().aggregate(max_id=Max('id'))['max_id']}")
-            print(f"DEBUG: 当前所有IPv6记录: {list(models.PrettyNum.objects.values_list('id', 'ipv6_address', 'mac_address')[:10])}")
-
-            result = send_to_kea_api(
-                record_id=ipv6_obj.id,  # 使用IPv6记录ID作为标识，这样回调时能正确找到
-                ipv6_address=generated_ipv6,
-                mac_address=device_approval_obj.mac_address,
-                duid=device_approval_obj.duid,  # 直接传递DUID参数
-                callback_url=callback_url
-            )
-
-            print(f"DEBUG: API发送结果: {result}")
-
-            # 检查HTTP发送是否成功（200状态码表示请求成功发送）
-            if result.get('status_code') == 200:
-                # 4. 创建设备记录 - HTTP发送成功就创建设备
+            # IPv6记录、发送队列、设备记录和审批状态在同一事务中提交，
+            # 发送由 kea_outbox_worker 异步完成，视图不再等待KEA响应
+            with transaction.atomic():
+                # 2. 检查是否已存在相同MAC地址的记录（避免重复创建）
+                existing_ipv6 = models.PrettyNum.objects.by_mac(device_approval_obj.mac_address).first()
+
+                # 地址冲突检查在进程内的分配表中完成，只有命中已分配地址时才查库确认占用者
+                get_allocator().check(generated_ipv6, owner_id=existing_ipv6.id if existing_ipv6 else None)
+
+                if existing_ipv6:
+                    # 如果已存在相同MAC地址的记录，使用现有记录
+                    ipv6_obj = existing_ipv6
+                    # 更新现有记录的信息
+                    ipv6_obj.user = device_approval_obj.user
+                    ipv6_obj.ipv6_address = generated_ipv6
+                    ipv6_obj.department = device_approval_obj.department
+                    ipv6_obj.building = device_approval_obj.building
+                    ipv6_obj.send_status = 'pending'
+                    ipv6_obj.save()
+                else:
+                    # 创建新的IPv6记录
+                    ipv6_obj = models.PrettyNum.objects.create(
+                        user=device_approval_obj.user,
+                        ipv6_address=generated_ipv6,
+                        mac_address=device_approval_obj.mac_address,
+                        department=device_approval_obj.department,  # 添加部门信息
+                        building=device_approval_obj.building,     # 添加楼栋信息
+                        send_status='pending'  # 等待API回调确认绑定结果
+                    )
+
+                # 3. 加入KEA发送队列 - 使用IPv6记录的ID作为record_id，回调时据此找到记录
+                enqueue_kea_send(ipv6_obj, duid=device_approval_obj.duid, callback_url=callback_url)
+
+                # 4. 创建设备记录
                 models.Device.objects.create(
                     user=device_approval_obj.user,
                     create_time=timezone.now(),
@@ -200,18 +214,68 @@ def device_approval_approve(request, nid):
                 device_approval_obj.status = 1  # 设置状态为同意
                 device_approval_obj.save()
 
-                messages.success(request, f"设备审批已同意！IPv6地址 {generated_ipv6} 已生成并发送到API，正在等待绑定确认...")
-            else:
-                # HTTP发送失败 - 删除已创建的IPv6记录
-                ipv6_obj.delete()
-                error_msg = result.get('error', f"API返回失败状态码: {result.get('status_code', 'Unknown')}")
-                messages.error(request, f"设备审批同意失败！IPv6发送到API时出错: {error_msg}")
+            messages.success(request, f"设备审批已同意！IPv6地址 {generated_ipv6} 已生成并加入发送队列，正在等待绑定确认...")
 
         except Exception as e:
             messages.error(request, f"处理设备审批时出现异常：{str(e)}")
 
     return redirect('/device/approval/list/')
 
+def device_approval_bulk(request):
+    """
+    批量同意/拒绝设备审批
+
+    - 列表页勾选后提交表单：action=approve/reject，ids=审批ID（多个）
+    - JSON API：{"action": "approve", "ids": [1, 2, 3]}，返回处理结果
+    """
+    is_api = request.content_type == 'application/json'
+    if not request.session.get("info"):
+        if is_api:
+            return JsonResponse({'success': False, 'message': '只有管理员可以审批'}, status=403)
+        return redirect('/login/') # 非管理员重定向到登录页
+    if request.method != "POST":
+        return redirect('/device/approval/list/')
+
+    try:
+        if is_api:
+            data = json.loads(request.body)
+            action, ids = data.get('action'), data.get('ids') or []
+        else:
+            action, ids = request.POST.get('action'), request.POST.getlist('ids')
+        ids = [int(nid) for nid in ids]
+    except (ValueError, TypeError, AttributeError):
+        if is_api:
+            return JsonResponse({'success': False, 'message': '请求格式错误，ids 应为审批ID列表'})
+        messages.error(request, "请求格式错误")
+        return redirect('/device/approval/list/')
+
+    if not ids or action not in ('approve', 'reject'):
+        if is_api:
+            return JsonResponse({'success': False, 'message': '缺少必要参数：action（approve/reject）和 ids'})
+        messages.warning(request, "请先勾选要处理的审批记录")
+        return redirect('/device/approval/list/')
+
+    try:
+        if action == 'approve':
+            result = approve_approvals(ids, callback_url=request.build_absolute_uri('/api/kea/callback/'))
+        else:
+            result = reject_approvals(ids)
+    except Exception as e:
+        if is_api:
+            return JsonResponse({'success': False, 'message': f"批量处理失败：{str(e)}"})
+        messages.error(request, f"批量处理设备审批时出现异常：{str(e)}")
+        return redirect('/device/approval/list/')
+
+    if is_api:
+        return JsonResponse({'success': True, **result.to_dict()})
+    verb = "同意" if action == 'approve' else "拒绝"
+    summary = f"已批量{verb} {result.done} 条设备审批" + ("，IPv6地址已加入发送队列" if action == 'approve' else "")
+    messages.success(request, summary)
+    if result.skipped:
+        details = "；".join(f"#{approval_id} {reason}" for approval_id, reason in result.skipped[:10])
+        messages.warning(request, f"跳过 {len(result.skipped)} 条：{details}")
+    return redirect('/device/approval/list/')
+
 def device_approval_reject(request, nid):
     """ 拒绝设备审批 """
     # 权限检查
@@ -227,6 +291,3 @@ def device_approval_reject(request, nid):
         device_approval_obj.save()
         return redirect('/device/approval/list/')
     return redirect('/device/approval/list/')
-
-
-from django.utils import timezone
@@ -0,0 +1,26 @@
+from django.shortcuts import redirect
+from django.http import JsonResponse
+from django.utils import timezone
+
+from app01.utils.callback_ingest import INGEST_BUFFERED, get_callback_buffer, ingest_mode
+from app01.utils.captcha_pool import get_captcha_pool
+from app01.utils.kea_client import get_kea_client
+
+
+def metrics(request):
+    """ 运行指标（JSON），供监控系统采集 """
+    # 权限检查
+    if not request.session.get("info"):
+        return redirect('/login/')
+
+    data = {
+        'timestamp': timezone.now().isoformat(),
+        'kea_client': get_kea_client().stats.snapshot(),
+        'kea_breaker': get_kea_client().breaker.snapshot(),
+    }
+    pool = get_captcha_pool()
+    if pool:
+        data['captcha_pool'] = pool.snapshot()
+    if ingest_mode() == INGEST_BUFFERED:
+        data['callback_ingest'] = get_callback_buffer().snapshot()
+    return JsonResponse(data)
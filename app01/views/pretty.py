@@ -4,22 +4,40 @@ from app01 import models
 
 from app01.utils.pagination import Pagination
 from app01.utils.form import UserModelForm, PrettyModelForm, PrettyEditModelForm
+from app01.utils.ipv6_generator import ipv6_to_int_pair, IPV6_PREFIX_INT
+from app01.utils.search_index import search_ids
 
 
 def pretty_list(request):
     """ IPv6地址列表 """
 
-    data_dict = {}
-    search_data = request.GET.get('q', "")
-    if search_data:
-        data_dict["ipv6_address__contains"] = search_data
+    queryset = models.PrettyNum.objects.select_related('department')
 
-    queryset = models.PrettyNum.objects.filter(**data_dict)
+    search_data = request.GET.get('q', "").strip()
+    if search_data:
+        queryset = _search_ipv6(queryset, search_data)
+
+    # 按地址结构筛选（部门/楼栋/业务类型），转换为 (ipv6_prefix, ipv6_iid) 上的区间查询
+    slot_dict = {}
+    for name in ("department", "building", "service"):
+        value = request.GET.get(name, "")
+        if value.isdecimal():
+            slot_dict[name] = int(value)
+    if slot_dict:
+        try:
+            queryset = queryset.in_slot(**slot_dict)
+        except ValueError as e:
+            messages.error(request, f"筛选条件错误：{str(e)}")
 
-    page_object = Pagination(request, queryset)
+    # 游标分页：翻到任何一页的代价相同，总数使用近似值
+    page_object = Pagination(request, queryset, mode="cursor", ordering=("id",))
 
     context = {
         "search_data": search_data,
+        "slot_dict": slot_dict,
+        "department_list": models.Department.objects.all(),
+        "building_choices": models.BUILDING_CHOICES,
+        "service_choices": models.BUSINESS_TYPE_CHOICES,
 
         "queryset": page_object.page_queryset,  # 分完页的数据
         "page_string": page_object.html()  # 页码
@@ -27,10 +45,43 @@ def pretty_list(request):
     return render(request, 'pretty_list.html', context)
 
 
+def _search_ipv6(queryset, search_data):
+    """
+    IPv6地址搜索
 
-from app01.utils.ipv6_api import send_to_kea_api
+    - 网段（如 240c:c901:a:a:1a00::/72）: 整数区间查询
+    - 本系统前缀下的完整地址: 整数等值查询，压缩/完整写法均可
+    - 其他输入: 地址/接口ID子串匹配，走搜索索引
+    """
+    if "/" in search_data:
+        try:
+            return queryset.in_network(search_data)
+        except ValueError:
+            pass
+    else:
+        try:
+            prefix, _ = ipv6_to_int_pair(search_data)
+        except ValueError:
+            prefix = None
+        if prefix == IPV6_PREFIX_INT:
+            return queryset.by_address(search_data)
+    return queryset.filter(id__in=search_ids('pretty', search_data, fields=('ipv6', 'iid')))
+
+
+from app01.utils.kea_dispatch import enqueue_kea_send
+from app01.utils.callback_ingest import (
+    CALLBACK_RESULT_FIELDS, CALLBACK_UPDATABLE_STATUSES, INGEST_BUFFERED,
+    callback_record_id, callback_result_fields, callback_updatable, get_callback_buffer, ingest_mode,
+    is_callback_success, parse_callback,
+)
+from app01.utils.duid_resolver import get_duid_resolver
+from app01.utils.binding_export import export_bindings, CONTENT_TYPES
+from app01.utils.ipv6_api import extract_ipv6_last_64_bits
+from django.db import transaction
 from django.utils import timezone
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
 import logging
@@ -38,7 +89,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 def send_ipv6_address(request, nid):
-    """ 发送IPv6地址到KEA API """
+    """ 发送IPv6地址到KEA API（加入发送队列，由 kea_outbox_worker 异步发送） """
     if request.method == "POST":
         ipv6_obj = models.PrettyNum.objects.filter(id=nid).first()
         if not ipv6_obj:
@@ -54,82 +105,20 @@ def send_ipv6_address(request, nid):
             from django.urls import reverse
             callback_url = request.build_absolute_uri(reverse('kea_callback'))
 
-            logger.info(f"开始发送IPv6到KEA API - 记录ID: {ipv6_obj.id}, IPv6: {ipv6_obj.ipv6_address}")
+            logger.info(f"IPv6加入KEA发送队列 - 记录ID: {ipv6_obj.id}, IPv6: {ipv6_obj.ipv6_address}")
 
-            # 调用KEA API，加入记录ID
-            # 注意: send_to_kea_api 的签名为 (record_id, ipv6_address, mac_address, duid=None, callback_url=None)
-            
-            # 手动查找DUID进行调试
-            duid_for_debug = None
-            try:
-                # 在设备表中查找对应的DUID
-                device = models.Device.objects.filter(mac_address=ipv6_obj.mac_address).first()
-                if device and device.duid:
-                    duid_for_debug = device.duid
-                    print(f"DEBUG: 在Device表中找到DUID: {duid_for_debug} for MAC: {ipv6_obj.mac_address}")
-                else:
-                    # 如果设备表没有DUID，则尝试在审批表中查找已审批的记录
-                    approval = models.DeviceApproval.objects.filter(mac_address=ipv6_obj.mac_address, status=1).first()
-                    if approval and approval.duid:
-                        duid_for_debug = approval.duid
-                        print(f"DEBUG: 在DeviceApproval表中找到DUID: {duid_for_debug} for MAC: {ipv6_obj.mac_address}")
-                    else:
-                        print(f"DEBUG: 在Device和DeviceApproval表中都没找到MAC {ipv6_obj.mac_address} 对应的DUID")
-                        
-                        # 额外调试：列出所有相关记录
-                        all_devices = models.Device.objects.filter(mac_address=ipv6_obj.mac_address)
-                        print(f"DEBUG: Device表中MAC为{ipv6_obj.mac_address}的记录: {list(all_devices.values_list('id', 'user', 'duid'))}")
-                        
-                        all_approvals = models.DeviceApproval.objects.filter(mac_address=ipv6_obj.mac_address)
-                        print(f"DEBUG: DeviceApproval表中MAC为{ipv6_obj.mac_address}的记录: {list(all_approvals.values_list('id', 'user', 'duid', 'status'))}")
-            except Exception as e:
-                print(f"DEBUG: 查找DUID时出现异常: {str(e)}")
-            
-            result = send_to_kea_api(
-                record_id=ipv6_obj.id,
-                ipv6_address=ipv6_obj.ipv6_address,
-                mac_address=ipv6_obj.mac_address,
-                duid=duid_for_debug,  # 显式传递DUID
-                callback_url=callback_url
-            )
-
-            logger.info(f"KEA API调用结果: {result}")
-            
-            # 更新发送状态
-            ipv6_obj.last_send_time = timezone.now()
-            ipv6_obj.api_response = json.dumps(result['response_data']) if result['response_data'] else result.get('error', '')
-            
-            # 检查HTTP状态码来判断发送是否成功
-            if result.get('status_code') == 200:
-                # HTTP发送成功，等待API回调确认最终结果
-                ipv6_obj.send_status = 'pending'
+            # 入队时按MAC查好DUID（设备表优先，其次已审批的申请），发送时不再查找
+            duid = get_duid_resolver().resolve(ipv6_obj.mac_address)
+            with transaction.atomic():
                 ipv6_obj.retry_count = 0
                 ipv6_obj.next_retry_time = None
-                ipv6_obj.save()
+                ipv6_obj.save(update_fields=['retry_count', 'next_retry_time'])
+                enqueue_kea_send(ipv6_obj, duid=duid, callback_url=callback_url)
 
-                messages.success(request, "发送成功！")
-                logger.info(f"IPv6发送成功，设置状态为pending，等待回调")
-            else:
-                # HTTP发送失败
-                ipv6_obj.send_status = 'failed'
-                ipv6_obj.retry_count = 0
-                ipv6_obj.next_retry_time = None
-                ipv6_obj.save()
+            messages.success(request, "已加入发送队列，正在等待绑定确认...")
 
-                error_msg = result.get('error', f"API返回失败状态码: {result.get('status_code', 'Unknown')}")
-                messages.error(request, f"发送失败！错误: {error_msg}")
-                return redirect('/pretty/list/')
-                
         except Exception as e:
-            # 发送过程中出现异常
-            ipv6_obj.send_status = 'failed'
-            ipv6_obj.last_send_time = timezone.now()
-            ipv6_obj.retry_count = 0
-            ipv6_obj.next_retry_time = None  # 已移除自动重试功能
-            ipv6_obj.api_response = f"发送异常: {str(e)}"
-            ipv6_obj.save()
-            
-            messages.error(request, f"发送IPv6地址时出现异常，如需重试请手动执行重试命令。错误: {str(e)}")
+            messages.error(request, f"加入发送队列时出现异常，错误: {str(e)}")
 
     return redirect('/pretty/list/')
 
@@ -156,198 +145,294 @@ def pretty_delete(request, nid):
     return redirect('/pretty/list/')
 
 
-@csrf_exempt
-def kea_callback(request):
+def pretty_export(request):
     """
-    处理KEA API的回调请求
-    API通过此URL返回IPv6地址配置结果
+    流式导出全部IPv6绑定：?format=json（KEA reservations，默认）或 ?format=csv
+
+    响应边查询边输出，不在内存中拼出整个文件。
     """
-    if request.method != 'POST':
-        logger.warning(f"收到非POST请求到回调URL: {request.method}")
-        return JsonResponse({'success': False, 'message': '只接受POST请求'})
+    fmt = request.GET.get('format', 'json')
+    try:
+        chunks = export_bindings(fmt)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('/pretty/list/')
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    filename = f"kea_reservations_{timezone.now():%Y%m%d%H%M%S}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    # 记录请求头信息，方便调试
-    logger.info(f"回调请求头: {dict(request.headers)}")
-    logger.info(f"回调请求方法: {request.method}")
-    logger.info(f"回调请求路径: {request.path}")
 
-    try:
-        # 获取请求数据
-        if request.content_type == 'application/json':
-            callback_data = json.loads(request.body)
-        else:
-            callback_data = request.POST.dict()
+def _apply_callback_result(ipv6_obj, is_success, message, callback_data, now):
+    """ 把一条回调结果写到IPv6记录上（不保存），需要保存的字段见 CALLBACK_RESULT_FIELDS """
+    for field, value in callback_result_fields(is_success, message, callback_data, now).items():
+        setattr(ipv6_obj, field, value)
 
-            logger.info(f"收到KEA API回调: {callback_data}")
-        print(f"DEBUG 回调接收: record_id={callback_data.get('record_id')}, success={callback_data.get('success')}, mac={callback_data.get('processed_mac')}")
 
-        # 解析回调数据 - 支持新的API格式
-        # 新格式: {"success": 1, "message": "绑定成功", "record_id": "10"}
-        success_value = callback_data.get('success')
-        message = callback_data.get('message', '')
+def _kea_callback_batch(results):
+    """
+    处理KEA批量回调：results 为回调结果数组，每项格式与单条回调相同
 
-        # 判断是否成功（支持多种格式：1、'1'、true、True）
-        is_success = (success_value == 1 or success_value == '1' or
-                     success_value is True or success_value == 'true' or
-                     success_value == 'True')
+    在一个事务中锁定涉及的记录（record_id 找不到时按 processed_mac 兜底），按到达顺序逐条判断
+    状态条件（CALLBACK_UPDATABLE_STATUSES，与单条回调相同），最后一次 bulk_update 写回。
 
-        # 获取记录ID
-        # 首先尝试从根级别获取
-        record_id = callback_data.get('record_id')
+    Returns:
+        dict: 响应数据
+    """
+    now = timezone.now()
+    parsed = []
+    invalid_count = 0
+    for item in results:
+        record_id = callback_record_id(item) if isinstance(item, dict) else None
+        try:
+            parsed.append((item, int(record_id)))
+        except (ValueError, TypeError):
+            invalid_count += 1
+
+    updated = {}
+    not_found = []
+    skipped_count = 0
+    with transaction.atomic():
+        records = models.PrettyNum.objects.select_for_update().in_bulk(
+            [record_id for _, record_id in parsed])
+
+        # record_id 找不到的记录按MAC地址兜底，同样一次查询
+        fallback_macs = {item.get('processed_mac') for item, record_id in parsed
+                         if record_id not in records and item.get('processed_mac')}
+        records_by_mac = {}
+        if fallback_macs:
+            queryset = models.PrettyNum.objects.select_for_update().filter(
+                mac_address__in=fallback_macs).order_by('id')
+            for ipv6_obj in queryset:
+                ipv6_obj = records.setdefault(ipv6_obj.id, ipv6_obj)
+                records_by_mac.setdefault(ipv6_obj.mac_address, ipv6_obj)
+
+        for item, record_id in parsed:
+            ipv6_obj = records.get(record_id) or records_by_mac.get(item.get('processed_mac'))
+            if not ipv6_obj:
+                not_found.append(record_id)
+                continue
+            is_success = is_callback_success(item.get('success'))
+            # 重复或过期的回调不写库（例如晚到的失败回调不会把已绑定的记录改回失败）
+            if ipv6_obj.send_status not in CALLBACK_UPDATABLE_STATUSES[is_success]:
+                skipped_count += 1
+                continue
+            _apply_callback_result(ipv6_obj, is_success, item.get('message', ''), item, now)
+            updated[ipv6_obj.id] = ipv6_obj
+
+        if updated:
+            models.PrettyNum.objects.bulk_update(list(updated.values()), CALLBACK_RESULT_FIELDS)
+
+    bound_count = sum(ipv6_obj.send_status == 'bound' for ipv6_obj in updated.values())
+    logger.info(f"批量回调处理完成: 共 {len(results)} 条，更新 {len(updated)} 条，跳过 {skipped_count} 条，"
+                f"未找到 {len(not_found)} 条，格式错误 {invalid_count} 条")
+    if not_found:
+        logger.warning(f"批量回调中未找到的record_id: {not_found}")
+
+    return {
+        'success': True,
+        'message': '批量回调处理完成',
+        'total': len(results),
+        'updated': len(updated),
+        'bound': bound_count,
+        'bind_failed': len(updated) - bound_count,
+        'skipped': skipped_count,
+        'not_found': not_found,
+        'invalid': invalid_count,
+    }
 
-        # 如果根级别没有数据，尝试从data字段获取
-        if not record_id:
-            data_field = callback_data.get('data', {})
-            if isinstance(data_field, dict):
-                record_id = data_field.get('record_id')
 
-        # 清理可能的前后空格
-        if isinstance(record_id, str):
-            record_id = record_id.strip()
+DEFAULT_CALLBACK_IDEMPOTENCY_TIMEOUT = 3600
+_CALLBACK_IDEMPOTENCY_KEY = "kea_callback:{}"
 
-        # 添加调试信息
-        logger.info(f"解析后的数据 - record_id: {record_id}, success: {success_value}, message: {message}")
-        logger.info(f"解析结果 - 成功: {is_success}")
 
-        # 验证record_id
-        if not record_id:
-            logger.warning(f"回调数据缺少record_id，原始数据: {callback_data}")
-            return JsonResponse({
-                'success': False,
-                'message': '缺少必要参数：record_id',
-                'received_data': callback_data
-            })
+def _callback_idempotency_key(request):
+    """
+    幂等键：只取请求头 Idempotency-Key，没有时返回 None（不去重）
 
-        # 确保record_id是整数
-        try:
-            record_id = int(record_id)
-        except (ValueError, TypeError):
-            logger.warning(f"record_id格式错误: {record_id}")
-            return JsonResponse({
-                'success': False,
-                'message': 'record_id格式错误',
-                'received_data': callback_data
-            })
+    不能用请求体摘要代替：同一记录每次重发后 KEA 的回调请求体完全相同，按摘要去重会把重发后的正常回调当成重复丢弃。
+    没有幂等键的重复回调由带状态条件的 UPDATE 保证不会重复写库。
+    """
+    key = request.headers.get('Idempotency-Key')
+    return _CALLBACK_IDEMPOTENCY_KEY.format(key) if key else None
 
-        # 使用record_id直接查找对应的IPv6记录
-        logger.info(f"使用record_id查找IPv6记录: {record_id}")
-        print(f"DEBUG 查找开始: record_id={record_id}, 当前数据库记录数量={models.PrettyNum.objects.count()}")
-
-        ipv6_obj = models.PrettyNum.objects.filter(id=record_id).first()
-        print(f"DEBUG 通过ID查找结果: {'找到' if ipv6_obj else '未找到'}")
-
-        # 如果通过record_id找不到记录，尝试通过MAC地址查找（备用方案）
-        if not ipv6_obj and 'processed_mac' in callback_data:
-            mac_address = callback_data['processed_mac']
-            logger.info(f"通过record_id未找到记录，尝试通过MAC地址查找: {mac_address}")
-            print(f"DEBUG MAC地址查找: {mac_address}")
-            ipv6_obj = models.PrettyNum.objects.filter(mac_address=mac_address).first()
-            if ipv6_obj:
-                logger.info(f"通过MAC地址找到记录，ID={ipv6_obj.id}, 原始record_id={record_id}")
-                print(f"DEBUG MAC查找成功: 找到ID={ipv6_obj.id}的记录")
-            else:
-                print(f"DEBUG MAC查找失败: 未找到MAC={mac_address}的记录")
 
-        # 如果还是找不到记录，尝试查找最近创建的记录（兜底方案）
-        if not ipv6_obj:
-            logger.info("尝试查找最近创建的IPv6记录进行匹配")
-            print(f"DEBUG 兜底查找: 查找最近的IPv6记录")
-            recent_records = models.PrettyNum.objects.filter(send_status='pending').order_by('-id')[:3]
-            for recent_record in recent_records:
-                print(f"DEBUG 检查记录: ID={recent_record.id}, MAC={recent_record.mac_address}, IPv6={recent_record.ipv6_address}")
-                # 检查MAC地址是否匹配
-                if 'processed_mac' in callback_data and recent_record.mac_address == callback_data['processed_mac']:
-                    ipv6_obj = recent_record
-                    logger.info(f"通过MAC地址匹配找到最近记录，ID={ipv6_obj.id}")
-                    print(f"DEBUG 兜底成功: 通过MAC匹配找到ID={ipv6_obj.id}")
-                    break
+def _callback_debug_lookup(callback_data):
+    """ 找不到记录时的诊断信息（KEA_CALLBACK_DEBUG 开启时），会额外执行几次查询 """
+    logger.info(f"IPv6记录总数: {models.PrettyNum.objects.count()}")
+    recent_records = models.PrettyNum.objects.filter(send_status='pending').order_by('-id')[:3]
+    logger.info(f"最近待绑定的记录: {[f'ID:{r.id}, IPv6:{r.ipv6_address}, MAC:{r.mac_address}' for r in recent_records]}")
+    all_records = models.PrettyNum.objects.all()[:10]
+    logger.info(f"数据库中的IPv6记录示例: {[f'ID:{r.id}, IPv6:{r.ipv6_address}, MAC:{r.mac_address}' for r in all_records]}")
+    if 'processed_mac' in callback_data:
+        mac_records = models.PrettyNum.objects.by_mac(callback_data['processed_mac'])[:5]
+        logger.info(f"通过MAC地址找到的记录: {[f'ID:{r.id}, IPv6:{r.ipv6_address}' for r in mac_records]}")
 
-        if not ipv6_obj:
-            logger.warning(f"未找到ID为 {record_id} 的IPv6记录")
 
-            # 尝试查找所有记录进行调试
-            all_records = models.PrettyNum.objects.all()[:10]
-            logger.info(f"数据库中的IPv6记录示例: {[f'ID:{r.id}, IPv6:{r.ipv6_address}, MAC:{r.mac_address}' for r in all_records]}")
+def _kea_callback_single(callback_data, debug):
+    """
+    处理单条回调
 
-            # 额外调试：查找是否有匹配的MAC地址记录
-            if 'processed_mac' in callback_data:
-                mac_records = models.PrettyNum.objects.filter(mac_address=callback_data['processed_mac'])[:5]
-                logger.info(f"通过MAC地址找到的记录: {[f'ID:{r.id}, IPv6:{r.ipv6_address}' for r in mac_records]}")
+    一条带状态条件的 UPDATE 按主键写回结果，再按主键取回地址/MAC用于响应（MySQL 的 UPDATE 不支持 RETURNING）。
+    record_id 不存在时按 processed_mac 兜底一次；状态条件不满足（重复或过期的回调）时不写库。
 
-            return JsonResponse({
-                'success': False,
-                'message': '未找到对应记录',
-                'searched_record_id': record_id,
-                'callback_data': callback_data
-            })
+    Returns:
+        tuple: (响应数据, 是否处理成功)
+    """
+    is_success = is_callback_success(callback_data.get('success'))
+    message = callback_data.get('message', '')
+    record_id = callback_record_id(callback_data)
+    if not record_id:
+        logger.warning(f"回调数据缺少record_id，原始数据: {callback_data}")
+        return {'success': False, 'message': '缺少必要参数：record_id', 'received_data': callback_data}, False
+    try:
+        record_id = int(record_id)
+    except (ValueError, TypeError):
+        logger.warning(f"record_id格式错误: {record_id}")
+        return {'success': False, 'message': 'record_id格式错误', 'received_data': callback_data}, False
+
+    fields = callback_result_fields(is_success, message, callback_data, timezone.now())
+    updated = callback_updatable(record_id, is_success).update(**fields)
+    row = models.PrettyNum.objects.filter(id=record_id).values_list('id', 'ipv6_address', 'mac_address').first()
+
+    # 如果通过record_id找不到记录，尝试通过MAC地址查找（备用方案）
+    if row is None and callback_data.get('processed_mac'):
+        row = models.PrettyNum.objects.by_mac(callback_data['processed_mac']).order_by('id').values_list(
+            'id', 'ipv6_address', 'mac_address').first()
+        if row:
+            logger.info(f"通过MAC地址找到记录，ID={row[0]}, 原始record_id={record_id}")
+            updated = callback_updatable(row[0], is_success).update(**fields)
+
+    if row is None:
+        logger.warning(f"未找到ID为 {record_id} 的IPv6记录")
+        if debug:
+            _callback_debug_lookup(callback_data)
+        return {
+            'success': False,
+            'message': '未找到对应记录',
+            'searched_record_id': record_id,
+            'callback_data': callback_data
+        }, False
 
-        # 更新记录状态
-        ipv6_obj.last_send_time = timezone.now()
-        ipv6_obj.api_response = json.dumps(callback_data)
+    if not updated:
+        logger.info(f"记录ID {row[0]} 的状态不需要更新（重复或过期的回调），回调结果: {'成功' if is_success else '失败'}")
+    elif not is_success:
+        logger.warning(f"记录ID {row[0]} 的IPv6绑定失败，状态更新为: bind_failed, 错误: {message}")
 
-        logger.info(f"更新记录ID {record_id} 的状态 - 原始状态: {ipv6_obj.send_status}, 成功: {is_success}")
+    # 返回响应给API - 使用JSON格式
+    return {
+        'success': True,
+        'message': '回调处理完成',
+        'record_id': str(record_id),
+        'processed_ipv6_suffix': (extract_ipv6_last_64_bits(row[1]) or '') if row[1] else '',
+        'processed_mac': row[2] or '',
+        'result': 'success' if is_success else 'failed'
+    }, True
 
-        if is_success:
-            # API绑定成功
-            ipv6_obj.send_status = 'bound'  # 绑定成功
-            ipv6_obj.retry_count = 0
-            ipv6_obj.next_retry_time = None
-            logger.info(f"记录ID {record_id} 的IPv6绑定成功，状态更新为: bound")
-        else:
-            # API绑定失败，保存错误信息
-            ipv6_obj.send_status = 'bind_failed'  # 绑定失败
-            ipv6_obj.retry_count = 0
-            ipv6_obj.next_retry_time = None
-            # 将错误信息保存到api_response中
-            error_info = {
-                'error_message': message,
-                'callback_data': callback_data
-            }
-            ipv6_obj.api_response = json.dumps(error_info)
-            logger.warning(f"记录ID {record_id} 的IPv6绑定失败，状态更新为: bind_failed, 错误: {message}")
-
-        ipv6_obj.save()
-        logger.info(f"记录ID {record_id} 更新完成，最终状态: {ipv6_obj.send_status}")
-
-        # 提取IPv6后64位用于响应
-        ipv6_last_64 = ''
-        if ipv6_obj.ipv6_address:
-            from app01.utils.ipv6_api import extract_ipv6_last_64_bits
-            ipv6_last_64 = extract_ipv6_last_64_bits(ipv6_obj.ipv6_address) or ''
-
-        # 返回响应给API - 使用JSON格式
-        response_data = {
+
+# 缓冲区已满时的响应，视图返回 503，KEA 稍后重投
+BUFFER_FULL_RESPONSE = {'success': False, 'message': '回调缓冲区已满，请稍后重试', 'buffer_full': True}
+
+
+def _kea_callback_enqueue(callback_data):
+    """
+    合并写回模式：校验回调并放入缓冲区，由后台线程合并写库（见 app01/utils/callback_ingest.py）；
+    缓冲区已满时不入队
+
+    Returns:
+        tuple: (响应数据, 是否处理成功)
+    """
+    if isinstance(callback_data, dict) and not isinstance(callback_data.get('results'), list):
+        item = parse_callback(callback_data)
+        if item is None:
+            logger.warning(f"回调数据缺少record_id或格式错误，原始数据: {callback_data}")
+            return {'success': False, 'message': 'record_id缺失或格式错误', 'received_data': callback_data}, False
+        if not get_callback_buffer().put([item]):
+            return BUFFER_FULL_RESPONSE, False
+        return {
             'success': True,
-            'message': '回调处理完成',
-            'record_id': str(record_id),
-            'processed_ipv6_suffix': ipv6_last_64,
-            'processed_mac': ipv6_obj.mac_address or '',
-            'result': 'success' if is_success else 'failed'
-        }
-        
-        logger.info(f"返回给API的响应: {response_data}")
-        return JsonResponse(response_data)
+            'message': '回调已接收',
+            'record_id': str(item['record_id']),
+            'result': 'success' if item['success'] else 'failed',
+            'queued': True,
+        }, True
+
+    results = callback_data if isinstance(callback_data, list) else callback_data['results']
+    items = [parse_callback(item) for item in results]
+    queued = [item for item in items if item is not None]
+    if not get_callback_buffer().put(queued):
+        return BUFFER_FULL_RESPONSE, False
+    return {
+        'success': True,
+        'message': '批量回调已接收',
+        'total': len(results),
+        'queued': len(queued),
+        'invalid': len(results) - len(queued),
+    }, True
 
-    except Exception as e:
-        logger.error(f"处理KEA回调时出错: {str(e)}", exc_info=True)
 
-        # 尝试提供更详细的错误信息
-        error_details = {
-            'error_type': type(e).__name__,
-            'error_message': str(e),
-            'callback_data_received': True if 'callback_data' in locals() else False,
-            'variables_defined': {
-                'ipv6_suffix': 'ipv6_suffix' in locals(),
-                'mac_address': 'mac_address' in locals(),
-                'is_success': 'is_success' in locals()
-            }
-        }
+@csrf_exempt
+def kea_callback(request):
+    """
+    处理KEA API的回调请求
+    API通过此URL返回IPv6地址配置结果
+
+    支持单条回调（JSON对象）和批量回调（JSON数组，或 {"results": [...]}）
+
+    带请求头 Idempotency-Key 的回调，KEA 重试投递时直接返回第一次的处理结果，不访问数据库。
+    settings.KEA_CALLBACK_DEBUG 为 True 时记录请求头，找不到记录时输出诊断信息。
+    settings.KEA_CALLBACK_INGEST_MODE 为 'buffered' 时只校验并入队，立即返回，由后台线程合并写库。
+    """
+    if request.method != 'POST':
+        logger.warning(f"收到非POST请求到回调URL: {request.method}")
+        return JsonResponse({'success': False, 'message': '只接受POST请求'})
+
+    debug = getattr(settings, 'KEA_CALLBACK_DEBUG', False)
+    if debug:
+        # 记录请求头信息，方便调试
+        logger.info(f"回调请求头: {dict(request.headers)}")
+
+    idempotency_key = _callback_idempotency_key(request)
+    timeout = getattr(settings, 'KEA_CALLBACK_IDEMPOTENCY_TIMEOUT', DEFAULT_CALLBACK_IDEMPOTENCY_TIMEOUT)
+    if idempotency_key and not cache.add(idempotency_key, None, timeout):
+        previous = cache.get(idempotency_key)
+        # 第一次处理还没有结束时 previous 为 None
+        return JsonResponse({**(previous or {'success': True, 'message': '回调正在处理'}), 'duplicate': True})
 
+    processed = False
+    try:
+        # 获取请求数据
+        if request.content_type == 'application/json':
+            callback_data = json.loads(request.body)
+        else:
+            callback_data = request.POST.dict()
+        if debug:
+            logger.info(f"收到KEA API回调: {callback_data}")
+
+        if ingest_mode() == INGEST_BUFFERED:
+            response_data, processed = _kea_callback_enqueue(callback_data)
+        # 批量回调
+        elif isinstance(callback_data, list):
+            response_data, processed = _kea_callback_batch(callback_data), True
+        elif isinstance(callback_data.get('results'), list):
+            response_data, processed = _kea_callback_batch(callback_data['results']), True
+        else:
+            response_data, processed = _kea_callback_single(callback_data, debug)
+        if processed and idempotency_key:
+            cache.set(idempotency_key, response_data, timeout)
+        return JsonResponse(response_data, status=503 if response_data.get('buffer_full') else 200)
+
+    except Exception as e:
+        logger.error(f"处理KEA回调时出错: {str(e)}", exc_info=True)
         return JsonResponse({
             'success': False,
             'message': f'处理回调出错: {str(e)}',
-            'error_details': error_details
+            'error_details': {'error_type': type(e).__name__, 'error_message': str(e)}
         })
+    finally:
+        # 处理失败的回调不记幂等键，KEA重试时重新处理
+        if not processed and idempotency_key:
+            cache.delete(idempotency_key)
 
 
 @csrf_exempt
@@ -8,7 +8,7 @@ from app01.utils.form import UserModelForm, PrettyModelForm, PrettyEditModelForm
 def user_list(request):
     """ 用户管理 """
 
-    queryset = models.UserInfo.objects.all()
+    queryset = models.UserInfo.objects.select_related('depart')
 
     page_object = Pagination(request, queryset, page_size=2)
     context = {
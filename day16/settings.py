@@ -47,6 +47,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'app01.middleware.auth.AuthMiddleware',
+    'app01.middleware.duid.DuidScopeMiddleware',
+    'app01.middleware.query_count.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'day16.urls'
@@ -127,6 +129,78 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# KEA API
+# 所有发往KEA的请求共用一个带连接池的HTTP客户端（app01/utils/kea_client.py）
+
+KEA_API_BASE_URL = 'http://222.204.3.179:3003'
+KEA_API_POOL_SIZE = 10  # 每个主机保持的最大长连接数
+KEA_API_CONNECT_TIMEOUT = 3  # 建立连接超时（秒）
+KEA_API_READ_TIMEOUT = 10  # 读取响应超时（秒）
+KEA_API_BATCH_SIZE = 100  # 批量接口每个请求最多携带的记录数
+
+# KEA API 熔断器（app01/utils/kea_client.py）：最近 WINDOW 次请求中至少 MIN_CALLS 次且失败比例达到 FAILURE_RATE 时熔断，
+# 熔断 OPEN_SECONDS 秒内三个发送函数直接返回失败（进入重试），之后放行 HALF_OPEN_CALLS 个试探请求
+# 网络错误、5xx 和耗时超过 SLOW_CALL_SECONDS 的请求计为失败；状态和熔断次数见 /api/metrics/ 的 kea_breaker
+KEA_BREAKER_WINDOW = 20
+KEA_BREAKER_MIN_CALLS = 5
+KEA_BREAKER_FAILURE_RATE = 0.5
+KEA_BREAKER_SLOW_CALL_SECONDS = 5
+KEA_BREAKER_OPEN_SECONDS = 30
+KEA_BREAKER_HALF_OPEN_CALLS = 1
+
+# KEA发送失败后的自动重试（由 kea_retry_scheduler 命令执行）
+# 第 n 次重试的等待时间为 min(BASE * 2^(n-1), MAX) 的一半再加上随机抖动，超过最大次数后停止自动重试
+KEA_RETRY_BASE_DELAY = 30  # 首次重试等待（秒）
+KEA_RETRY_MAX_DELAY = 3600  # 单次等待上限（秒）
+KEA_RETRY_MAX_ATTEMPTS = 8  # 最多自动重试次数
+
+# 命令行中发送（kea_retry_scheduler、retry_ipv6_send）时 KEA 回调本系统的地址，视图中发送时按请求地址生成
+# 重试时优先使用记录入队时按请求地址保存的回调地址；为空时这两个命令拒绝运行：发往占位地址的回调无法送达，记录会一直停在 pending
+KEA_CALLBACK_URL = ''
+
+# kea_callback：带相同 Idempotency-Key 请求头的回调在幂等键有效期内直接返回上次的结果（没有该请求头的回调不去重）
+KEA_CALLBACK_IDEMPOTENCY_TIMEOUT = 3600  # 幂等键保留时间（秒）
+# 回调签名（app01/utils/callback_auth.py）：配置密钥后，AuthMiddleware 路由表中的机器回调只校验 X-KEA-Signature / X-KEA-Timestamp，不读会话
+# 密钥为空时 /api/kea/callback/、/api/kea/test/ 保持原来的免登录，设备下线和IPv6配置回调仍然要求登录；生产环境应配置与回调方相同的密钥
+KEA_CALLBACK_SECRET = ''
+KEA_CALLBACK_MAX_SKEW = 300  # 允许的时间戳偏差（秒）
+KEA_CALLBACK_DEBUG = False  # 为 True 时记录回调请求头，找不到记录时输出诊断信息（额外查询，只在排查问题时开启）
+# 回调写入方式（app01/utils/callback_ingest.py）：'sync' 每个回调各自写库；'buffered' 校验后入队立即返回，
+# 后台线程每隔 FLUSH_INTERVAL_MS 毫秒或积累 FLUSH_SIZE 条时在一个事务中合并写回
+KEA_CALLBACK_INGEST_MODE = 'sync'
+KEA_CALLBACK_FLUSH_INTERVAL_MS = 200
+KEA_CALLBACK_FLUSH_SIZE = 500
+KEA_CALLBACK_SPOOL_DIR = ''  # 落盘目录，为空时缓冲区只在内存中；遗留的落盘文件用 replay_callback_spool 命令重放
+KEA_CALLBACK_BUFFER_LIMIT = 20000  # 缓冲区最多保存的回调条数，满时回调返回 503
+KEA_CALLBACK_MAX_ATTEMPTS = 3  # 单条回调写回出错的最多次数，超过后转入死信（落盘目录下的 kea-callback-deadletter.jsonl）
+
+# 设备审批批量导入（app01/utils/approval_import.py）：网页上传的文件保存在此目录，由 approval_import_worker 命令导入，
+# 该命令必须能读到这个目录（同一台机器或共享存储）；为空时使用系统临时目录
+APPROVAL_IMPORT_DIR = ''
+
+# 图片验证码池（app01/utils/captcha_pool.py）：后台线程预先生成验证码，/image/code/ 直接取用，0 表示不使用
+CAPTCHA_POOL_SIZE = 200
+
+# 无状态验证码（app01/utils/captcha_token.py）：答案放在 HMAC 签名的 Cookie 令牌中，/image/code/ 和登录校验都不读写会话
+CAPTCHA_STATELESS = False
+CAPTCHA_TOKEN_MAX_AGE = 60  # 令牌有效期（秒）
+CAPTCHA_NONCE_CAPACITY = 100000  # 每个进程记住的已用令牌数，记满时拒绝登录提交；应不小于登录峰值（次/秒）× 令牌有效期
+
+# 查询统计中间件（app01/middleware/query_count.py），仅用于开发/测试
+# 同一形状的SQL在一个请求中重复达到阈值时判定为 N+1 查询；QUERY_INSPECTOR_RAISE 为 True 时直接抛出异常
+QUERY_INSPECTOR_ENABLED = DEBUG
+QUERY_INSPECTOR_REPEAT_THRESHOLD = 5
+QUERY_INSPECTOR_RAISE = False
+
+# 列表页 COUNT 缓存（app01/utils/count_cache.py）
+# 记录保存/删除时通过信号自动失效，过期时间兜底 update()/bulk_create() 等不发信号的批量操作。
+# 未配置 CACHES 时使用进程内缓存，多进程部署时应配置共享缓存（如 Redis/Memcached），失效才能跨进程生效。
+COUNT_CACHE_TIMEOUT = 60
+
+# IPv6地址分配表（app01/utils/address_allocator.py），每个进程在内存中按槽位缓存已分配的地址
+# 各槽位加载后每隔 ADDRESS_ALLOCATOR_CHECK_INTERVAL 秒与数据表重新核对一次，同步其他进程写入的地址
+ADDRESS_ALLOCATOR_CHECK_INTERVAL = 300
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
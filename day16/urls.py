@@ -16,7 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from app01.views import depart, user, pretty, admin, account, device_approval, device, ipv6_config # 导入视图
+from app01.views import depart, user, pretty, admin, account, device_approval, device, ipv6_config, monitor # 导入视图
 
 urlpatterns = [
     # path('admin/', admin.site.urls),
@@ -36,6 +36,7 @@ urlpatterns = [
 
     # IPv6地址绑定管理
     path('pretty/list/', pretty.pretty_list),
+    path('pretty/export/', pretty.pretty_export),  # 流式导出 KEA reservations（JSON/CSV）
     path('pretty/<int:nid>/send/', pretty.send_ipv6_address),
     path('pretty/<int:nid>/delete/', pretty.pretty_delete),
     path('api/kea/callback/', pretty.kea_callback, name='kea_callback'),  # KEA API回调URL
@@ -64,6 +65,9 @@ urlpatterns = [
     # 设备审批管理
     path('device/approval/list/', device_approval.device_approval_list),
     path('device/approval/add/', device_approval.device_approval_add),
+    path('device/approval/import/', device_approval.device_approval_import),
+    path('device/approval/bulk/', device_approval.device_approval_bulk),
+    path('device/approval/import/<int:job_id>/', device_approval.device_approval_import_progress),
     path('device/approval/<int:nid>/edit/', device_approval.device_approval_edit),
     path('device/approval/<int:nid>/delete/', device_approval.device_approval_delete),
     path('device/approval/<int:nid>/approve/', device_approval.device_approval_approve),
@@ -75,4 +79,7 @@ urlpatterns = [
     path('ipv6/config/<int:nid>/edit/', ipv6_config.ipv6_config_edit),
     path('ipv6/config/<int:nid>/send/', ipv6_config.ipv6_config_send),
     path('api/ipv6/config/callback/', ipv6_config.ipv6_config_callback, name='ipv6_config_callback'),
+
+    # 运行指标
+    path('api/metrics/', monitor.metrics, name='metrics'),
 ]
@@ -1,4 +1,5 @@
 @echo off
 cd /d "F:\о\DHCP\PythonWeb-μ\PythonWeb-μ\day18 Django\\day16\"
+rem Ҫ day16/settings.py  KEA_CALLBACK_URLKEA صϵͳĵַܾ
 python manage.py retry_ipv6_send >> ipv6_retry.log 2>&1
 echo %date% %time% - IPv6重试任务完成 >> ipv6_retry.log